@@ -7,8 +7,17 @@ This script reads a JSON configuration file to:
 
 It supports multiple subscriptions and resource groups using Azure SDK for Python.
 
+NSGs are independent resources, so phase 1 creates all of them at once (an NSG shared
+by several subnets is created once). Phase 2 then applies the associations with one
+VNet update per VNet, so subnet writes on the same VNet never race each other. Each NSG
+is journaled as it is created and each subnet as the update of its VNet finishes, so
+output.json lists the NSGs followed by one entry per subnet. The time spent in each
+phase is printed at the end of the run.
+
 Usage:
-    python create_nsgs.py --input_file custom_input.json
+    python create_nsgs.py --input_file custom_input.json [--max_parallel 10] [--use_async]
+        [--plan | --skip_unchanged] [--incremental]
+        [--resume RUN_ID]
 
 Requirements:
     - Azure CLI logged in OR environment credentials configured
@@ -17,11 +26,145 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
+import time
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.network import NetworkManagementClient
+from functools import partial
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config
+from runner import execute_operations
+from deploy_state import DEFAULT_DEPLOY_STATE_FILE, open_deploy_state
+from journal import Journal, SplitJournal
+from checkpoint import DEFAULT_CHECKPOINT_FILE, Checkpoint
+
+def build_security_rules(nsg_rules):
+    """
+    Convert the NSG rules from the input JSON into SDK security rule parameters
+    """
+    rule_list = []
+
+    for rule in nsg_rules:
+        rule_dict = {
+            "name": rule["name"],
+            "description": rule["description"],
+            "direction": rule["direction"],
+            "priority": int(rule["priority"]),
+            "protocol": rule["protocol"],
+            "access": rule["action"]
+        }
+
+        # Normalize address/port prefixes
+        if rule["source_address_prefixes"] == ["*"]:
+            rule_dict["source_address_prefix"] = "*"
+        else:
+            rule_dict["source_address_prefixes"] = rule["source_address_prefixes"]
+
+        if rule["source_port_ranges"] == ["*"]:
+            rule_dict["source_port_range"] = "*"
+        else:
+            rule_dict["source_port_ranges"] = rule["source_port_ranges"]
+
+        if rule["destination_address_prefixes"] == ["*"]:
+            rule_dict["destination_address_prefix"] = "*"
+        else:
+            rule_dict["destination_address_prefixes"] = rule["destination_address_prefixes"]
+
+        if rule["destination_port_ranges"] == ["*"]:
+            rule_dict["destination_port_range"] = "*"
+        else:
+            rule_dict["destination_port_ranges"] = rule["destination_port_ranges"]
+
+        rule_list.append(rule_dict)
+
+    return rule_list
+
+def nsg_entry(rg_name, nsg_result):
+    """
+    Build the output entry for a created or updated NSG
+    """
+    return {
+        "nsg_name": nsg_result.name,
+        "location": nsg_result.location,
+        "resource_group": rg_name,
+        "status": "success"
+    }
+
+def vnet_association_entry(rg_name, associated, vnet_result):
+    """
+    Build the output entry for a VNet whose subnets were associated with their NSGs
+    """
+    return {
+        "vnet_name": vnet_result.name,
+        "resource_group": rg_name,
+        "subnets": associated,
+        "status": "success"
+    }
+
+def subnet_association_entry(record, vnet_result):
+    """
+    Build the output entry for one subnet from the result of its VNet update
+    """
+    fields = record["fields"]
+    if vnet_result["status"] != "success":
+        return {**fields, "status": "failed", "reason": vnet_result["reason"]}
+    if fields["subnet_name"] not in vnet_result["subnets"]:
+        return {
+            **fields,
+            "status": "failed",
+            "reason": f"Subnet not found in VNet: {record['vnet_name']}"
+        }
+    return {**fields, "location": record["location"], "status": "success"}
+
+def split_vnet_result(subnet_slots, index, vnet_result):
+    """
+    Split the result of the VNet update at index into the entries of its subnets
+    """
+    return [
+        (slot, subnet_id, subnet_association_entry(record, vnet_result))
+        for slot, subnet_id, record in subnet_slots[index]
+    ]
+
+def current_nsg_id(subnet):
+    """
+    Return the NSG ID a subnet is associated with, lower-cased, or None
+    """
+    nsg = subnet.network_security_group
+    if nsg is None:
+        return None
+    nsg_id = nsg["id"] if isinstance(nsg, dict) else nsg.id
+    return nsg_id.lower()
+
+def vnet_association(rg_name, nsg_ids, operation, skip_unchanged, vnet):
+    """
+    Build the VNet update that points every listed subnet at its NSG in a single PUT
+    """
+    subnets = [subnet for subnet in vnet.subnets or [] if subnet.name in nsg_ids]
+    associated = [subnet.name for subnet in subnets]
+
+    # Every subnet already points at its NSG, so the VNet PUT is not needed
+    if skip_unchanged and all(
+            current_nsg_id(subnet) == nsg_ids[subnet.name].lower() for subnet in subnets):
+        return {"result": {
+            **vnet_association_entry(rg_name, associated, vnet),
+            "action": "unchanged"
+        }}
+
+    for subnet in subnets:
+        subnet.network_security_group = {"id": nsg_ids[subnet.name]}
+
+    return {
+        "parent": operation["parent"],
+        "client_type": "network",
+        "subscription_id": operation["subscription_id"],
+        "method": "virtual_networks.begin_create_or_update",
+        "args": [rg_name, vnet.name, vnet],
+        "fields": operation["fields"],
+        "success": partial(vnet_association_entry, rg_name, associated)
+    }
 
 def main():
     """
@@ -33,17 +176,53 @@ def main():
         description="Create NSGs and associate them with Azure subnets.")
     parser.add_argument(
         '--input_file', type=str, required=True, help='Path to the input JSON configuration file.')
+    parser.add_argument(
+        '--max_parallel', type=int, default=1,
+        help='Maximum number of NSG operations to run at the same time.')
+    parser.add_argument(
+        '--use_async', action='store_true',
+        help='Run the operations on the asyncio engine with the aio SDK clients.')
+    parser.add_argument(
+        '--plan', action='store_true',
+        help='Compare the input with live state and write the plan without changing anything.')
+    parser.add_argument(
+        '--skip_unchanged', action='store_true',
+        help='Only write the resources that are missing or differ from the input.')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='Only apply the resources whose spec changed since the last run, without reading live state.')
+    parser.add_argument(
+        '--deploy_state', type=str, default=DEFAULT_DEPLOY_STATE_FILE,
+        help='State file with the spec hash and result of each applied resource.')
+    parser.add_argument(
+        '--resume', type=str, default=None,
+        help='Run ID (tail_journal.py --list) to resume: skip what succeeded and reattach to LROs in flight.')
+    parser.add_argument(
+        '--checkpoint_file', type=str, default=DEFAULT_CHECKPOINT_FILE,
+        help='SQLite checkpoint of the state of every operation, for --resume.')
     args = parser.parse_args()
 
-    # Load configuration data
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Spec hashes and results of the last applied run, for --incremental
+    deploy_state = open_deploy_state(args.deploy_state, args.incremental)
 
-    # Output list for results tracking
-    output = []
+    # Results are appended to journal.jsonl as they are known, not only at the end
+    journal = Journal()
 
-    # Initialize Azure credential
-    credential = DefaultAzureCredential()
+    # Operation states of this run, committed as they change, for --resume
+    checkpoint = Checkpoint(args.checkpoint_file, journal.run_id, resume=args.resume)
+
+    # One record per subnet with an NSG; the subnet entries of output.json keep this order
+    subnet_records = []
+
+    # Phase 1 operations: one per NSG, keyed by (resource group, NSG name)
+    nsg_operations = []
+    nsg_indexes = {}
+
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry(pool_size=max(args.max_parallel, 10))
 
     # Iterate through each VNet and its subnets
     for vnet in config["vnets"]:
@@ -56,117 +235,134 @@ def main():
                 rg_name = vnet["resource_group"]
                 location = vnet["location"]
                 subnet_name = subnet["subnet_name"]
-                subnet_prefix = subnet["subnet_prefix"]
                 vnet_name = vnet["vnet_name"]
                 nsg_name = subnet["nsg_name"]
-                rule_list = []
-
-                # Loop over each Resource Group to find the right subscription ID
-                for rg in config["resource_groups"]:
-                    if rg["resource_group"] == rg_name:
-                        subscription_id = rg["subscription_id"]
-                        break
-
-                if not subscription_id:
-                    raise Exception(f"Subscription ID not found for resource group: {rg_name}")
-
-                # Initialize management clients
-                resource_client = ResourceManagementClient(credential, subscription_id)
-                network_client = NetworkManagementClient(credential, subscription_id)
-
-                for rule in subnet["nsg_rules"]:
-                    rule_dict = {
-                        "name": rule["name"],
-                        "description": rule["description"],
-                        "direction": rule["direction"],
-                        "priority": int(rule["priority"]),
-                        "protocol": rule["protocol"],
-                        "access": rule["action"]
-                    }
-
-                    # Normalize address/port prefixes
-                    if rule["source_address_prefixes"] == ["*"]:
-                        rule_dict["source_address_prefix"] = "*"
-                    else:
-                        rule_dict["source_address_prefixes"] = rule["source_address_prefixes"]
-
-                    if rule["source_port_ranges"] == ["*"]:
-                        rule_dict["source_port_range"] = "*"
-                    else:
-                        rule_dict["source_port_ranges"] = rule["source_port_ranges"]
-
-                    if rule["destination_address_prefixes"] == ["*"]:
-                        rule_dict["destination_address_prefix"] = "*"
-                    else:
-                        rule_dict[
-                            "destination_address_prefixes"] = rule["destination_address_prefixes"]
-
-                    if rule["destination_port_ranges"] == ["*"]:
-                        rule_dict["destination_port_range"] = "*"
-                    else:
-                        rule_dict["destination_port_ranges"] = rule["destination_port_ranges"]
-
-                    rule_list.append(rule_dict)
+                fields = {"nsg_name": nsg_name, "subnet_name": subnet_name, "resource_group": rg_name}
+
+                # Look up the subscription ID of the resource group
+                subscription_id = config.subscription(rg_name)
 
                 # Check whether the resource group exists
-                rg_exists = resource_client.resource_groups.check_existence(rg_name)
+                rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
                 if not rg_exists:
-                    result = {
+                    subnet_records.append({"result": {
                         "resource_group": rg_name,
                         "status": "failed",
                         "reason": "Resource group does not exist"
-                    }
-                    output.append(result)
+                    }})
                     continue
 
-                # Create or update the NSG with rules
-                nsg_result = network_client.network_security_groups.begin_create_or_update(
-                    rg_name,
-                    nsg_name,
-                    {
-                        "location": location,
-                        "security_rules": rule_list
-                    }
-                ).result()
-
-                # Associate NSG with the subnet
-                subnet_result = network_client.subnets.begin_create_or_update(
-                    rg_name,
-                    vnet_name,
-                    subnet_name,
-                    {
-                        "address_prefix": subnet_prefix,
-                        "network_security_group": {
-                            "id": f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}" \
-                                f"/providers/Microsoft.Network/networkSecurityGroups/{nsg_name}"}
-                    }
-                ).result()
-
-                result = {
-                    "nsg_name": nsg_result.name,
-                    "subnet_name": subnet_result.name,
-                    "location": nsg_result.location,
-                    "resource_group": rg_name,
-                    "status": "success"
-                }
+                # Queue the NSG once, even when several subnets share it
+                nsg_key = (rg_name, nsg_name)
+                if nsg_key not in nsg_indexes:
+                    nsg_indexes[nsg_key] = len(nsg_operations)
+                    nsg_operations.append({
+                        "client_type": "network",
+                        "subscription_id": subscription_id,
+                        "method": "network_security_groups.begin_create_or_update",
+                        "args": [
+                            rg_name,
+                            nsg_name,
+                            {
+                                "location": location,
+                                "security_rules": build_security_rules(subnet["nsg_rules"])
+                            }
+                        ],
+                        "fields": {"nsg_name": nsg_name, "resource_group": rg_name},
+                        "success": partial(nsg_entry, rg_name)
+                    })
+
+                subnet_records.append({
+                    "fields": fields,
+                    "location": location,
+                    "nsg_key": nsg_key,
+                    "vnet_name": vnet_name,
+                    "subscription_id": subscription_id
+                })
 
             except Exception as e:
                 # Capture error and report failure
-                result = {
+                subnet_records.append({"result": {
                     "nsg_name": nsg_name,
                     "subnet_name": subnet_name,
                     "resource_group": rg_name,
                     "status": "failed",
                     "reason": str(e)
-                }
+                }})
+
+    # Phase 1: create every NSG at the same time, journaling each one as it finishes
+    started = time.perf_counter()
+    nsg_results = execute_operations(
+        nsg_operations, args.max_parallel, clients, args.use_async,
+        plan=args.plan, skip_unchanged=args.skip_unchanged,
+        deploy_state=deploy_state, journal=journal, checkpoint=checkpoint)
+    nsg_seconds = time.perf_counter() - started
+
+    # The plan covers the NSGs; the associations are checked again when applying
+    if args.plan:
+        journal.write_output()
+        return
+
+    # One output slot per subnet after the NSGs; subnets that cannot be associated are
+    # journaled now, the others once the update of their VNet finishes
+    first_slot = journal.reserve(len(subnet_records))
+    associations = {}
+    subnet_slots = {}
+    for offset, record in enumerate(subnet_records):
+        if "result" in record:
+            journal.append(record["result"], first_slot + offset)
+            continue
+
+        fields = record["fields"]
+        subnet_id = config.subnet_id(record["vnet_name"], fields["subnet_name"])
+        nsg_result = nsg_results[nsg_indexes[record["nsg_key"]]]
+        if nsg_result["status"] != "success":
+            journal.append(
+                {**fields, "status": "failed", "reason": nsg_result["reason"]},
+                first_slot + offset, resource_id=subnet_id)
+            continue
+
+        # Group the associations by VNet
+        rg_name, nsg_name = record["nsg_key"]
+        associations.setdefault(record["vnet_name"], {})[fields["subnet_name"]] = \
+            config.resource_id("nsgs", rg_name, nsg_name)
+        subnet_slots.setdefault(record["vnet_name"], []).append(
+            (first_slot + offset, subnet_id, record))
+
+    # Phase 2: one read-modify-write of each VNet carrying all of its associations
+    vnet_operations = []
+    for vnet_name, nsg_ids in associations.items():
+        rg_name = config.vnets[vnet_name]["resource_group"]
+        operation = {
+            "parent": config.vnet_id(vnet_name),
+            "client_type": "network",
+            "subscription_id": config.subscription(rg_name),
+            "method": "virtual_networks.get",
+            "args": [rg_name, vnet_name],
+            "fields": {"vnet_name": vnet_name, "resource_group": rg_name},
+            "spec": nsg_ids
+        }
+        operation["then"] = partial(
+            vnet_association, rg_name, nsg_ids, operation, args.skip_unchanged)
+        vnet_operations.append(operation)
+
+    # Each VNet result is journaled as one entry per subnet the moment the VNet finishes
+    subnet_journal = SplitJournal(
+        journal, partial(split_vnet_result, [subnet_slots[vnet_name] for vnet_name in associations]))
+
+    started = time.perf_counter()
+    execute_operations(
+        vnet_operations, args.max_parallel, clients, args.use_async,
+        deploy_state=deploy_state, journal=subnet_journal, checkpoint=checkpoint)
+    association_seconds = time.perf_counter() - started
 
-            # Add result to the output list
-            output.append(result)
+    # Report the time spent in each phase
+    print(f"Phase 1: created {len(nsg_operations)} NSG(s) in {nsg_seconds:.1f}s")
+    print(f"Phase 2: updated {len(vnet_operations)} VNet(s) in {association_seconds:.1f}s")
 
-    # Write results to JSON file
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
@@ -4,8 +4,19 @@ create_peerings.py
 This script reads a JSON configuration file and creates virtual network (VNet) peerings
 between Azure VNets across resource groups and subscriptions, based on defined settings.
 
+A peering stays Initiated until the peering on the remote VNet exists. With
+--wait_connected, reciprocal pairs (A -> B and B -> A) are detected, both sides of each
+pair are submitted together, and the peering_state of every pair is polled in parallel
+until both sides are Connected. Each peering is journaled when it is created, and its
+entry is then replaced in the same output slot by its peering_state and
+seconds_to_connected when its pair is Connected (or failed when --connect_timeout runs
+out first), so output.json still has one entry per peering.
+
 Usage:
-    python create_peerings.py --input_file custom_input.json
+    python create_peerings.py --input_file custom_input.json [--max_parallel 10] [--use_async]
+        [--plan | --skip_unchanged] [--incremental]
+        [--resume RUN_ID]
+        [--wait_connected] [--connect_timeout 600]
 
 Requirements:
     - Azure CLI logged in OR environment credentials configured
@@ -14,11 +25,159 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
+import time
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.network import NetworkManagementClient
+from functools import partial
+from datetime import datetime, timedelta, timezone
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config
+from runner import execute_operations, run_operations
+from arm_batch import resource_id
+from deploy_state import DEFAULT_DEPLOY_STATE_FILE, open_deploy_state
+from journal import Journal
+from checkpoint import DEFAULT_CHECKPOINT_FILE, Checkpoint
+
+# Seconds between peering_state checks with --wait_connected
+CONNECT_POLL_INTERVAL = 5
+
+def build_peering_parameters(settings, remote_vnet_id):
+    """
+    Convert the peering settings from the input JSON into SDK peering parameters
+    """
+    return {
+        "remote_virtual_network": {"id": remote_vnet_id},
+        "allow_virtual_network_access": settings.get("allow_virtual_network_access", True),
+        "allow_forwarded_traffic": settings.get("allow_forwarded_traffic", False),
+        "allow_gateway_transit": settings.get("allow_gateway_transit", False),
+        "use_remote_gateways": settings.get("use_remote_gateways", False)
+    }
+
+def peering_entry(rg_name, peering_result):
+    """
+    Build the output entry for a created or updated peering
+    """
+    return {
+        "peering_name": peering_result.name,
+        "resource_group": rg_name,
+        "status": "success"
+    }
+
+def connected_entry(rg_name, peering_result):
+    """
+    Build the output entry for a peering including its current peering state
+    """
+    return {
+        **peering_entry(rg_name, peering_result),
+        "peering_state": peering_result.peering_state
+    }
+
+def connection_entry(operation, state, seconds):
+    """
+    Build the output entry for the peering_state a peering reached with --wait_connected
+    """
+    entry = {**operation["fields"], "peering_state": state, "seconds_to_connected": seconds}
+    if seconds is None:
+        return {**entry, "status": "failed", "reason": "Peering not Connected before the timeout"}
+    return {**entry, "status": "success"}
+
+def find_pairs(operations):
+    """
+    Match every peering with the peering on its remote VNet that points back at it
+    """
+    sides = {}
+    for index, operation in enumerate(operations):
+        if "result" not in operation:
+            remote_vnet_id = operation["args"][3]["remote_virtual_network"]["id"]
+            sides[(operation["parent"], remote_vnet_id)] = index
+
+    return [
+        (index, sides[(remote_vnet_id, vnet_id)])
+        for (vnet_id, remote_vnet_id), index in sides.items()
+        if sides.get((remote_vnet_id, vnet_id), -1) > index
+    ]
+
+def prioritize_pairs(operations, pairs):
+    """
+    Give both sides of every pair neighbouring priorities so they are submitted together
+    """
+    partners = {}
+    for first, second in pairs:
+        partners[first], partners[second] = second, first
+
+    order, placed = [], set()
+    for index in range(len(operations)):
+        for side in (index, partners.get(index)):
+            if side is not None and side not in placed:
+                placed.add(side)
+                order.append(side)
+
+    # Higher priorities are submitted first; the output keeps the input order
+    for position, index in enumerate(order):
+        operations[index]["priority"] = len(order) - position
+
+def journal_pair(journal, first_slot, operations, pair, states, seconds, started):
+    """
+    Journal the final peering_state of both sides of a pair in the slots of their creation
+    """
+    started_at = datetime.now(timezone.utc) - timedelta(seconds=time.perf_counter() - started)
+    for side in pair:
+        journal.append(
+            connection_entry(operations[side], states[side], seconds), first_slot + side,
+            started_at=started_at, resource_id=resource_id(operations[side]))
+
+def wait_connected(operations, pairs, results, clients, max_parallel, timeout, started, journal,
+                   first_slot):
+    """
+    Poll both sides of every pair in parallel until they are Connected or time runs out
+    """
+    # Only wait on pairs where both sides were created
+    waiting = [
+        pair for pair in pairs if all(results[side]["status"] == "success" for side in pair)]
+    states = {side: results[side].get("peering_state") for pair in waiting for side in pair}
+    connected = {}
+
+    while True:
+        # Journal every pair the moment both sides are Connected
+        for pair in list(waiting):
+            if all(states[side] == "Connected" for side in pair):
+                connected[pair] = round(time.perf_counter() - started, 1)
+                journal_pair(
+                    journal, first_slot, operations, pair, states, connected[pair], started)
+                waiting.remove(pair)
+
+        if not waiting or time.perf_counter() - started > timeout:
+            break
+        time.sleep(CONNECT_POLL_INTERVAL)
+
+        # Read the state of every side still waiting at the same time
+        sides = [side for pair in waiting for side in pair]
+        checks = run_operations([{
+            "client_type": "network",
+            "subscription_id": operations[side]["subscription_id"],
+            "method": "virtual_network_peerings.get",
+            "args": operations[side]["args"][:3],
+            "fields": operations[side]["fields"],
+            "success": partial(connected_entry, operations[side]["args"][0])
+        } for side in sides], max_parallel, clients)
+
+        for side, check in zip(sides, checks):
+            states[side] = check.get("peering_state", states[side])
+
+    # Journal the pairs that timed out with the state they were left in
+    for pair in waiting:
+        journal_pair(journal, first_slot, operations, pair, states, None, started)
+
+    for pair in pairs:
+        names = " <-> ".join(operations[side]["fields"]["peering_name"] for side in pair)
+        if pair in connected:
+            print(f"{names}: Connected after {connected[pair]}s")
+        else:
+            print(f"{names}: not Connected")
 
 def main():
     """
@@ -30,15 +189,55 @@ def main():
         description="Create VNet peerings from a JSON config file.")
     parser.add_argument(
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--max_parallel', type=int, default=1,
+        help='Maximum number of peering operations to run at the same time.')
+    parser.add_argument(
+        '--use_async', action='store_true',
+        help='Run the operations on the asyncio engine with the aio SDK clients.')
+    parser.add_argument(
+        '--plan', action='store_true',
+        help='Compare the input with live state and write the plan without changing anything.')
+    parser.add_argument(
+        '--skip_unchanged', action='store_true',
+        help='Only write the resources that are missing or differ from the input.')
+    parser.add_argument(
+        '--wait_connected', action='store_true',
+        help='Create reciprocal peerings together and wait until both sides are Connected.')
+    parser.add_argument(
+        '--connect_timeout', type=int, default=600,
+        help='Seconds to wait for reciprocal peerings to reach Connected.')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='Only apply the resources whose spec changed since the last run, without reading live state.')
+    parser.add_argument(
+        '--deploy_state', type=str, default=DEFAULT_DEPLOY_STATE_FILE,
+        help='State file with the spec hash and result of each applied resource.')
+    parser.add_argument(
+        '--resume', type=str, default=None,
+        help='Run ID (tail_journal.py --list) to resume: skip what succeeded and reattach to LROs in flight.')
+    parser.add_argument(
+        '--checkpoint_file', type=str, default=DEFAULT_CHECKPOINT_FILE,
+        help='SQLite checkpoint of the state of every operation, for --resume.')
     args = parser.parse_args()
 
-    # Load configuration from input file
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Spec hashes and results of the last applied run, for --incremental
+    deploy_state = open_deploy_state(args.deploy_state, args.incremental)
 
-    # Initialize Azure credentials
-    credential = DefaultAzureCredential()
-    output = []
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
+
+    # Operation states of this run, committed as they change, for --resume
+    checkpoint = Checkpoint(args.checkpoint_file, journal.run_id, resume=args.resume)
+
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry(pool_size=max(args.max_parallel, 10))
+
+    # Operation list; results keep the same order as the peerings in the input
+    operations = []
 
     # Loop through VNets to configure peering
     for vnet in config['vnets']:
@@ -46,33 +245,33 @@ def main():
             rg_name = vnet["resource_group"]
             vnet_name = vnet["vnet_name"]
 
-            # Loop over each Resource Group to find the right subscription ID
-            for rg in config["resource_groups"]:
-                if rg["resource_group"] == rg_name:
-                    subscription_id = rg["subscription_id"]
-                    break
-
-            if not subscription_id:
-                raise Exception(f"Subscription ID not found for resource group: {rg_name}")
-
-            # Initialize clients for the subscription
-            resource_client = ResourceManagementClient(credential, subscription_id)
-            network_client = NetworkManagementClient(credential, subscription_id)
+            # Look up the subscription ID of the resource group
+            subscription_id = config.subscription(rg_name)
 
             # Check whether the resource group exists
-            rg_exists = resource_client.resource_groups.check_existence(rg_name)
+            rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
             if not rg_exists:
-                result = {
+                operations.append({"result": {
                     "resource_group": rg_name,
                     "status": "failed",
                     "reason": "Resource group does not exist"
-                }
-                output.append(result)
+                }})
                 continue
 
-            # Iterate over defined peerings for the current VNet
-            for peering in vnet['peerings']:
+        except Exception as e:
+            # Capture error and report failure
+            operations.append({"result": {
+                "vnet_name": vnet_name,
+                "resource_group": rg_name,
+                "status": "failed",
+                "reason": str(e)
+            }})
+            continue
+
+        # Iterate over defined peerings for the current VNet
+        for peering in vnet.get('peerings', []):
+            try:
                 peering_name = peering["peering_name"]
                 settings = peering.get("peering_settings", {})
                 remote_vnet_name = settings.get("remote_virtual_network")
@@ -81,64 +280,57 @@ def main():
                     raise Exception(
                         f"No 'remote_virtual_network' specified in peering: {peering_name}")
 
-                # Find remote VNet and resource group
-                for vnet in config['vnets']:
-                    if vnet['vnet_name'] == remote_vnet_name:
-                        remote_rg_name = vnet["resource_group"]
-                        break
-
-                if not remote_rg_name:
-                    raise Exception(f"Remote Resource group does not exist")
-
-                for rg in config["resource_groups"]:
-                    if rg["resource_group"] == remote_rg_name:
-                        remote_sub_id = rg["subscription_id"]
-
-                if not remote_sub_id:
-                    raise Exception(f"Remote Subscription ID does not exist")
-
-                # Construct peering parameters
-                peering_parameters = {
-                    "remote_virtual_network": {
-                        "id": f"/subscriptions/{remote_sub_id}/resourceGroups/{remote_rg_name}" \
-                            f"/providers/Microsoft.Network/virtualNetworks/{remote_vnet_name}"
-                    },
-                    "allow_virtual_network_access": settings.get(
-                        "allow_virtual_network_access", True),
-                    "allow_forwarded_traffic": settings.get("allow_forwarded_traffic", False),
-                    "allow_gateway_transit": settings.get("allow_gateway_transit", False),
-                    "use_remote_gateways": settings.get("use_remote_gateways", False)
-                }
-
-                # Create or update the peering
-                peering_result = network_client.virtual_network_peerings.begin_create_or_update(
-                    rg_name,
-                    vnet_name,
-                    peering_name,
-                    peering_parameters
-                ).result()
-
-                result = {
-                        "peering_name": peering_result.name,
-                        "resource_group": rg_name,
-                        "status": "success"
-                    }
+                # Resolve the remote VNet ID from the indexed input file
+                remote_vnet_id = config.vnet_id(remote_vnet_name)
+                peering_parameters = build_peering_parameters(settings, remote_vnet_id)
 
-        except Exception as e:
-            # Capture error and report failure
-            result = {
-                "peering_name": peering_name,
-                "resource_group": rg_name,
-                "status": "failed",
-                "reason": str(e)
-            }
+                # Queue the create or update of the peering; writes to one VNet run in turn
+                operations.append({
+                    "parent": config.vnet_id(vnet_name),
+                    "client_type": "network",
+                    "subscription_id": subscription_id,
+                    "method": "virtual_network_peerings.begin_create_or_update",
+                    "args": [rg_name, vnet_name, peering_name, peering_parameters],
+                    "fields": {"peering_name": peering_name, "resource_group": rg_name},
+                    "success": partial(
+                        connected_entry if args.wait_connected else peering_entry, rg_name)
+                })
+
+            except Exception as e:
+                # Capture error and report failure
+                operations.append({"result": {
+                    "peering_name": peering_name,
+                    "resource_group": rg_name,
+                    "status": "failed",
+                    "reason": str(e)
+                }})
+
+    if args.wait_connected and not args.plan:
+        # Submit both sides of each reciprocal pair together, journaling each as it is created
+        # in the next free slots, one per operation in input order
+        started = time.perf_counter()
+        pairs = find_pairs(operations)
+        prioritize_pairs(operations, pairs)
+        first_slot = journal.slots
+        results = execute_operations(
+            operations, max(args.max_parallel, 2), clients, args.use_async,
+            skip_unchanged=args.skip_unchanged, deploy_state=deploy_state, journal=journal,
+            checkpoint=checkpoint)
 
-        # Write results to output file
-        output.append(result)
+        # Poll every pair until both sides are Connected, journaling the state each reached
+        wait_connected(
+            operations, pairs, results, clients, max(args.max_parallel, 2),
+            args.connect_timeout, started, journal, first_slot)
+    else:
+        # Submit the peering operations and collect the pollers as they finish
+        execute_operations(
+            operations, args.max_parallel, clients, args.use_async,
+            plan=args.plan, skip_unchanged=args.skip_unchanged,
+            deploy_state=deploy_state, journal=journal,
+            checkpoint=checkpoint)
 
-    # Write results to JSON file
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
@@ -5,19 +5,58 @@ This script reads a JSON configuration file that defines Azure resource groups,
 then creates or updates each resource group using the Azure SDK for Python.
 
 Usage:
-    python create_rg.py --input_file custom_input.json
+    python create_rg.py --input_file custom_input.json [--max_parallel 10] [--use_async]
+        [--plan | --skip_unchanged] [--incremental]
+        [--resume RUN_ID]
 
 Requirements:
     - Azure CLI logged in OR environment credentials set up
-    - 'azure-identity' and 'azure-mgmt-resource' libraries installed
+    - 'azure-identity', 'azure-mgmt-resource', 'azure-mgmt-network' and 'azure-mgmt-privatedns'
+      libraries installed (clients.py loads all three management clients)
     - A valid JSON configuration file with the required structure
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
+from functools import partial
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry, DELETING_STATE
+from config_model import load_config
+from runner import execute_operations
+from deploy_state import DEFAULT_DEPLOY_STATE_FILE, open_deploy_state
+from journal import Journal
+from checkpoint import DEFAULT_CHECKPOINT_FILE, Checkpoint
+
+def rg_entry(rg_result):
+    """
+    Build the output entry for a created or updated resource group
+    """
+    return {
+        "resource_group": rg_result.name,
+        "location": rg_result.location,
+        "status": "success"
+    }
+
+def record_rg(clients, subscription_id, rg_result):
+    """
+    Add a created resource group to the shared existence cache and build its output entry
+    """
+    clients.record_resource_group(subscription_id, rg_result.name)
+    return rg_entry(rg_result)
+
+def deleting_entry(rg_name):
+    """
+    Build the failure for a resource group whose delete has not finished yet
+    """
+    return {
+        "resource_group": rg_name,
+        "status": "failed",
+        "reason": "Resource group is still being deleted; rerun once the delete has finished"
+    }
 
 def main():
     """
@@ -29,17 +68,49 @@ def main():
         description="Create Azure Resource Groups from a JSON config file.")
     parser.add_argument(
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--max_parallel', type=int, default=1,
+        help='Maximum number of resource group operations to run at the same time.')
+    parser.add_argument(
+        '--use_async', action='store_true',
+        help='Run the operations on the asyncio engine with the aio SDK clients.')
+    parser.add_argument(
+        '--plan', action='store_true',
+        help='Compare the input with live state and write the plan without changing anything.')
+    parser.add_argument(
+        '--skip_unchanged', action='store_true',
+        help='Only write the resources that are missing or differ from the input.')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='Only apply the resources whose spec changed since the last run, without reading live state.')
+    parser.add_argument(
+        '--deploy_state', type=str, default=DEFAULT_DEPLOY_STATE_FILE,
+        help='State file with the spec hash and result of each applied resource.')
+    parser.add_argument(
+        '--resume', type=str, default=None,
+        help='Run ID (tail_journal.py --list) to resume: skip what succeeded and reattach to LROs in flight.')
+    parser.add_argument(
+        '--checkpoint_file', type=str, default=DEFAULT_CHECKPOINT_FILE,
+        help='SQLite checkpoint of the state of every operation, for --resume.')
     args = parser.parse_args()
 
-    # Load the JSON configuration from the specified file
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Spec hashes and results of the last applied run, for --incremental
+    deploy_state = open_deploy_state(args.deploy_state, args.incremental)
 
-    # Output list to store result of each resource group operation
-    output = []
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
 
-    # Initialize credential using DefaultAzureCredential (supports CLI, env, etc.)
-    credential = DefaultAzureCredential()
+    # Operation states of this run, committed as they change, for --resume
+    checkpoint = Checkpoint(args.checkpoint_file, journal.run_id, resume=args.resume)
+
+    # Operation list; results keep the same order as the resource groups in the input
+    operations = []
+
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry(pool_size=max(args.max_parallel, 10))
 
     # Iterate over each resource group defined in the input JSON
     for rg in config["resource_groups"]:
@@ -47,33 +118,39 @@ def main():
         rg_name = rg["resource_group"]
         location = rg["location"]
 
-        # Create a Resource Management client for the current subscription
-        resource_client = ResourceManagementClient(credential, subscription_id)
-
         try:
-            # Attempt to create or update the resource group
-            rg_result = resource_client.resource_groups.create_or_update(
-                rg_name, { "location": location })
-
-            result = {
-                    "resource_group": rg_result.name,
-                    "location": rg_result.location,
-                    "status": "success"
-                }
+            # Do not race a delete_rg.py run that has not finished
+            if clients.resource_group_state(subscription_id, rg_name) == DELETING_STATE:
+                operations.append({"result": deleting_entry(rg_name)})
+                continue
         except Exception as e:
-            # Catch and store any errors that occur during creation
-            result = {
+            # A subscription whose groups cannot be listed only fails its own groups
+            operations.append({"result": {
                 "resource_group": rg_name,
                 "status": "failed",
                 "reason": str(e)
-                }
-
-        # Append result to output list
-        output.append(result)
-
-    # Write the output to a file for logging and tracking
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+            }})
+            continue
+
+        # Queue the create or update of the resource group
+        operations.append({
+            "client_type": "resource",
+            "subscription_id": subscription_id,
+            "method": "resource_groups.create_or_update",
+            "args": [rg_name, {"location": location}],
+            "fields": {"resource_group": rg_name},
+            "success": partial(record_rg, clients, subscription_id)
+        })
+
+    # Run the resource group operations
+    execute_operations(
+        operations, args.max_parallel, clients, args.use_async,
+        plan=args.plan, skip_unchanged=args.skip_unchanged,
+        deploy_state=deploy_state, journal=journal,
+        checkpoint=checkpoint)
+
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
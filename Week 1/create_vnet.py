@@ -4,8 +4,16 @@ create_vnet.py
 This script reads a JSON configuration file that defines Azure Virtual Networks (VNets)
 and deploys them to specified resource groups across multiple subscriptions.
 
+With --include_subnets each VNet is sent together with its full subnets array (and the
+NSG and route table references that already exist) in a single PUT, so a VNet with 20
+subnets is one long-running operation instead of 21. The VNet then holds exactly the
+subnets in the input file; subnets missing from the file are removed.
+
 Usage:
-    python create_vnet.py --input_file custom_input.json
+    python create_vnet.py --input_file custom_input.json [--max_parallel 10] [--use_async]
+        [--plan | --skip_unchanged] [--incremental]
+        [--resume RUN_ID]
+        [--include_subnets]
 
 Requirements:
     - Azure CLI logged in OR environment credentials configured
@@ -14,11 +22,71 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.network import NetworkManagementClient
+from functools import partial
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config
+from runner import execute_operations
+from deploy_state import DEFAULT_DEPLOY_STATE_FILE, open_deploy_state
+from journal import Journal
+from checkpoint import DEFAULT_CHECKPOINT_FILE, Checkpoint
+
+def vnet_entry(rg_name, vnet_result):
+    """
+    Build the output entry for a created or updated VNet
+    """
+    return {
+        "vnet_name": vnet_result.name,
+        "resource_group": rg_name,
+        "address_space": vnet_result.address_space.address_prefixes,
+        "location": vnet_result.location,
+        "status": "success"
+    }
+
+def vnet_subnets_entry(rg_name, vnet_result):
+    """
+    Build the output entry for a VNet deployed together with its subnets
+    """
+    return {
+        **vnet_entry(rg_name, vnet_result),
+        "subnets": [subnet.name for subnet in vnet_result.subnets or []]
+    }
+
+def existing_references(network_client, rg_name):
+    """
+    List the NSGs and route tables that already exist in a resource group
+    """
+    return {
+        "nsgs": {nsg.name.lower() for nsg in network_client.network_security_groups.list(rg_name)},
+        "route_tables": {rt.name.lower() for rt in network_client.route_tables.list(rg_name)}
+    }
+
+def build_subnets(config, vnet, existing):
+    """
+    Build the subnets array of a VNet PUT, referencing NSGs and route tables that exist
+    """
+    rg_name = vnet["resource_group"]
+    subnets = []
+
+    for subnet in vnet["subnets"]:
+        subnet_params = {"name": subnet["subnet_name"], "address_prefix": subnet["subnet_prefix"]}
+
+        # Only reference resources that are already deployed, or the whole PUT fails
+        for section, field, attribute in (
+                ("nsgs", "nsg_name", "network_security_group"),
+                ("route_tables", "route_table_name", "route_table")):
+            name = subnet.get(field)
+            if name and name.lower() in existing[section]:
+                subnet_params[attribute] = {"id": config.resource_id(section, rg_name, name)}
+
+        subnets.append(subnet_params)
+
+    return subnets
 
 def main():
     """
@@ -30,17 +98,55 @@ def main():
         description="Create Azure VNets from a JSON config file.")
     parser.add_argument(
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--max_parallel', type=int, default=1,
+        help='Maximum number of VNet operations to run at the same time.')
+    parser.add_argument(
+        '--use_async', action='store_true',
+        help='Run the operations on the asyncio engine with the aio SDK clients.')
+    parser.add_argument(
+        '--plan', action='store_true',
+        help='Compare the input with live state and write the plan without changing anything.')
+    parser.add_argument(
+        '--skip_unchanged', action='store_true',
+        help='Only write the resources that are missing or differ from the input.')
+    parser.add_argument(
+        '--include_subnets', action='store_true',
+        help='Deploy each VNet with its subnets in one PUT instead of running create_subnet.py.')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='Only apply the resources whose spec changed since the last run, without reading live state.')
+    parser.add_argument(
+        '--deploy_state', type=str, default=DEFAULT_DEPLOY_STATE_FILE,
+        help='State file with the spec hash and result of each applied resource.')
+    parser.add_argument(
+        '--resume', type=str, default=None,
+        help='Run ID (tail_journal.py --list) to resume: skip what succeeded and reattach to LROs in flight.')
+    parser.add_argument(
+        '--checkpoint_file', type=str, default=DEFAULT_CHECKPOINT_FILE,
+        help='SQLite checkpoint of the state of every operation, for --resume.')
     args = parser.parse_args()
 
-    # Load the input configuration JSON
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Spec hashes and results of the last applied run, for --incremental
+    deploy_state = open_deploy_state(args.deploy_state, args.incremental)
 
-    # Prepare output list to capture status for each VNet
-    output = []
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
 
-    # Initialize credential object
-    credential = DefaultAzureCredential()
+    # Operation states of this run, committed as they change, for --resume
+    checkpoint = Checkpoint(args.checkpoint_file, journal.run_id, resume=args.resume)
+
+    # Prepare operation list; results keep the same order as the VNets in the input
+    operations = []
+
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry(pool_size=max(args.max_parallel, 10))
+
+    # Existing NSGs and route tables, listed once per resource group for --include_subnets
+    existing = {}
 
     # Loop over each VNet configuration
     for vnet in config["vnets"]:
@@ -50,62 +156,61 @@ def main():
             address_space = vnet["address_space"]
             location = vnet["location"]
 
-            # Loop over each Resource Group to find the right subscription ID
-            for rg in config["resource_groups"]:
-                if rg["resource_group"] == rg_name:
-                    subscription_id = rg["subscription_id"]
-                    break
-
-            if not subscription_id:
-                raise Exception(f"Subscription ID not found for resource group: {rg_name}")
-
-            # Initialize clients for the current subscription
-            resource_client = ResourceManagementClient(credential, subscription_id)
-            network_client = NetworkManagementClient(credential, subscription_id)
+            # Look up the subscription ID of the resource group
+            subscription_id = config.subscription(rg_name)
 
             # Check if RG exists
-            rg_exists = resource_client.resource_groups.check_existence(rg_name)
+            rg_exists = clients.resource_group_exists(subscription_id, rg_name)
             if not rg_exists:
-                result = {
+                operations.append({"result": {
                     "resource_group": rg_name,
                     "status": "failed",
                     "reason": "Resource group does not exist"
-                }
-                output.append(result)
+                }})
                 continue
 
-            # Create or update the virtual network
-            vnet_result = network_client.virtual_networks.begin_create_or_update(
-                rg_name, 
-                vnet_name, 
-                {
-                    "location": location,
-                    "address_space": {"address_prefixes": [address_space]}
-                }).result()
-
-            result = {
-                    "vnet_name": vnet_result.name,
-                    "resource_group": rg_name,
-                    "address_space": vnet_result.address_space.address_prefixes,
-                    "location": vnet_result.location,
-                    "status": "success"
-                }
+            vnet_params = {
+                "location": location,
+                "address_space": {"address_prefixes": [address_space]}
+            }
+            success = partial(vnet_entry, rg_name)
+
+            # Fold the subnets into the VNet PUT
+            if args.include_subnets:
+                if rg_name not in existing:
+                    existing[rg_name] = existing_references(
+                        clients.get("network", subscription_id), rg_name)
+                vnet_params["subnets"] = build_subnets(config, vnet, existing[rg_name])
+                success = partial(vnet_subnets_entry, rg_name)
+
+            # Queue the create or update of the virtual network
+            operations.append({
+                "client_type": "network",
+                "subscription_id": subscription_id,
+                "method": "virtual_networks.begin_create_or_update",
+                "args": [rg_name, vnet_name, vnet_params],
+                "fields": {"vnet_name": vnet_name, "resource_group": rg_name},
+                "success": success
+            })
 
         except Exception as e:
             # Capture any exception as a failed operation
-            result = {
+            operations.append({"result": {
                 "vnet_name": vnet_name,
                 "resource_group": rg_name,
                 "status": "failed",
                 "reason": str(e)
-            }
+            }})
 
-        # Append result to output
-        output.append(result)
+    # Submit the VNet operations and collect the pollers as they finish
+    execute_operations(
+        operations, args.max_parallel, clients, args.use_async,
+        plan=args.plan, skip_unchanged=args.skip_unchanged,
+        deploy_state=deploy_state, journal=journal,
+        checkpoint=checkpoint)
 
-    # Write results to JSON file
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,349 @@
+"""
+deploy_all.py
+
+This script reads a JSON configuration file and deploys everything covered by the Week 1
+scripts in one process: resource groups, VNets, subnets, NSGs and their subnet
+associations, VNet peerings, private DNS zones and their VNet links.
+
+Instead of running each script as a full stage, every resource becomes one operation in a
+dependency graph and starts as soon as the resources it needs are done:
+
+    RG -> VNet -> subnet -> NSG association <- NSG <- RG
+    VNet pair -> peering
+    RG -> private DNS zone, zone + VNet -> VNet link
+
+Writes to the same VNet (subnets, NSG associations, peerings) or the same DNS zone (VNet
+links) are run one at a time, since Azure rejects concurrent changes to one parent.
+
+Operations start longest chain first, by the durations of past runs (durations.py); each
+run adds its durations to --durations_file, and --estimate predicts the wall time of the
+graph from them before anything runs.
+
+Usage:
+    python deploy_all.py --input_file custom_input.json [--max_parallel 20] [--use_async]
+        [--plan | --skip_unchanged | --estimate] [--incremental]
+        [--resume RUN_ID]
+        [--durations_file durations.json]
+        [--batch_endpoint [https://management.azure.com]]
+
+Requirements:
+    - Azure CLI logged in OR environment credentials configured
+    - 'azure-identity', 'azure-mgmt-resource', 'azure-mgmt-network', and 'azure-mgmt-privatedns' installed
+    - A valid JSON configuration file with the required structure
+"""
+
+# Import the needed credential and management objects from the libraries.
+import os
+import sys
+import argparse
+from functools import partial
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry, DELETING_STATE
+from config_model import load_config, network_id
+from runner import execute_operations
+from deploy_state import DEFAULT_DEPLOY_STATE_FILE, open_deploy_state
+from journal import Journal
+from checkpoint import DEFAULT_CHECKPOINT_FILE, Checkpoint
+from durations import DEFAULT_DURATIONS_FILE, DurationHistory, report_estimate
+from arm_batch import DEFAULT_ENDPOINT
+from create_rg import record_rg, deleting_entry
+from create_vnet import vnet_entry
+from create_subnet import subnet_entry
+from create_nsg import build_security_rules, nsg_entry
+from create_peering import build_peering_parameters, peering_entry
+from create_private_dns_zone import zone_entry
+from link_dns_zone_to_vnet import link_entry
+
+def association_entry(rg_name, nsg_name, subnet_result):
+    """
+    Build the output entry for an NSG associated with a subnet
+    """
+    return {
+        "nsg_name": nsg_name,
+        "subnet_name": subnet_result.name,
+        "resource_group": rg_name,
+        "status": "success"
+    }
+
+def build_graph(config, clients):
+    """
+    Build the operation graph for every resource in the checked input config
+    """
+    operations = []
+
+    # Resource groups have no dependencies
+    for rg in config["resource_groups"]:
+        rg_name = rg["resource_group"]
+
+        # Everything in a group that is still being deleted fails as a failed dependency
+        if clients.resource_group_state(rg["subscription_id"], rg_name) == DELETING_STATE:
+            operations.append({"key": f"rg:{rg_name}", "result": deleting_entry(rg_name)})
+            continue
+
+        operations.append({
+            "key": f"rg:{rg_name}",
+            "client_type": "resource",
+            "subscription_id": rg["subscription_id"],
+            "method": "resource_groups.create_or_update",
+            "args": [rg_name, {"location": rg["location"]}],
+            "fields": {"resource_group": rg_name},
+            "success": partial(record_rg, clients, rg["subscription_id"])
+        })
+
+    # VNets, their subnets, NSGs and NSG associations
+    nsg_keys = set()
+    for vnet in config["vnets"]:
+        rg_name = vnet["resource_group"]
+        vnet_name = vnet["vnet_name"]
+        vnet_key = f"vnet:{vnet_name}"
+        subscription_id = config.subscription(rg_name)
+        vnet_id = config.vnet_id(vnet_name)
+
+        operations.append({
+            "key": vnet_key,
+            "depends_on": [f"rg:{rg_name}"],
+            "client_type": "network",
+            "subscription_id": subscription_id,
+            "method": "virtual_networks.begin_create_or_update",
+            "args": [
+                rg_name,
+                vnet_name,
+                {
+                    "location": vnet["location"],
+                    "address_space": {"address_prefixes": [vnet["address_space"]]}
+                }
+            ],
+            "fields": {"vnet_name": vnet_name, "resource_group": rg_name},
+            "success": partial(vnet_entry, rg_name)
+        })
+
+        for subnet in vnet["subnets"]:
+            subnet_name = subnet["subnet_name"]
+            subnet_key = f"subnet:{vnet_name}/{subnet_name}"
+
+            operations.append({
+                "key": subnet_key,
+                "depends_on": [vnet_key],
+                "parent": vnet_id,
+                "client_type": "network",
+                "subscription_id": subscription_id,
+                "method": "subnets.begin_create_or_update",
+                "args": [
+                    rg_name, vnet_name, subnet_name, {"address_prefix": subnet["subnet_prefix"]}],
+                "fields": {
+                    "vnet_name": vnet_name,
+                    "subnet_name": subnet_name,
+                    "resource_group": rg_name
+                },
+                "success": partial(subnet_entry, rg_name, vnet_name)
+            })
+
+            # Skip subnets that do not define NSG configuration
+            if "nsg_name" not in subnet or "nsg_rules" not in subnet:
+                continue
+
+            nsg_name = subnet["nsg_name"]
+            nsg_key = f"nsg:{rg_name}/{nsg_name}"
+
+            # An NSG shared by several subnets is only created once
+            if nsg_key not in nsg_keys:
+                nsg_keys.add(nsg_key)
+                operations.append({
+                    "key": nsg_key,
+                    "depends_on": [f"rg:{rg_name}"],
+                    "client_type": "network",
+                    "subscription_id": subscription_id,
+                    "method": "network_security_groups.begin_create_or_update",
+                    "args": [
+                        rg_name,
+                        nsg_name,
+                        {
+                            "location": vnet["location"],
+                            "security_rules": build_security_rules(subnet["nsg_rules"])
+                        }
+                    ],
+                    "fields": {"nsg_name": nsg_name, "resource_group": rg_name},
+                    "success": partial(nsg_entry, rg_name)
+                })
+
+            operations.append({
+                "key": f"nsg-association:{vnet_name}/{subnet_name}",
+                "depends_on": [subnet_key, nsg_key],
+                "parent": vnet_id,
+                "client_type": "network",
+                "subscription_id": subscription_id,
+                "method": "subnets.begin_create_or_update",
+                "args": [
+                    rg_name,
+                    vnet_name,
+                    subnet_name,
+                    {
+                        "address_prefix": subnet["subnet_prefix"],
+                        "network_security_group": {
+                            "id": config.resource_id("nsgs", rg_name, nsg_name)}
+                    }
+                ],
+                "fields": {
+                    "nsg_name": nsg_name,
+                    "subnet_name": subnet_name,
+                    "resource_group": rg_name
+                },
+                "success": partial(association_entry, rg_name, nsg_name)
+            })
+
+    # Peerings wait for both VNets
+    for vnet in config["vnets"]:
+        rg_name = vnet["resource_group"]
+        vnet_name = vnet["vnet_name"]
+
+        for peering in vnet.get("peerings", []):
+            peering_name = peering["peering_name"]
+            settings = peering.get("peering_settings", {})
+            remote_vnet_name = settings.get("remote_virtual_network")
+
+            operations.append({
+                "key": f"peering:{vnet_name}/{peering_name}",
+                "depends_on": [f"vnet:{vnet_name}", f"vnet:{remote_vnet_name}"],
+                "parent": config.vnet_id(vnet_name),
+                "client_type": "network",
+                "subscription_id": config.subscription(rg_name),
+                "method": "virtual_network_peerings.begin_create_or_update",
+                "args": [
+                    rg_name,
+                    vnet_name,
+                    peering_name,
+                    build_peering_parameters(settings, config.vnet_id(remote_vnet_name))
+                ],
+                "fields": {"peering_name": peering_name, "resource_group": rg_name},
+                "success": partial(peering_entry, rg_name)
+            })
+
+    # Private DNS zones and their VNet links
+    for zone in config.get("private_dns_zones", []):
+        rg_name = zone["resource_group"]
+        zone_name = zone["private_zone_name"]
+        zone_key = f"zone:{zone_name}"
+
+        operations.append({
+            "key": zone_key,
+            "depends_on": [f"rg:{rg_name}"],
+            "client_type": "privatedns",
+            "subscription_id": config.subscription(rg_name),
+            "method": "private_zones.begin_create_or_update",
+            "args": [rg_name, zone_name, {"location": "global"}],
+            "fields": {"private_dns_zone_name": zone_name, "resource_group": rg_name},
+            "success": partial(zone_entry, rg_name)
+        })
+
+        for link in zone["virtual_network_links"]:
+            link_name = link["link_name"]
+            vnet_name = link["vnet_name"]
+
+            operations.append({
+                "key": f"link:{zone_name}/{link_name}",
+                "depends_on": [zone_key, f"vnet:{vnet_name}"],
+                "parent": network_id(
+                    config.subscription(rg_name), rg_name, "privateDnsZones", zone_name),
+                "client_type": "privatedns",
+                "subscription_id": config.subscription(rg_name),
+                "method": "virtual_network_links.begin_create_or_update",
+                "args": [
+                    rg_name,
+                    zone_name,
+                    link_name,
+                    {
+                        "location": "global",
+                        "virtual_network": {"id": config.vnet_id(vnet_name)},
+                        "registration_enabled": link["registration_enabled"]
+                    }
+                ],
+                "fields": {"virtual_network_link_name": link_name, "resource_group": rg_name},
+                "success": partial(link_entry, rg_name)
+            })
+
+    return operations
+
+def main():
+    """
+    Main Loop
+    """
+
+    # Set up argument parser for dynamic input file
+    parser = argparse.ArgumentParser(
+        description="Deploy every Week 1 resource from a JSON config file in one run.")
+    parser.add_argument(
+        '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--max_parallel', type=int, default=20,
+        help='Maximum number of operations to run at the same time.')
+    parser.add_argument(
+        '--use_async', action='store_true',
+        help='Run the operations on the asyncio engine with the aio SDK clients.')
+    parser.add_argument(
+        '--plan', action='store_true',
+        help='Compare the input with live state and write the plan without changing anything.')
+    parser.add_argument(
+        '--skip_unchanged', action='store_true',
+        help='Only write the resources that are missing or differ from the input.')
+    parser.add_argument(
+        '--batch_endpoint', type=str, nargs='?', const=DEFAULT_ENDPOINT, default=None,
+        help='Send independent reads through ARM /batch (optionally at this endpoint, e.g. arm_stub_server.py).')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='Only apply the resources whose spec changed since the last run, without reading live state.')
+    parser.add_argument(
+        '--deploy_state', type=str, default=DEFAULT_DEPLOY_STATE_FILE,
+        help='State file with the spec hash and result of each applied resource.')
+    parser.add_argument(
+        '--estimate', action='store_true',
+        help='Predict the wall time of the run from past durations and write the schedule without changing anything.')
+    parser.add_argument(
+        '--durations_file', type=str, default=DEFAULT_DURATIONS_FILE,
+        help='History of operation durations used to start the critical path first.')
+    parser.add_argument(
+        '--resume', type=str, default=None,
+        help='Run ID (tail_journal.py --list) to resume: skip what succeeded and reattach to LROs in flight.')
+    parser.add_argument(
+        '--checkpoint_file', type=str, default=DEFAULT_CHECKPOINT_FILE,
+        help='SQLite checkpoint of the state of every operation, for --resume.')
+    args = parser.parse_args()
+
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Spec hashes and results of the last applied run, for --incremental
+    deploy_state = open_deploy_state(args.deploy_state, args.incremental)
+
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
+
+    # Operation states of this run, committed as they change, for --resume
+    checkpoint = Checkpoint(args.checkpoint_file, journal.run_id, resume=args.resume)
+
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry(
+        pool_size=max(args.max_parallel, 10), batch_endpoint=args.batch_endpoint)
+
+    # Durations of past runs, to start the longest chains first and to estimate the run
+    durations = DurationHistory(args.durations_file)
+    operations = build_graph(config, clients)
+
+    if args.estimate:
+        total, entries = durations.estimate(operations, args.max_parallel)
+        report_estimate(total, entries, args.max_parallel)
+        journal.extend(entries)
+    else:
+        # Run the whole graph; each resource starts as soon as its dependencies succeed
+        execute_operations(
+            operations, args.max_parallel, clients, args.use_async,
+            plan=args.plan, skip_unchanged=args.skip_unchanged,
+            deploy_state=deploy_state, durations=durations, journal=journal,
+            checkpoint=checkpoint)
+
+    # Build output.json from the results journaled during the run
+    journal.write_output()
+
+if __name__ == "__main__":
+    main()
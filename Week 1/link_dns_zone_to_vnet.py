@@ -5,7 +5,9 @@ This script reads a JSON configuration file and links virtual networks (VNets) t
 across multiple subscriptions. It supports enabling or disabling auto-registration for each VNet.
 
 Usage:
-    python link_dns_zone_to_vnet.py --input_file custom_input.json
+    python link_dns_zone_to_vnet.py --input_file custom_input.json [--max_parallel 10] [--use_async]
+        [--plan | --skip_unchanged] [--incremental]
+        [--resume RUN_ID]
 
 Requirements:
     - Azure CLI logged in OR environment credentials configured
@@ -14,11 +16,30 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.privatedns import PrivateDnsManagementClient
+from functools import partial
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config, network_id
+from runner import execute_operations
+from deploy_state import DEFAULT_DEPLOY_STATE_FILE, open_deploy_state
+from journal import Journal
+from checkpoint import DEFAULT_CHECKPOINT_FILE, Checkpoint
+
+def link_entry(rg_name, link_result):
+    """
+    Build the output entry for a created or updated virtual network link
+    """
+    return {
+        "virtual_network_link_name": link_result.name,
+        "resource_group": rg_name,
+        "location": link_result.location,
+        "status": "success"
+    }
 
 def main():
     """
@@ -30,15 +51,49 @@ def main():
         description="Link VNets to Private DNS Zones from JSON config.")
     parser.add_argument(
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--max_parallel', type=int, default=1,
+        help='Maximum number of link operations to run at the same time.')
+    parser.add_argument(
+        '--use_async', action='store_true',
+        help='Run the operations on the asyncio engine with the aio SDK clients.')
+    parser.add_argument(
+        '--plan', action='store_true',
+        help='Compare the input with live state and write the plan without changing anything.')
+    parser.add_argument(
+        '--skip_unchanged', action='store_true',
+        help='Only write the resources that are missing or differ from the input.')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='Only apply the resources whose spec changed since the last run, without reading live state.')
+    parser.add_argument(
+        '--deploy_state', type=str, default=DEFAULT_DEPLOY_STATE_FILE,
+        help='State file with the spec hash and result of each applied resource.')
+    parser.add_argument(
+        '--resume', type=str, default=None,
+        help='Run ID (tail_journal.py --list) to resume: skip what succeeded and reattach to LROs in flight.')
+    parser.add_argument(
+        '--checkpoint_file', type=str, default=DEFAULT_CHECKPOINT_FILE,
+        help='SQLite checkpoint of the state of every operation, for --resume.')
     args = parser.parse_args()
 
-    # Load configuration
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Spec hashes and results of the last applied run, for --incremental
+    deploy_state = open_deploy_state(args.deploy_state, args.incremental)
+
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
+
+    # Operation states of this run, committed as they change, for --resume
+    checkpoint = Checkpoint(args.checkpoint_file, journal.run_id, resume=args.resume)
 
-    # Initialize Azure credential
-    credential = DefaultAzureCredential()
-    output = []
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry(pool_size=max(args.max_parallel, 10))
+
+    # Operation list; results keep the same order as the links in the input
+    operations = []
 
     # Loop through each private DNS zone to process its VNet links
     for zone in config['private_dns_zones']:
@@ -46,51 +101,39 @@ def main():
             rg_name = zone["resource_group"]
             zone_name = zone["private_zone_name"]
 
-            # Loop over each Resource Group to find the right subscription ID
-            for rg in config["resource_groups"]:
-                if rg["resource_group"] == rg_name:
-                    subscription_id = rg["subscription_id"]
-                    break
-
-            if not subscription_id:
-                raise Exception(f"Subscription ID not found for resource group: {rg_name}")
-
-            # Initialize SDK clients for this subscription
-            resource_client = ResourceManagementClient(credential, subscription_id)
-            private_dns_client = PrivateDnsManagementClient(credential, subscription_id)
+            # Look up the subscription ID of the resource group
+            subscription_id = config.subscription(rg_name)
 
             # Check if RG exists
-            rg_exists = resource_client.resource_groups.check_existence(rg_name)
+            rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
             if not rg_exists:
-                result = {
+                operations.append({"result": {
                     "resource_group": rg_name,
                     "status": "failed",
                     "reason": "Resource group does not exist"
-                }
-                output.append(result)
+                }})
                 continue
 
-            # Process each virtual network link
-            for link in zone["virtual_network_links"]:
+        except Exception as e:
+            # Capture error for this zone
+            operations.append({"result": {
+                "private_dns_zone_name": zone_name,
+                "resource_group": rg_name,
+                "status": "failed",
+                "reason": str(e)
+            }})
+            continue
+
+        # Process each virtual network link
+        for link in zone["virtual_network_links"]:
+            try:
                 link_name = link["link_name"]
                 vnet_name = link["vnet_name"]
-                vnet_rg = link["vnet_resource_group"]
                 registration_enabled = link["registration_enabled"]
 
-                for rg in config["resource_groups"]:
-                    if rg["resource_group"] == vnet_rg:
-                        vnet_sub_id = rg["subscription_id"]
-                        break
-
-                if not vnet_sub_id:
-                    raise Exception(f"Subscription ID not found for VNet resource group: {vnet_rg}")
-
-                # Construct full VNet ID
-                vnet_id = (
-                        f"/subscriptions/{vnet_sub_id}/resourceGroups/{vnet_rg}/"
-                        f"providers/Microsoft.Network/virtualNetworks/{vnet_name}"
-                )
+                # Resolve the VNet ID from the indexed input file
+                vnet_id = config.vnet_id(vnet_name)
 
                 # Define link parameters
                 link_params = {
@@ -99,36 +142,35 @@ def main():
                     "registration_enabled": registration_enabled
                 }
 
-                # Create or update the VNet link to the DNS zone
-                link_result = private_dns_client.virtual_network_links.begin_create_or_update(
-                    rg_name,
-                    zone_name,
-                    link_name,
-                    link_params
-                ).result()
-
-                result = {
-                        "virtual_network_link_name": link_result.name,
-                        "resource_group": rg_name,
-                        "location": link_result.location,
-                        "status": "success"
-                    }
-
-        except Exception as e:
-            # Capture error for this specific link
-            result = {
-                "virtual_network_link_name": link_name,
-                "resource_group": rg_name,
-                "status": "failed",
-                "reason": str(e)
-            }
-
-        # Write results to output file
-        output.append(result)
-
-    # Write results to JSON file
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+                # Queue the create or update of the VNet link; writes to one zone run in turn
+                operations.append({
+                    "parent": network_id(subscription_id, rg_name, "privateDnsZones", zone_name),
+                    "client_type": "privatedns",
+                    "subscription_id": subscription_id,
+                    "method": "virtual_network_links.begin_create_or_update",
+                    "args": [rg_name, zone_name, link_name, link_params],
+                    "fields": {"virtual_network_link_name": link_name, "resource_group": rg_name},
+                    "success": partial(link_entry, rg_name)
+                })
+
+            except Exception as e:
+                # Capture error for this specific link
+                operations.append({"result": {
+                    "virtual_network_link_name": link_name,
+                    "resource_group": rg_name,
+                    "status": "failed",
+                    "reason": str(e)
+                }})
+
+    # Submit the link operations and collect the pollers as they finish
+    execute_operations(
+        operations, args.max_parallel, clients, args.use_async,
+        plan=args.plan, skip_unchanged=args.skip_unchanged,
+        deploy_state=deploy_state, journal=journal,
+        checkpoint=checkpoint)
+
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
@@ -14,11 +14,15 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.network import NetworkManagementClient
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config
+from journal import Journal
 
 def main():
     """
@@ -32,19 +36,19 @@ def main():
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
     args = parser.parse_args()
 
-    # Load the input configuration JSON
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
 
-    # Prepare output list to capture status for each VNet
-    output = []
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
 
-    # Initialize credential object
-    credential = DefaultAzureCredential()
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry()
 
     # Iterate through each VNet and its subnets
     for vnet in config["vnets"]:
         for subnet in vnet["subnets"]:
+            resource_id = None
             try:
                 # Skip subnets that do not define Route Table configuration
                 if "route_table_name" not in subnet and "routes" not in subnet:
@@ -56,18 +60,12 @@ def main():
                 disable_bgp_propagation = subnet["disable_bgp_propagation"]
                 route_list = []
 
-                # Loop over each Resource Group to find the right subscription ID
-                for rg in config["resource_groups"]:
-                    if rg["resource_group"] == rg_name:
-                        subscription_id = rg["subscription_id"]
-                        break
-
-                if not subscription_id:
-                    raise Exception(f"Subscription ID not found for resource group: {rg_name}")
+                # Look up the subscription ID of the resource group
+                subscription_id = config.subscription(rg_name)
+                resource_id = config.resource_id("route_tables", rg_name, route_table_name)
 
-                # Initialize management clients
-                resource_client = ResourceManagementClient(credential, subscription_id)
-                network_client = NetworkManagementClient(credential, subscription_id)
+                # Reuse the shared network client for the subscription
+                network_client = clients.get("network", subscription_id)
 
                 if "routes" in subnet:
                     for route in subnet["routes"]:
@@ -81,7 +79,7 @@ def main():
                         route_list.append(route_dict)
 
                 # Check whether the resource group exists
-                rg_exists = resource_client.resource_groups.check_existence(rg_name)
+                rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
                 if not rg_exists:
                     result = {
@@ -89,7 +87,7 @@ def main():
                         "status": "failed",
                         "reason": "Resource group does not exist"
                     }
-                    output.append(result)
+                    journal.append(result, resource_id=resource_id)
                     continue
 
                 # Create or update the Route Table with Routes
@@ -119,12 +117,11 @@ def main():
                     "reason": str(e)
                 }
 
-            # Add result to the output list
-            output.append(result)
+            # Journal the result as soon as it is known
+            journal.append(result, resource_id=resource_id)
 
-    # Write results to JSON file
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
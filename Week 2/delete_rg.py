@@ -4,8 +4,14 @@ delete_rg.py
 This script reads a JSON configuration file that defines Azure resource groups,
 then deletes each resource group using the Azure SDK for Python.
 
+By default the deletes are only submitted. With --wait every delete is submitted first,
+across all subscriptions, and then all of them are polled together with a progress and
+ETA line; each resource group is reported with its real completion time and final state.
+Until a delete finishes, the group is listed as Deleting and the create scripts refuse
+to deploy into it.
+
 Usage:
-    python delete_rg.py --input_file custom_input.json
+    python delete_rg.py --input_file custom_input.json [--wait] [--inventory_file inventory.db]
 
 Requirements:
     - Azure CLI logged in OR environment credentials set up
@@ -14,10 +20,94 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
+import time
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
+from datetime import datetime, timedelta, timezone
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry, DELETING_STATE
+from config_model import load_config
+from polling import adaptive_polling, polling_fields
+from inventory import open_inventory
+from journal import Journal
+
+# Seconds to wait on an in-flight delete before checking the others again
+POLL_INTERVAL = 5
+
+# Seconds between progress lines while nothing finishes
+PROGRESS_INTERVAL = 30
+
+def format_seconds(seconds):
+    """
+    Format a duration as minutes and seconds for the progress line
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m{seconds:02d}s"
+
+def print_progress(in_flight, durations, started):
+    """
+    Print how many deletes are done and an ETA from the ones that have finished
+    """
+    elapsed = time.monotonic() - started
+    done = len(durations)
+    line = f"{done}/{done + len(in_flight)} resource group(s) deleted, " \
+        f"elapsed {format_seconds(elapsed)}"
+
+    # Expect the remaining deletes to take as long as the average finished one
+    if in_flight and durations:
+        average = sum(durations) / len(durations)
+        remaining = max(average - (time.monotonic() - submitted)
+                        for _, _, submitted, _ in in_flight.values())
+        line += f", ETA {format_seconds(max(remaining, 0))}"
+    elif in_flight:
+        line += ", ETA unknown until the first delete finishes"
+
+    print(line)
+
+def wait_deletes(in_flight, output, clients, journal):
+    """
+    Poll every submitted delete together and journal its completion time and final state
+    """
+    started = time.monotonic()
+    durations = []
+    last_progress = started
+    print_progress(in_flight, durations, started)
+
+    while in_flight:
+        # Block on the oldest poller for a moment, then collect everything that finished
+        next(iter(in_flight.values()))[0].wait(POLL_INTERVAL)
+        finished = [index for index, (poller, _, _, _) in in_flight.items() if poller.done()]
+
+        for index in finished:
+            poller, polling, submitted, subscription_id = in_flight.pop(index)
+            seconds = round(time.monotonic() - submitted, 1)
+            entry = output[index]
+            entry["completed_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            entry["seconds_to_delete"] = seconds
+            entry.update(polling_fields([polling]))
+
+            try:
+                poller.result()
+                clients.forget_resource_group(subscription_id, entry["resource_group"])
+                entry["final_state"] = "Deleted"
+                entry["status"] = "success"
+                durations.append(seconds)
+            except Exception as e:
+                entry["final_state"] = "Failed"
+                entry["status"] = "failed"
+                entry["reason"] = str(e)
+
+            journal.append(
+                entry, index, datetime.now(timezone.utc) - timedelta(seconds=seconds),
+                resource_id=f"/subscriptions/{subscription_id}/resourceGroups/"
+                            f"{entry['resource_group']}")
+
+        if finished or time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+            print_progress(in_flight, durations, started)
+            last_progress = time.monotonic()
 
 def main():
     """
@@ -29,37 +119,58 @@ def main():
         description="Create Azure Resource Groups from a JSON config file.")
     parser.add_argument(
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--wait', action='store_true',
+        help='Wait for every delete to finish and record when and how each one ended.')
+    parser.add_argument(
+        '--inventory_file', type=str, default=None,
+        help='SQLite inventory from prefetch_inventory.py to drop the deleted groups from.')
     args = parser.parse_args()
 
-    # Load the JSON configuration from the specified file
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
 
-    # Output list to store result of each resource group operation
-    output = []
+    # Submitted deletes by output slot: (poller, polling, submit time, subscription ID)
+    in_flight = {}
 
-    # Initialize credential using DefaultAzureCredential (supports CLI, env, etc.)
-    credential = DefaultAzureCredential()
+    # Entries of the deletes --wait polls, journaled once they are final
+    output = {}
+
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry(inventory=open_inventory(args.inventory_file))
 
     # Iterate over each resource group defined in the input JSON
     for rg in config["resource_groups"]:
         subscription_id = rg["subscription_id"]
         rg_name = rg["resource_group"]
 
-        # Create a Resource Management client for the current subscription
-        resource_client = ResourceManagementClient(credential, subscription_id)
+        # Reuse the shared Resource Management client for the current subscription
+        resource_client = clients.get("resource", subscription_id)
+        slot = journal.reserve()
 
         try:
-            # Attempt to delete the resource group
+            # Submit the delete; ARM runs it in the background once accepted
+            polling = adaptive_polling("resource_groups")
             rg_result = resource_client.resource_groups.begin_delete(
                 rg_name,
-                force_deletion_types="Microsoft.Compute/virtualMachines")
+                force_deletion_types="Microsoft.Compute/virtualMachines",
+                polling=polling)
+            clients.record_resource_group(subscription_id, rg_name, DELETING_STATE)
+
+            # The resources of the group are going away; later runs read them from ARM
+            if clients.inventory:
+                clients.inventory.forget_resource_group(subscription_id, rg_name)
 
             result = {
                 "resource_group": rg_name,
-                "status": "succeeded"
+                "submitted_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "status": "submitted"
             }
-    
+            in_flight[slot] = (rg_result, polling, time.monotonic(), subscription_id)
+
         except Exception as e:
             # Catch and store any errors that occur during creation
             result = {
@@ -68,12 +179,20 @@ def main():
                 "reason": str(e)
                 }
 
-        # Append result to output list
-        output.append(result)
+        # A submitted delete is only final here when the run does not wait for it
+        if args.wait and slot in in_flight:
+            output[slot] = result
+        else:
+            journal.append(
+                result, slot,
+                resource_id=f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}")
+
+    # Poll all of the deletes together until every one has finished
+    if args.wait:
+        wait_deletes(in_flight, output, clients, journal)
 
-    # Write the output to a file for logging and tracking
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
@@ -5,8 +5,23 @@ This script reads a JSON configuration file that defines Azure Route Tables
 and Network Security Groups (NSGs), and subnets. Then updates each subnets
 to specified resource groups across multiple subscriptions.
 
+Subnets of different VNets are updated in parallel, while the updates to one VNet run
+one at a time, since Azure rejects concurrent writes to the same VNet. With
+--skip_unchanged a subnet that already has its NSG and route table is not written again.
+With --inventory_file the subnet reads are answered from a prefetched inventory, and with
+--batch_endpoint the remaining reads go out BATCH_LIMIT at a time through ARM's /batch.
+
+Each write carries If-Match with the ETag of the subnet it read, so a change made by
+another writer in the meantime is never overwritten: the subnet is read again and the
+update reapplied. With --etag_file the ETags are kept between runs and the reads become
+conditional (If-None-Match), reusing the stored subnet when it has not changed.
+
 Usage:
-    python update_subnet.py --input_file custom_input.json
+    python update_subnet.py --input_file custom_input.json [--max_parallel 10] [--use_async]
+        [--skip_unchanged] [--incremental]
+        [--resume RUN_ID]
+        [--inventory_file inventory.db] [--cache_ttl 900] [--etag_file etags.json]
+        [--batch_endpoint [https://management.azure.com]]
 
 Requirements:
     - Azure CLI logged in OR environment credentials configured
@@ -15,11 +30,82 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.network import NetworkManagementClient
+from functools import partial
+from azure.mgmt.network.models import Subnet
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config
+from runner import execute_operations
+from deploy_state import DEFAULT_DEPLOY_STATE_FILE, open_deploy_state
+from journal import Journal
+from checkpoint import DEFAULT_CHECKPOINT_FILE, Checkpoint
+from plan import differences
+from inventory import DEFAULT_TTL, open_inventory
+from etag_store import EtagStore, if_match
+from arm_batch import DEFAULT_ENDPOINT
+
+def subnet_entry(rg_name, vnet_name, subnet_result):
+    """
+    Build the output entry for an updated subnet
+    """
+    return {
+        "subnet_name": subnet_result.name,
+        "vnet_name": vnet_name,
+        "resource_group": rg_name,
+        "status": "success"
+    }
+
+def written_subnet_entry(etags, rg_name, vnet_name, subnet_result):
+    """
+    Keep the ETag of a written subnet and build its output entry
+    """
+    if etags:
+        etags.remember(subnet_result)
+    return subnet_entry(rg_name, vnet_name, subnet_result)
+
+def subnet_update(operation, nsg_id, route_table_id, skip_unchanged, etags, subnet):
+    """
+    Build the operation that writes the fetched subnet back with its NSG and route table
+    """
+    rg_name, vnet_name, subnet_name = operation["args"]
+    if etags:
+        etags.remember(subnet)
+
+    # Skip the write when the subnet already points at the same NSG and route table
+    desired = {}
+    if nsg_id:
+        desired["network_security_group"] = {"id": nsg_id}
+    if route_table_id:
+        desired["route_table"] = {"id": route_table_id}
+    if skip_unchanged and not differences(desired, subnet):
+        return {"result": {
+            **subnet_entry(rg_name, vnet_name, subnet),
+            "action": "unchanged"
+        }}
+
+    # Modify only the desired fields
+    if nsg_id:
+        subnet.network_security_group = {"id": nsg_id}
+
+    if route_table_id:
+        subnet.route_table = {"id": route_table_id}
+
+    # Begin update without overwriting other fields, or changes made since the read
+    return if_match({
+        "parent": operation["parent"],
+        "client_type": "network",
+        "subscription_id": operation["subscription_id"],
+        "method": "subnets.begin_create_or_update",
+        "args": [rg_name, vnet_name, subnet_name, subnet],
+        "fields": operation["fields"],
+        "success": partial(written_subnet_entry, etags, rg_name, vnet_name),
+        "retry_on_conflict": operation
+    }, subnet)
 
 def main():
     """
@@ -31,17 +117,64 @@ def main():
         description="Create Azure VNets from a JSON config file.")
     parser.add_argument(
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--max_parallel', type=int, default=1,
+        help='Maximum number of subnet operations to run at the same time.')
+    parser.add_argument(
+        '--use_async', action='store_true',
+        help='Run the operations on the asyncio engine with the aio SDK clients.')
+    parser.add_argument(
+        '--skip_unchanged', action='store_true',
+        help='Only write the subnets whose NSG or route table differs from the input.')
+    parser.add_argument(
+        '--inventory_file', type=str, default=None,
+        help='SQLite inventory from prefetch_inventory.py; fresh entries answer reads instead of ARM.')
+    parser.add_argument(
+        '--cache_ttl', type=int, default=DEFAULT_TTL,
+        help='Seconds an inventory entry is trusted.')
+    parser.add_argument(
+        '--etag_file', type=str, default=None,
+        help='File to keep subnet ETags in between runs, for conditional reads.')
+    parser.add_argument(
+        '--batch_endpoint', type=str, nargs='?', const=DEFAULT_ENDPOINT, default=None,
+        help='Send independent reads through ARM /batch (optionally at this endpoint, e.g. arm_stub_server.py).')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='Only apply the resources whose spec changed since the last run, without reading live state.')
+    parser.add_argument(
+        '--deploy_state', type=str, default=DEFAULT_DEPLOY_STATE_FILE,
+        help='State file with the spec hash and result of each applied resource.')
+    parser.add_argument(
+        '--resume', type=str, default=None,
+        help='Run ID (tail_journal.py --list) to resume: skip what succeeded and reattach to LROs in flight.')
+    parser.add_argument(
+        '--checkpoint_file', type=str, default=DEFAULT_CHECKPOINT_FILE,
+        help='SQLite checkpoint of the state of every operation, for --resume.')
     args = parser.parse_args()
 
-    # Load the input configuration JSON
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Spec hashes and results of the last applied run, for --incremental
+    deploy_state = open_deploy_state(args.deploy_state, args.incremental)
+
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
+
+    # Operation states of this run, committed as they change, for --resume
+    checkpoint = Checkpoint(args.checkpoint_file, journal.run_id, resume=args.resume)
+
+    # Operation list; results keep the same order as the subnets in the input
+    operations = []
 
-    # Prepare output list to capture status for each VNet
-    output = []
+    # ETags and bodies of the subnets seen by earlier runs
+    etags = EtagStore(args.etag_file) if args.etag_file else None
 
-    # Initialize credential object
-    credential = DefaultAzureCredential()
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry(
+        pool_size=max(args.max_parallel, 10),
+        inventory=open_inventory(args.inventory_file, args.cache_ttl),
+        batch_endpoint=args.batch_endpoint)
 
 # Iterate through each VNet and its subnets
     for vnet in config["vnets"]:
@@ -54,78 +187,68 @@ def main():
                 nsg_name = subnet_config.get("nsg_name")
                 route_table_name = subnet_config.get("route_table_name")
 
-                # Loop over each Resource Group to find the right subscription ID
-                for rg in config["resource_groups"]:
-                    if rg["resource_group"] == rg_name:
-                        subscription_id = rg["subscription_id"]
-                        break
-
-                if not subscription_id:
-                    raise Exception(f"Subscription ID not found for resource group: {rg_name}")
-
-                # Initialize management clients
-                resource_client = ResourceManagementClient(credential, subscription_id)
-                network_client = NetworkManagementClient(credential, subscription_id)
+                # Look up the subscription ID of the resource group
+                subscription_id = config.subscription(rg_name)
 
                 # Check whether the resource group exists
-                rg_exists = resource_client.resource_groups.check_existence(rg_name)
+                rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
                 if not rg_exists:
-                    result = {
+                    operations.append({"result": {
                         "resource_group": rg_name,
                         "status": "failed",
                         "reason": "Resource group does not exist"
-                    }
-                    output.append(result)
+                    }})
                     continue
 
-                # Fetch existing subnet config
-                subnet = network_client.subnets.get(rg_name, vnet_name, subnet_name)
-
-                # Modify only the desired fields
-                if nsg_name:
-                    subnet.network_security_group = {
-                        "id": f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}"
-                            f"/providers/Microsoft.Network/networkSecurityGroups/{nsg_name}"
-                    }
-
-                if route_table_name:
-                    subnet.route_table = {
-                        "id": f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}" \
-                            f"/providers/Microsoft.Network/routeTables/{route_table_name}"
-                    }
-
-                # Begin update without overwriting other fields
-                subnet_result = network_client.subnets.begin_create_or_update(
-                    rg_name,
-                    vnet_name,
-                    subnet_name,
-                    subnet
-                ).result()
-
-                result = {
-                    "subnet_name": subnet_result.name,
-                    "vnet_name": vnet_name,
-                    "resource_group": rg_name,
-                    "status": "success"
+                nsg_id = config.resource_id("nsgs", rg_name, nsg_name) if nsg_name else None
+                route_table_id = config.resource_id(
+                    "route_tables", rg_name, route_table_name) if route_table_name else None
+
+                # Fetch the existing subnet, then write it back; writes to one VNet run in turn
+                operation = {
+                    "parent": config.vnet_id(vnet_name),
+                    "client_type": "network",
+                    "subscription_id": subscription_id,
+                    "method": "subnets.get",
+                    "args": [rg_name, vnet_name, subnet_name],
+                    "fields": {
+                        "subnet_name": subnet_name,
+                        "vnet_name": vnet_name,
+                        "resource_group": rg_name
+                    },
+                    "spec": {"nsg_id": nsg_id, "route_table_id": route_table_id}
                 }
+                operation["then"] = partial(
+                    subnet_update, operation, nsg_id, route_table_id, args.skip_unchanged,
+                    etags)
+
+                # Reuse the stored subnet when it has not changed since the last run
+                if etags:
+                    operation = etags.conditional_read(
+                        operation, config.subnet_id(vnet_name, subnet_name), Subnet)
+                operations.append(operation)
 
             except Exception as e:
                 # Capture error and report failure
-                result = {
+                operations.append({"result": {
                     "subnet_name": subnet_name,
                     "vnet_name": vnet_name,
                     "resource_group": rg_name,
                     "status": "failed",
                     "reason": str(e)
-                }
-
-            # Add result to the output list
-            output.append(result)
-
-    # Write results to JSON file
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+                }})
+
+    # Submit the subnet updates and collect the pollers as they finish
+    execute_operations(
+        operations, args.max_parallel, clients, args.use_async,
+        deploy_state=deploy_state, journal=journal,
+        checkpoint=checkpoint)
+    if etags:
+        etags.save()
+
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,69 @@
+"""
+collect_pending.py
+
+This script waits on the long-running operations that were submitted with --no_wait
+(for example by create_virtual_network_gateway.py). Every poller saved in the state file
+is rebuilt from its continuation token and all of them are waited on at the same time,
+so three gateways take as long as the slowest one instead of the sum of all three.
+
+Finished operations are removed from the state file; failed ones are kept so they can be
+collected again or replaced by resubmitting the resource.
+
+Usage:
+    python collect_pending.py [--state_file pending_operations.json] [--max_parallel 10] [--use_async]
+
+Requirements:
+    - Azure CLI logged in OR environment credentials configured
+    - 'azure-identity', 'azure-mgmt-resource', and 'azure-mgmt-network' libraries installed
+    - A state file written by a script run with --no_wait
+"""
+
+# Import the needed credential and management objects from the libraries.
+import os
+import sys
+import argparse
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from lro_state import DEFAULT_STATE_FILE, collect_pending
+from journal import Journal
+
+def main():
+    """
+    Main Loop
+    """
+
+    # Set up argument parser for the state file
+    parser = argparse.ArgumentParser(
+        description="Wait on the operations saved by a --no_wait run.")
+    parser.add_argument(
+        '--state_file', type=str, default=DEFAULT_STATE_FILE,
+        help='File the continuation tokens were saved to.')
+    parser.add_argument(
+        '--max_parallel', type=int, default=None,
+        help='Maximum number of pollers to wait on at the same time (default: all).')
+    parser.add_argument(
+        '--use_async', action='store_true',
+        help='Run the pollers on the asyncio engine with the aio SDK clients.')
+    args = parser.parse_args()
+
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
+
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry()
+
+    # Resume every saved poller and wait for all of them
+    results = collect_pending(
+        args.state_file, clients, max_parallel=args.max_parallel, use_async=args.use_async,
+        journal=journal)
+
+    if not results:
+        print(f"No pending operations in {args.state_file}")
+
+    # Build output.json from the results journaled during the run
+    journal.write_output()
+
+if __name__ == "__main__":
+    main()
@@ -14,13 +14,38 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.network import NetworkManagementClient
 from azure.mgmt.network.models import AddressSpace
 
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config
+from journal import Journal
+
+def local_gateway_parameters(gateway):
+    """
+    Build the create or update parameters of a Local Network Gateway
+    """
+    return {
+        "location": gateway["location"],
+        "gateway_ip_address": gateway["ip_address"],
+        "local_network_address_space": AddressSpace(address_prefixes=gateway["address_prefixes"]),
+    }
+
+def local_gateway_entry(rg_name, local_gateway_result):
+    """
+    Build the output entry for a created or updated Local Network Gateway
+    """
+    return {
+        "local_gateway_name": local_gateway_result.name,
+        "location": local_gateway_result.location,
+        "resource_group": rg_name,
+        "status": "success"
+    }
+
 def main():
     """
     Main Loop
@@ -33,40 +58,31 @@ def main():
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
     args = parser.parse_args()
 
-    # Load the input configuration JSON
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
 
-    # Prepare output list to capture status for each VNet
-    output = []
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
 
-    # Initialize credential object
-    credential = DefaultAzureCredential()
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry()
 
     # Iterate through each VNet and its subnets
     for gateway in config["local_network_gateways"]:
+        resource_id = None
         try:
             rg_name = gateway["resource_group"]
-            location = gateway["location"]
             gateway_name = gateway["name"]
-            gateway_ip = gateway["ip_address"]
-            address_space = gateway["address_prefixes"]
-
-            # Loop over each Resource Group to find the right subscription ID
-            for rg in config["resource_groups"]:
-                if rg["resource_group"] == rg_name:
-                    subscription_id = rg["subscription_id"]
-                    break
 
-            if not subscription_id:
-                raise Exception(f"Subscription ID not found for resource group: {rg_name}")
+            # Look up the subscription ID of the resource group
+            subscription_id = config.subscription(rg_name)
+            resource_id = config.resource_id("local_network_gateways", rg_name, gateway_name)
 
-            # Initialize management clients
-            resource_client = ResourceManagementClient(credential, subscription_id)
-            network_client = NetworkManagementClient(credential, subscription_id)
+            # Reuse the shared network client for the subscription
+            network_client = clients.get("network", subscription_id)
 
             # Check whether the resource group exists
-            rg_exists = resource_client.resource_groups.check_existence(rg_name)
+            rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
             if not rg_exists:
                 result = {
@@ -74,26 +90,17 @@ def main():
                     "status": "failed",
                     "reason": "Resource group does not exist"
                 }
-                output.append(result)
+                journal.append(result, resource_id=resource_id)
                 continue
 
             # Create or update the Virtual Network Gateway
             local_gateway_result = network_client.local_network_gateways.begin_create_or_update(
                 rg_name,
                 gateway_name,
-                {
-                    "location": location,
-                    "gateway_ip_address": gateway_ip,
-                    "local_network_address_space": AddressSpace(address_prefixes=address_space),
-                }
+                local_gateway_parameters(gateway)
             ).result()
 
-            result = {
-                "local_gateway_name": local_gateway_result.name,
-                "location": local_gateway_result.location,
-                "resource_group": rg_name,
-                "status": "success"
-            }
+            result = local_gateway_entry(rg_name, local_gateway_result)
 
         except Exception as e:
             # Capture error and report failure
@@ -104,12 +111,11 @@ def main():
                 "reason": str(e)
             }
 
-        # Add result to the output list
-        output.append(result)
+        # Journal the result as soon as it is known
+        journal.append(result, resource_id=resource_id)
 
-    # Write results to JSON file
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
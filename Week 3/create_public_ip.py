@@ -14,13 +14,39 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.network import NetworkManagementClient
 from azure.mgmt.network.models import PublicIPAddressSku
 
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config
+from journal import Journal
+
+def public_ip_parameters(ip):
+    """
+    Build the create or update parameters of a Public IP Address
+    """
+    return {
+        "location": ip["location"],
+        "sku": PublicIPAddressSku(name=ip["sku"],tier=ip["tier"]),
+        "public_ip_allocation_method": ip["allocation_method"],
+        "public_ip_address_version": ip["version"]
+    }
+
+def public_ip_entry(rg_name, public_ip_result):
+    """
+    Build the output entry for a created or updated Public IP Address
+    """
+    return {
+        "public_ip_name": public_ip_result.name,
+        "location": public_ip_result.location,
+        "resource_group": rg_name,
+        "status": "success"
+    }
+
 def main():
     """
     Main Loop
@@ -33,42 +59,31 @@ def main():
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
     args = parser.parse_args()
 
-    # Load the input configuration JSON
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
 
-    # Prepare output list to capture status for each VNet
-    output = []
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
 
-    # Initialize credential object
-    credential = DefaultAzureCredential()
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry()
 
     # Iterate through each VNet and its subnets
     for ip in config["public_ips"]:
+        resource_id = None
         try:
             rg_name = ip["resource_group"]
-            location = ip["location"]
             public_ip_name = ip["name"]
-            version = ip["version"]
-            allocation_method = ip["allocation_method"]
-            sku = ip["sku"]
-            tier = ip["tier"]
 
-            # Loop over each Resource Group to find the right subscription ID
-            for rg in config["resource_groups"]:
-                if rg["resource_group"] == rg_name:
-                    subscription_id = rg["subscription_id"]
-                    break
+            # Look up the subscription ID of the resource group
+            subscription_id = config.subscription(rg_name)
+            resource_id = config.resource_id("public_ips", rg_name, public_ip_name)
 
-            if not subscription_id:
-                raise Exception(f"Subscription ID not found for resource group: {rg_name}")
-
-            # Initialize management clients
-            resource_client = ResourceManagementClient(credential, subscription_id)
-            network_client = NetworkManagementClient(credential, subscription_id)
+            # Reuse the shared network client for the subscription
+            network_client = clients.get("network", subscription_id)
 
             # Check whether the resource group exists
-            rg_exists = resource_client.resource_groups.check_existence(rg_name)
+            rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
             if not rg_exists:
                 result = {
@@ -76,27 +91,17 @@ def main():
                     "status": "failed",
                     "reason": "Resource group does not exist"
                 }
-                output.append(result)
+                journal.append(result, resource_id=resource_id)
                 continue
 
             # Creatre or update the Public IP Address
             public_ip_result = network_client.public_ip_addresses.begin_create_or_update(
                 rg_name,
                 public_ip_name,
-                {
-                    "location": location,
-                    "sku": PublicIPAddressSku(name=sku,tier=tier),
-                    "public_ip_allocation_method": allocation_method,
-                    "public_ip_address_version": version
-                }
+                public_ip_parameters(ip)
             ).result()
 
-            result = {
-                "public_ip_name": public_ip_result.name,
-                "location": public_ip_result.location,
-                "resource_group": rg_name,
-                "status": "success"
-            }
+            result = public_ip_entry(rg_name, public_ip_result)
 
         except Exception as e:
             # Capture error and report failure
@@ -107,12 +112,11 @@ def main():
                 "reason": str(e)
             }
 
-        # Add result to the output list
-        output.append(result)
+        # Journal the result as soon as it is known
+        journal.append(result, resource_id=resource_id)
 
-    # Write results to JSON file
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
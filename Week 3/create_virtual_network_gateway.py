@@ -4,8 +4,13 @@ create_virtual_network_gateway.py
 This script reads a JSON configuration file that defines an Azure Virtual
 Network Gateway and deploys it to specified vnet and subnet.
 
+Each gateway takes 30-45 minutes to provision. With --no_wait the gateways are only
+submitted: the continuation token of each poller is saved to the state file and the script
+exits. Run collect_pending.py (or create_vng_connection.py --state_file) later to wait on
+all of them at the same time.
+
 Usage:
-    python create_virtual_network_gateway.py --input_file custom_input.json
+    python create_virtual_network_gateway.py --input_file custom_input.json [--no_wait] [--state_file pending_operations.json]
 
 Requirements:
     - Azure CLI logged in OR environment credentials configured
@@ -14,13 +19,61 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.network import NetworkManagementClient
 from azure.mgmt.network.models import VirtualNetworkGatewayIPConfiguration, VirtualNetworkGatewaySku, SubResource
 
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config
+from journal import Journal
+from lro_state import DEFAULT_STATE_FILE, save_pending
+from polling import adaptive_polling, polling_fields
+
+def gateway_parameters(config, gateway):
+    """
+    Build the create or update parameters of a Virtual Network Gateway
+    """
+    rg_name = gateway["resource_group"]
+    sku = gateway["sku"]
+
+    # Resolve the gateway subnet and public IP IDs from the indexed input file
+    subnet_id = config.subnet_id(gateway["vnet_name"], gateway["subnet_name"])
+    public_ip_id = config.resource_id("public_ips", rg_name, gateway["public_ip_name"])
+
+    # Construct SubResource objects from raw ID strings
+    subnet_resource = SubResource(id=subnet_id)
+    public_ip_resource = SubResource(id=public_ip_id)
+
+    # Construct IP configuration object
+    ip_config = VirtualNetworkGatewayIPConfiguration(
+        name="Default",
+        subnet=subnet_resource,
+        public_ip_address=public_ip_resource,
+    )
+
+    return {
+        "location": gateway["location"],
+        "ip_configurations": [ip_config],
+        "gateway_type": gateway["gateway_type"],
+        "vpn_type": gateway["vpn_type"],
+        "active": gateway["enable_active_active"],
+        "sku": VirtualNetworkGatewaySku(name=sku,tier=sku)
+    }
+
+def gateway_entry(rg_name, vpn_gateway_result):
+    """
+    Build the output entry for a created or updated Virtual Network Gateway
+    """
+    return {
+        "vpn_gateway_name": vpn_gateway_result.name,
+        "location": vpn_gateway_result.location,
+        "resource_group": rg_name,
+        "status": "success"
+    }
+
 def main():
     """
     Main Loop
@@ -31,64 +84,39 @@ def main():
         description="Create Azure VNets from a JSON config file.")
     parser.add_argument(
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--no_wait', action='store_true',
+        help='Submit the gateways and save their continuation tokens instead of waiting.')
+    parser.add_argument(
+        '--state_file', type=str, default=DEFAULT_STATE_FILE,
+        help='File the continuation tokens are saved to with --no_wait.')
     args = parser.parse_args()
 
-    # Load the input configuration JSON
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
 
-    # Prepare output list to capture status for each VNet
-    output = []
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
 
-    # Initialize credential object
-    credential = DefaultAzureCredential()
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry()
 
     # Iterate through each VNet and its subnets
     for gateway in config["vpn_gateways"]:
+        resource_id = None
         try:
             rg_name = gateway["resource_group"]
-            location = gateway["location"]
             gateway_name = gateway["name"]
-            gateway_type = gateway["gateway_type"]
-            sku = gateway["sku"]
-            vpn_type = gateway["vpn_type"]
-            subnet = gateway["subnet_name"]
-            vnet = gateway["vnet_name"]
-            public_ip_name = gateway["public_ip_name"]
-            enable_active_active = gateway["enable_active_active"]
-
-            # Loop over each Resource Group to find the right subscription ID
-            for rg in config["resource_groups"]:
-                if rg["resource_group"] == rg_name:
-                    subscription_id = rg["subscription_id"]
-                    break
-
-            if not subscription_id:
-                raise Exception(f"Subscription ID not found for resource group: {rg_name}")
-
-            subnet_id = f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}/providers/" \
-                f"Microsoft.Network/virtualNetworks/{vnet}/subnets/{subnet}"
-
-            public_ip_id = f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}/providers/" \
-                f"Microsoft.Network/publicIPAddresses/{public_ip_name}"
-
-            # Construct SubResource objects from raw ID strings
-            subnet_resource = SubResource(id=subnet_id)
-            public_ip_resource = SubResource(id=public_ip_id)
-
-            # Construct IP configuration object
-            ip_config = VirtualNetworkGatewayIPConfiguration(
-                name="Default",
-                subnet=subnet_resource,
-                public_ip_address=public_ip_resource,
-            )
 
-            # Initialize management clients
-            resource_client = ResourceManagementClient(credential, subscription_id)
-            network_client = NetworkManagementClient(credential, subscription_id)
+            # Look up the subscription ID of the resource group
+            subscription_id = config.subscription(rg_name)
+            resource_id = config.resource_id("vpn_gateways", rg_name, gateway_name)
+
+            # Reuse the shared network client for the subscription
+            network_client = clients.get("network", subscription_id)
 
             # Check whether the resource group exists
-            rg_exists = resource_client.resource_groups.check_existence(rg_name)
+            rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
             if not rg_exists:
                 result = {
@@ -96,29 +124,41 @@ def main():
                     "status": "failed",
                     "reason": "Resource group does not exist"
                 }
-                output.append(result)
+                journal.append(result, resource_id=resource_id)
                 continue
 
-            # Create or update the Virtual Network Gateway
-            vpn_gateway_result = network_client.virtual_network_gateways.begin_create_or_update(
+            # Create or update the Virtual Network Gateway, polled on the gateway schedule
+            polling = adaptive_polling("virtual_network_gateways")
+            poller = network_client.virtual_network_gateways.begin_create_or_update(
                 rg_name,
                 gateway_name,
-                {
-                    "location": location,
-                    "ip_configurations": [ip_config],
-                    "gateway_type": gateway_type,
-                    "vpn_type": vpn_type,
-                    "active": enable_active_active,
-                    "sku": VirtualNetworkGatewaySku(name=sku,tier=sku)
-                }
-            ).result()
+                gateway_parameters(config, gateway),
+                polling=polling
+            )
 
-            result = {
-                "vpn_gateway_name": vpn_gateway_result.name,
-                "location": vpn_gateway_result.location,
-                "resource_group": rg_name,
-                "status": "success"
-            }
+            # Save the poller for collect_pending.py instead of blocking on it
+            if args.no_wait:
+                save_pending(
+                    args.state_file,
+                    config.resource_id("vpn_gateways", rg_name, gateway_name),
+                    {
+                        "client_type": "network",
+                        "subscription_id": subscription_id,
+                        "method": "virtual_network_gateways.begin_create_or_update",
+                        "args": [rg_name, gateway_name],
+                        "fields": {"vpn_gateway_name": gateway_name, "resource_group": rg_name}
+                    },
+                    poller
+                )
+                journal.append({
+                    "vpn_gateway_name": gateway_name,
+                    "resource_group": rg_name,
+                    "status": "submitted",
+                    "state_file": args.state_file
+                }, resource_id=resource_id)
+                continue
+
+            result = {**gateway_entry(rg_name, poller.result()), **polling_fields([polling])}
 
         except Exception as e:
             # Capture error and report failure
@@ -129,12 +169,11 @@ def main():
                 "reason": str(e)
             }
 
-        # Add result to the output list
-        output.append(result)
+        # Journal the result as soon as it is known
+        journal.append(result, resource_id=resource_id)
 
-    # Write results to JSON file
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
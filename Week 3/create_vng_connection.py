@@ -4,8 +4,17 @@ create_vng_connection.py
 This script reads a JSON configuration file that defines an Azure Virtual
 Network Gateway and connections and deploys them to specified vnet and subnet.
 
+When the gateways were submitted with create_virtual_network_gateway.py --no_wait, pass
+the same --state_file: the script waits on the saved pollers of the gateways its
+connections use (and only those) before creating the connections. With --inventory_file
+the gateways are read from a prefetched inventory instead of two GETs per connection, and
+with --batch_endpoint the gateways of every connection are read up front through ARM's
+/batch, BATCH_LIMIT per round trip.
+
 Usage:
-    python create_vng_connection.py --input_file custom_input.json
+    python create_vng_connection.py --input_file custom_input.json [--state_file pending_operations.json]
+        [--inventory_file inventory.db] [--cache_ttl 900]
+        [--batch_endpoint [https://management.azure.com]]
 
 Requirements:
     - Azure CLI logged in OR environment credentials configured
@@ -14,11 +23,58 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.network import NetworkManagementClient
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config, network_id
+from journal import Journal
+from lro_state import collect_pending
+from inventory import DEFAULT_TTL, open_inventory
+from arm_batch import DEFAULT_ENDPOINT
+
+def connection_parameters(gateway, connection, gateway_resource, local_gateway_resource):
+    """
+    Build the create or update parameters of a connection between two gateways
+    """
+    ip_sec_policies = []
+    for policy in connection["ip_sec_policies"]:
+        policy_dict = {
+            "sa_life_time_seconds": policy["sa_life_time_seconds"],
+            "sa_data_size_kilobytes": policy["sa_data_size_kilobytes"],
+            "ipsec_encryption": policy["ipsec_encryption"],
+            "ipsec_integrity": policy["ipsec_integrity"],
+            "ike_encryption": policy["ike_encryption"],
+            "ike_integrity": policy["ike_integrity"],
+            "dh_group": policy["dh_group"]
+        }
+
+        ip_sec_policies.append(policy_dict)
+
+    return {
+        "location": gateway["location"],
+        "virtual_network_gateway1": gateway_resource,
+        "local_network_gateway2": local_gateway_resource,
+        "connection_type": connection["connection_type"],
+        "dpd_timeout_seconds": connection["dpd_timeout_seconds"],
+        "connection_protocol": connection["protocol_type"],
+        "shared_key": connection["shared_key"],
+        "enable_bgp": connection["enable_bgp"],
+        "ipsec_policies": ip_sec_policies
+    }
+
+def connection_entry(rg_name, vpn_connection_result):
+    """
+    Build the output entry for a created or updated VPN connection
+    """
+    return {
+        "vpn_connection_name": vpn_connection_result.name,
+        "resource_group": rg_name,
+        "status": "success"
+    }
 
 def main():
     """
@@ -30,72 +86,100 @@ def main():
         description="Create Azure VNets from a JSON config file.")
     parser.add_argument(
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--state_file', type=str, default=None,
+        help='State file of a --no_wait gateway run to wait on before connecting.')
+    parser.add_argument(
+        '--inventory_file', type=str, default=None,
+        help='SQLite inventory from prefetch_inventory.py; fresh entries answer reads instead of ARM.')
+    parser.add_argument(
+        '--cache_ttl', type=int, default=DEFAULT_TTL,
+        help='Seconds an inventory entry is trusted.')
+    parser.add_argument(
+        '--batch_endpoint', type=str, nargs='?', const=DEFAULT_ENDPOINT, default=None,
+        help='Send independent reads through ARM /batch (optionally at this endpoint, e.g. arm_stub_server.py).')
     args = parser.parse_args()
 
-    # Load the input configuration JSON
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
-
-    # Prepare output list to capture status for each VNet
-    output = []
-
-    # Initialize credential object
-    credential = DefaultAzureCredential()
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
+
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry(
+        inventory=open_inventory(args.inventory_file, args.cache_ttl),
+        batch_endpoint=args.batch_endpoint)
+
+    # Wait on the submitted gateways that have connections to create, all at once
+    gateway_results = {}
+    if args.state_file:
+        needed = {
+            config.resource_id("vpn_gateways", gateway["resource_group"], gateway["name"])
+            for gateway in config["vpn_gateways"] if gateway["connections"]
+        }
+        gateway_results = collect_pending(args.state_file, clients, needed, journal=journal)
+
+    # Read both gateways of every connection in as few round trips as possible; the loop
+    # below reads them again one by one and reports any error for its connection
+    try:
+        reads = []
+        for gateway in config["vpn_gateways"]:
+            rg_name = gateway["resource_group"]
+            for connection in gateway["connections"]:
+                local_rg_name = config.local_gateway(
+                    rg_name, connection["local_gateway_name"])["resource_group"]
+                reads += [
+                    ("network", config.subscription(rg_name),
+                     "virtual_network_gateways.get", rg_name, gateway["name"]),
+                    ("network", config.subscription(local_rg_name),
+                     "local_network_gateways.get", local_rg_name,
+                     connection["local_gateway_name"])
+                ]
+        clients.read_all(reads)
+    except Exception as e:
+        print(f"Batched gateway reads skipped: {e}")
 
     # Iterate through each VNet and its subnets
     for gateway in config["vpn_gateways"]:
         for connection in gateway["connections"]:
+            resource_id = None
             try:
                 rg_name = gateway["resource_group"]
-                location = gateway["location"]
                 connection_name = connection["name"]
-                connection_type = connection["connection_type"]
                 gateway_name = gateway["name"]
                 remote_gateway = connection["local_gateway_name"]
-                dpd_timeout = connection["dpd_timeout_seconds"]
-                protocol_type = connection["protocol_type"]
-                shared_key = connection["shared_key"]
-                enable_bgp = connection["enable_bgp"]
-                ip_sec_policies = []
-
-                # Loop over each Resource Group to find the right subscription ID
-                for rg in config["resource_groups"]:
-                    if rg["resource_group"] == rg_name:
-                        subscription_id = rg["subscription_id"]
-                        break
-
-                if not subscription_id:
-                    raise Exception(f"Subscription ID not found for resource group: {rg_name}")
-
-                # Initialize management clients
-                resource_client = ResourceManagementClient(credential, subscription_id)
-                network_client = NetworkManagementClient(credential, subscription_id)
-
-                gateway_resource = network_client.virtual_network_gateways.get(
+
+                # Look up the subscription ID of the resource group
+                subscription_id = config.subscription(rg_name)
+                resource_id = network_id(subscription_id, rg_name, "connections", connection_name)
+
+                # Skip connections whose gateway failed to provision
+                gateway_result = gateway_results.get(
+                    config.resource_id("vpn_gateways", rg_name, gateway_name))
+                if gateway_result and gateway_result["status"] != "success":
+                    raise Exception(
+                        f"Virtual network gateway {gateway_name} failed: {gateway_result['reason']}")
+
+                # Reuse the shared network client for the subscription
+                network_client = clients.get("network", subscription_id)
+
+                gateway_resource = clients.read(
+                    "network", subscription_id, "virtual_network_gateways.get",
                     rg_name,
                     gateway_name
                 )
 
-                local_gateway_resource = network_client.local_network_gateways.get(
-                    rg_name,
+                # The local gateway may be defined in another resource group
+                local_rg_name = config.local_gateway(rg_name, remote_gateway)["resource_group"]
+                local_gateway_resource = clients.read(
+                    "network", config.subscription(local_rg_name), "local_network_gateways.get",
+                    local_rg_name,
                     remote_gateway
                 )
 
-                for policy in connection["ip_sec_policies"]:
-                    policy_dict = {
-                        "sa_life_time_seconds": policy["sa_life_time_seconds"],
-                        "sa_data_size_kilobytes": policy["sa_data_size_kilobytes"],
-                        "ipsec_encryption": policy["ipsec_encryption"],
-                        "ipsec_integrity": policy["ipsec_integrity"],
-                        "ike_encryption": policy["ike_encryption"],
-                        "ike_integrity": policy["ike_integrity"],
-                        "dh_group": policy["dh_group"]
-                    }
-
-                    ip_sec_policies.append(policy_dict)
-
                 # Check whether the resource group exists
-                rg_exists = resource_client.resource_groups.check_existence(rg_name)
+                rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
                 if not rg_exists:
                     result = {
@@ -103,7 +187,7 @@ def main():
                         "status": "failed",
                         "reason": "Resource group does not exist"
                     }
-                    output.append(result)
+                    journal.append(result, resource_id=resource_id)
                     continue
 
                 # Create or update the Virtual Network Gateway
@@ -111,24 +195,11 @@ def main():
                     network_client.virtual_network_gateway_connections.begin_create_or_update(
                         rg_name,
                         connection_name,
-                        {
-                            "location": location,
-                            "virtual_network_gateway1": gateway_resource,
-                            "local_network_gateway2": local_gateway_resource,
-                            "connection_type": connection_type,
-                            "dpd_timeout_seconds": dpd_timeout,
-                            "connection_protocol": protocol_type,
-                            "shared_key": shared_key,
-                            "enable_bgp": enable_bgp,
-                            "ipsec_policies": ip_sec_policies
-                        }
+                        connection_parameters(
+                            gateway, connection, gateway_resource, local_gateway_resource)
                     ).result()
 
-                result = {
-                    "vpn_connection_name": vpn_connection_result.name,
-                    "resource_group": rg_name,
-                    "status": "success"
-                }
+                result = connection_entry(rg_name, vpn_connection_result)
 
             except Exception as e:
                 # Capture error and report failure
@@ -139,12 +210,11 @@ def main():
                     "reason": str(e)
                 }
 
-            # Add result to the output list
-            output.append(result)
+            # Journal the result as soon as it is known
+            journal.append(result, resource_id=resource_id)
 
-    # Write results to JSON file
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
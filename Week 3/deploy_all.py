@@ -0,0 +1,295 @@
+"""
+deploy_all.py
+
+This script reads a JSON configuration file and deploys everything covered by the Week 3
+scripts in one process: public IPs, local network gateways, virtual network gateways and
+the VPN connections between them.
+
+Instead of running each script as a full stage, every resource becomes one operation in a
+dependency graph and starts as soon as the resources it needs are done:
+
+    public IP -> virtual network gateway -> connection <- local network gateway
+
+A gateway only waits for its own public IP (its GatewaySubnet comes from Week 1), and a
+connection only waits for its own two gateways. Gateways take 30-45 minutes each, so every
+operation is prioritized by the longest chain of durations behind it (durations.py): the
+public IPs of the gateways and then the gateways start first, and the gateway LROs
+overlap instead of queuing behind unrelated work. Each run adds its durations to
+--durations_file, and --estimate predicts the wall time from them before anything runs.
+
+Usage:
+    python deploy_all.py --input_file custom_input.json [--max_parallel 20] [--use_async]
+        [--plan | --skip_unchanged | --estimate] [--incremental]
+        [--resume RUN_ID]
+        [--durations_file durations.json]
+        [--inventory_file inventory.db] [--cache_ttl 900]
+        [--batch_endpoint [https://management.azure.com]]
+
+Requirements:
+    - Azure CLI logged in OR environment credentials configured
+    - 'azure-identity', 'azure-mgmt-resource', and 'azure-mgmt-network' libraries installed
+    - A valid JSON configuration file with the required structure
+"""
+
+# Import the needed credential and management objects from the libraries.
+import os
+import sys
+import argparse
+from functools import partial
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config
+from runner import execute_operations
+from deploy_state import DEFAULT_DEPLOY_STATE_FILE, open_deploy_state
+from journal import Journal
+from checkpoint import DEFAULT_CHECKPOINT_FILE, Checkpoint
+from durations import DEFAULT_DURATIONS_FILE, DurationHistory, report_estimate
+from inventory import DEFAULT_TTL, open_inventory
+from arm_batch import DEFAULT_ENDPOINT
+from create_public_ip import public_ip_parameters, public_ip_entry
+from create_local_network_gateway import local_gateway_parameters, local_gateway_entry
+from create_virtual_network_gateway import gateway_parameters, gateway_entry
+from create_vng_connection import connection_parameters, connection_entry
+
+def missing_rg(key, fields):
+    """
+    Build the precomputed failure for a resource whose resource group does not exist
+    """
+    return {"key": key, "result": {
+        **fields,
+        "status": "failed",
+        "reason": "Resource group does not exist"
+    }}
+
+def connection_local_gateway(gateway, connection, subscription_id, local_gateway,
+                             gateway_resource):
+    """
+    Build the operation that fetches the local network gateway of a connection
+    """
+    rg_name = gateway["resource_group"]
+    return {
+        "client_type": "network",
+        "subscription_id": local_gateway["subscription_id"],
+        "method": "local_network_gateways.get",
+        "args": [local_gateway["resource_group"], connection["local_gateway_name"]],
+        "fields": {"vpn_connection_name": connection["name"], "resource_group": rg_name},
+        "then": partial(
+            connection_create, gateway, connection, subscription_id, gateway_resource)
+    }
+
+def connection_create(gateway, connection, subscription_id, gateway_resource,
+                      local_gateway_resource):
+    """
+    Build the operation that creates a connection once both gateways are fetched
+    """
+    rg_name = gateway["resource_group"]
+    return {
+        "client_type": "network",
+        "subscription_id": subscription_id,
+        "method": "virtual_network_gateway_connections.begin_create_or_update",
+        "args": [
+            rg_name,
+            connection["name"],
+            connection_parameters(gateway, connection, gateway_resource, local_gateway_resource)
+        ],
+        "fields": {"vpn_connection_name": connection["name"], "resource_group": rg_name},
+        "success": partial(connection_entry, rg_name)
+    }
+
+def build_graph(config, clients):
+    """
+    Build the operation graph for every Week 3 resource in the checked input config
+    """
+    operations = []
+
+    # Public IPs have no dependencies in this graph
+    for ip in config.get("public_ips", []):
+        rg_name = ip["resource_group"]
+        public_ip_name = ip["name"]
+        ip_key = f"pip:{rg_name}/{public_ip_name}"
+        subscription_id = config.subscription(rg_name)
+        fields = {"public_ip_name": public_ip_name, "resource_group": rg_name}
+
+        if not clients.resource_group_exists(subscription_id, rg_name):
+            operations.append(missing_rg(ip_key, fields))
+            continue
+
+        operations.append({
+            "key": ip_key,
+            "client_type": "network",
+            "subscription_id": subscription_id,
+            "method": "public_ip_addresses.begin_create_or_update",
+            "args": [rg_name, public_ip_name, public_ip_parameters(ip)],
+            "fields": fields,
+            "success": partial(public_ip_entry, rg_name)
+        })
+
+    # Local network gateways have no dependencies in this graph
+    for local_gateway in config.get("local_network_gateways", []):
+        rg_name = local_gateway["resource_group"]
+        gateway_name = local_gateway["name"]
+        local_key = f"lgw:{rg_name}/{gateway_name}"
+        subscription_id = config.subscription(rg_name)
+        fields = {"local_gateway_name": gateway_name, "resource_group": rg_name}
+
+        if not clients.resource_group_exists(subscription_id, rg_name):
+            operations.append(missing_rg(local_key, fields))
+            continue
+
+        operations.append({
+            "key": local_key,
+            "client_type": "network",
+            "subscription_id": subscription_id,
+            "method": "local_network_gateways.begin_create_or_update",
+            "args": [rg_name, gateway_name, local_gateway_parameters(local_gateway)],
+            "fields": fields,
+            "success": partial(local_gateway_entry, rg_name)
+        })
+
+    # Virtual network gateways wait for their public IP
+    for gateway in config.get("vpn_gateways", []):
+        rg_name = gateway["resource_group"]
+        gateway_name = gateway["name"]
+        gateway_key = f"vgw:{rg_name}/{gateway_name}"
+        subscription_id = config.subscription(rg_name)
+        fields = {"vpn_gateway_name": gateway_name, "resource_group": rg_name}
+
+        if not clients.resource_group_exists(subscription_id, rg_name):
+            operations.append(missing_rg(gateway_key, fields))
+            continue
+
+        operations.append({
+            "key": gateway_key,
+            "depends_on": [f"pip:{rg_name}/{gateway['public_ip_name']}"],
+            "client_type": "network",
+            "subscription_id": subscription_id,
+            "method": "virtual_network_gateways.begin_create_or_update",
+            "args": [rg_name, gateway_name, gateway_parameters(config, gateway)],
+            "fields": fields,
+            "success": partial(gateway_entry, rg_name)
+        })
+
+    # Connections wait for both of their gateways, then fetch them and connect
+    for gateway in config.get("vpn_gateways", []):
+        rg_name = gateway["resource_group"]
+        subscription_id = config.subscription(rg_name)
+
+        for connection in gateway["connections"]:
+            # The local gateway may be defined in another resource group
+            local_rg_name = config.local_gateway(
+                rg_name, connection["local_gateway_name"])["resource_group"]
+            local_gateway = {
+                "resource_group": local_rg_name,
+                "subscription_id": config.subscription(local_rg_name)
+            }
+            operations.append({
+                "key": f"connection:{rg_name}/{connection['name']}",
+                "depends_on": [
+                    f"vgw:{rg_name}/{gateway['name']}",
+                    f"lgw:{local_rg_name}/{connection['local_gateway_name']}"
+                ],
+                "client_type": "network",
+                "subscription_id": subscription_id,
+                "method": "virtual_network_gateways.get",
+                "args": [rg_name, gateway["name"]],
+                "duration_group": "virtual_network_gateway_connections",
+                "fields": {"vpn_connection_name": connection["name"], "resource_group": rg_name},
+                "spec": {"vpn_gateway_name": gateway["name"], "connection": connection},
+                "then": partial(
+                    connection_local_gateway, gateway, connection, subscription_id, local_gateway)
+            })
+
+    return operations
+
+def main():
+    """
+    Main Loop
+    """
+
+    # Set up argument parser for dynamic input file
+    parser = argparse.ArgumentParser(
+        description="Deploy every Week 3 resource from a JSON config file in one run.")
+    parser.add_argument(
+        '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--max_parallel', type=int, default=20,
+        help='Maximum number of operations to run at the same time.')
+    parser.add_argument(
+        '--use_async', action='store_true',
+        help='Run the operations on the asyncio engine with the aio SDK clients.')
+    parser.add_argument(
+        '--plan', action='store_true',
+        help='Compare the input with live state and write the plan without changing anything.')
+    parser.add_argument(
+        '--skip_unchanged', action='store_true',
+        help='Only write the resources that are missing or differ from the input.')
+    parser.add_argument(
+        '--inventory_file', type=str, default=None,
+        help='SQLite inventory from prefetch_inventory.py; fresh entries answer reads instead of ARM.')
+    parser.add_argument(
+        '--cache_ttl', type=int, default=DEFAULT_TTL,
+        help='Seconds an inventory entry is trusted.')
+    parser.add_argument(
+        '--batch_endpoint', type=str, nargs='?', const=DEFAULT_ENDPOINT, default=None,
+        help='Send independent reads through ARM /batch (optionally at this endpoint, e.g. arm_stub_server.py).')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='Only apply the resources whose spec changed since the last run, without reading live state.')
+    parser.add_argument(
+        '--deploy_state', type=str, default=DEFAULT_DEPLOY_STATE_FILE,
+        help='State file with the spec hash and result of each applied resource.')
+    parser.add_argument(
+        '--estimate', action='store_true',
+        help='Predict the wall time of the run from past durations and write the schedule without changing anything.')
+    parser.add_argument(
+        '--durations_file', type=str, default=DEFAULT_DURATIONS_FILE,
+        help='History of operation durations used to start the critical path first.')
+    parser.add_argument(
+        '--resume', type=str, default=None,
+        help='Run ID (tail_journal.py --list) to resume: skip what succeeded and reattach to LROs in flight.')
+    parser.add_argument(
+        '--checkpoint_file', type=str, default=DEFAULT_CHECKPOINT_FILE,
+        help='SQLite checkpoint of the state of every operation, for --resume.')
+    args = parser.parse_args()
+
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Spec hashes and results of the last applied run, for --incremental
+    deploy_state = open_deploy_state(args.deploy_state, args.incremental)
+
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
+
+    # Operation states of this run, committed as they change, for --resume
+    checkpoint = Checkpoint(args.checkpoint_file, journal.run_id, resume=args.resume)
+
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry(
+        pool_size=max(args.max_parallel, 10),
+        inventory=open_inventory(args.inventory_file, args.cache_ttl),
+        batch_endpoint=args.batch_endpoint)
+
+    # Durations of past runs, to start the longest chains first and to estimate the run
+    durations = DurationHistory(args.durations_file)
+    operations = build_graph(config, clients)
+
+    if args.estimate:
+        total, entries = durations.estimate(operations, args.max_parallel)
+        report_estimate(total, entries, args.max_parallel)
+        journal.extend(entries)
+    else:
+        # Run the whole graph; each resource starts as soon as its dependencies succeed
+        execute_operations(
+            operations, args.max_parallel, clients, args.use_async,
+            plan=args.plan, skip_unchanged=args.skip_unchanged,
+            deploy_state=deploy_state, durations=durations, journal=journal,
+            checkpoint=checkpoint)
+
+    # Build output.json from the results journaled during the run
+    journal.write_output()
+
+if __name__ == "__main__":
+    main()
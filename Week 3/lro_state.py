@@ -0,0 +1,136 @@
+"""
+lro_state.py
+
+Saved continuation tokens for long-running operations (LROs) submitted without waiting.
+
+A virtual network gateway takes 30-45 minutes to provision, so blocking on .result() for
+each one keeps a terminal open for hours. With --no_wait the scripts submit the operation,
+save the poller's continuation token to a local state file and move on. collect_pending.py
+(or create_vng_connection.py --state_file) later rebuilds the pollers from the tokens and
+waits on all of them at the same time through runner.py.
+
+The state file maps the resource ID of each submitted resource to the call that rebuilds
+its poller:
+
+    {
+        "/subscriptions/.../virtualNetworkGateways/vgw-central-hub": {
+            "client_type": "network",
+            "subscription_id": subscription_id,
+            "method": "virtual_network_gateways.begin_create_or_update",
+            "args": [rg_name, gateway_name],
+            "fields": {"vpn_gateway_name": gateway_name, "resource_group": rg_name},
+            "continuation_token": "...",
+            "submitted_at": "2025-01-01T00:00:00+00:00"
+        }
+    }
+
+Usage:
+    save_pending(state_file, resource_id, operation, poller)
+    results = collect_pending(state_file, clients, resource_ids, max_parallel)
+"""
+
+import os
+import json
+from datetime import datetime, timezone
+from functools import partial
+from runner import execute_operations
+
+# State file used when the scripts are not given --state_file
+DEFAULT_STATE_FILE = "pending_operations.json"
+
+
+def load_pending(state_file):
+    """
+    Return the saved operations by resource ID, or an empty dict when there are none
+    """
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_pending(state_file, pending):
+    """
+    Write the saved operations back, removing the state file once nothing is pending
+    """
+    if not pending:
+        if os.path.exists(state_file):
+            os.remove(state_file)
+        return
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump(pending, f, indent=2)
+
+
+def save_pending(state_file, resource_id, operation, poller):
+    """
+    Save the continuation token of a submitted operation under its resource ID
+    """
+    pending = load_pending(state_file)
+    pending[resource_id] = {
+        "client_type": operation["client_type"],
+        "subscription_id": operation["subscription_id"],
+        "method": operation["method"],
+        "args": operation["args"],
+        "fields": operation["fields"],
+        "continuation_token": poller.continuation_token(),
+        "submitted_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
+    }
+    write_pending(state_file, pending)
+
+
+def collected_entry(saved, result):
+    """
+    Build the output entry for a saved operation that has finished
+    """
+    return {
+        **saved["fields"],
+        "provisioning_state": result.provisioning_state,
+        "submitted_at": saved["submitted_at"],
+        "status": "success"
+    }
+
+
+def resume_operation(saved):
+    """
+    Build the runner operation that rebuilds a saved poller and waits on it
+    """
+    # The SDK skips the initial request when given a continuation token, so the
+    # request body is not needed again
+    return {
+        "client_type": saved["client_type"],
+        "subscription_id": saved["subscription_id"],
+        "method": saved["method"],
+        "args": [*saved["args"], None],
+        "kwargs": {"continuation_token": saved["continuation_token"]},
+        "fields": {**saved["fields"], "submitted_at": saved["submitted_at"]},
+        "success": partial(collected_entry, saved)
+    }
+
+
+def collect_pending(state_file, clients, resource_ids=None, max_parallel=None, use_async=False,
+                    journal=None):
+    """
+    Wait on the saved operations (all, or only resource_ids) and return results by resource ID
+    """
+    pending = load_pending(state_file)
+    selected = [
+        resource_id for resource_id in pending
+        if resource_ids is None or resource_id in resource_ids
+    ]
+    if not selected:
+        return {}
+
+    # Every poller is independent, so by default all of them are resumed together
+    output = execute_operations(
+        [resume_operation(pending[resource_id]) for resource_id in selected],
+        max_parallel or len(selected), clients, use_async, journal=journal)
+
+    # Finished operations leave the state file; failed ones stay so a poll that failed
+    # on a transient error can be collected again (resubmitting the resource replaces them)
+    pending = load_pending(state_file)
+    for resource_id, result in zip(selected, output):
+        if result.get("status") == "success":
+            pending.pop(resource_id, None)
+    write_pending(state_file, pending)
+
+    return dict(zip(selected, output))
@@ -0,0 +1,782 @@
+"""
+compile_template.py
+
+This script reads a JSON configuration file and compiles everything the Week 1-4 scripts
+deploy into one ARM template per subscription: resource groups, VNets with their subnets,
+NSGs and route tables, peerings, private DNS zones and their VNet links, public IPs,
+local and virtual network gateways, VPN connections and load balancers.
+
+The scripts send one create_or_update per resource and wait on each LRO from the client.
+A template is submitted once and ARM deploys its resources server-side, in parallel and
+in the order given by their dependsOn edges, so a full lab is one deployment per
+subscription instead of hundreds of round trips.
+
+Each subscription template creates its resource groups and deploys into each of them
+through nested deployments. Every resource references other resources by their full
+resource ID (resolved by config_model.py) and depends on the ones in the same deployment.
+Resources that reference another resource group (peerings, DNS links to a remote VNet,
+cross-region backend pools) go into a second "-links" deployment of their resource group,
+which waits for the deployments holding what they reference. References to another
+subscription are kept as IDs but cannot be ordered; rerun the deployment if one of them
+was not there yet.
+
+Shared keys of VPN connections are secure parameters, filled in from the input file at
+submit time, so they are neither written to the template files nor kept in the deployment
+history. The NIC updates of create_load_balancer.py are not part of the template: the
+regional backend pools hold the backend IP addresses instead.
+
+The templates are written to --template_dir, one <subscription ID>.json per subscription.
+With --check nothing is written: the compiled templates are compared with the files
+already there (templates/ holds the ones compiled from inputs-example.json) and every
+difference is printed. With --deploy the templates are also submitted.
+
+Usage:
+    python compile_template.py --input_file custom_input.json [--template_dir templates]
+        [--check | --deploy] [--deployment_name az700-lab]
+
+Requirements:
+    - Azure CLI logged in OR environment credentials configured (--deploy only)
+    - 'azure-identity', 'azure-mgmt-resource', 'azure-mgmt-network', and 'azure-mgmt-privatedns' libraries installed
+    - A valid JSON configuration file with the required structure
+"""
+
+# Import the needed credential and management objects from the libraries.
+import os
+import re
+import sys
+import json
+import difflib
+import argparse
+from functools import partial
+
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from config_model import load_config
+from journal import Journal
+
+# API versions of the resource types in the templates
+NETWORK_API_VERSION = "2023-09-01"
+PRIVATE_DNS_API_VERSION = "2020-06-01"
+RESOURCES_API_VERSION = "2022-09-01"
+
+SUBSCRIPTION_SCHEMA = \
+    "https://schema.management.azure.com/schemas/2018-05-01/subscriptionDeploymentTemplate.json#"
+RESOURCE_GROUP_SCHEMA = \
+    "https://schema.management.azure.com/schemas/2019-04-01/deploymentTemplate.json#"
+
+# Suffixes of the nested deployments of each resource group
+RESOURCES_TIER = "resources"
+LINKS_TIER = "links"
+
+# NSG rule fields that take either one value ("*") or a list
+RULE_RANGES = [
+    ("source_address_prefixes", "sourceAddressPrefix", "sourceAddressPrefixes"),
+    ("source_port_ranges", "sourcePortRange", "sourcePortRanges"),
+    ("destination_address_prefixes", "destinationAddressPrefix", "destinationAddressPrefixes"),
+    ("destination_port_ranges", "destinationPortRange", "destinationPortRanges")
+]
+
+def flag(value):
+    """
+    Read a boolean from the input file, where it may be written as "True" or "False"
+    """
+    if isinstance(value, str):
+        return value.lower() == "true"
+    return bool(value)
+
+def top_level_id(resource_id):
+    """
+    Strip the child segments of a resource ID, e.g. a subnet ID down to its VNet
+    """
+    return "/".join(resource_id.split("/")[:9])
+
+def resource_scope(resource_id):
+    """
+    Return the (subscription ID, resource group) of a resource ID, lower-cased
+    """
+    parts = resource_id.lower().split("/")
+    return parts[2], parts[4]
+
+def template_resource(config, rg_name, resource_type, name, body, references=(), parameters=()):
+    """
+    Wrap an ARM resource with its resource ID and the resource IDs it references
+    """
+    subscription_id = config.subscription(rg_name)
+    provider, *types = resource_type.split("/")
+    names = name.split("/")
+    resource_id = f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}" \
+        f"/providers/{provider}" + "".join(f"/{t}/{n}" for t, n in zip(types, names))
+
+    # A child resource always waits for its parent
+    if len(names) > 1:
+        references = [resource_id.rsplit("/", 2)[0], *references]
+
+    api_version = PRIVATE_DNS_API_VERSION if types[0] == "privateDnsZones" \
+        else NETWORK_API_VERSION
+    return {
+        "id": resource_id,
+        "subscription_id": subscription_id,
+        "resource_group": rg_name,
+        "references": list(references),
+        "parameters": list(parameters),
+        "resource": {"type": resource_type, "apiVersion": api_version, "name": name, **body}
+    }
+
+def security_rule(rule):
+    """
+    Convert an NSG rule from the input JSON into an ARM security rule
+    """
+    properties = {
+        "description": rule["description"],
+        "direction": rule["direction"],
+        "priority": int(rule["priority"]),
+        "protocol": rule["protocol"],
+        "access": rule["action"]
+    }
+
+    # Normalize address/port prefixes
+    for field, single, plural in RULE_RANGES:
+        if rule[field] == ["*"]:
+            properties[single] = "*"
+        else:
+            properties[plural] = rule[field]
+
+    return {"name": rule["name"], "properties": properties}
+
+def route_table_properties(subnet):
+    """
+    Build the properties of the route table of a subnet
+    """
+    routes = []
+    for route in subnet.get("routes", []):
+        route_properties = {
+            "addressPrefix": route["address_prefix"],
+            "nextHopType": route["next_hop_type"]
+        }
+        if route.get("next_hop_ip_address"):
+            route_properties["nextHopIpAddress"] = route["next_hop_ip_address"]
+        routes.append({"name": route["name"], "properties": route_properties})
+
+    return {
+        "disableBgpRoutePropagation": flag(subnet.get("disable_bgp_propagation", False)),
+        "routes": routes
+    }
+
+def vnet_resources(config, vnet):
+    """
+    Compile a VNet with its subnets, plus the NSGs and route tables of the subnets
+    """
+    rg_name = vnet["resource_group"]
+    location = vnet["location"]
+    resources = []
+    subnets = []
+    references = []
+
+    for subnet in vnet["subnets"]:
+        subnet_properties = {"addressPrefix": subnet["subnet_prefix"]}
+
+        # NSGs and route tables are deployed once, even when several subnets share them
+        if subnet.get("nsg_name"):
+            nsg_id = config.resource_id("nsgs", rg_name, subnet["nsg_name"])
+            subnet_properties["networkSecurityGroup"] = {"id": nsg_id}
+            if config.find("nsgs", rg_name, subnet["nsg_name"]) is subnet:
+                resources.append(template_resource(
+                    config, rg_name, "Microsoft.Network/networkSecurityGroups",
+                    subnet["nsg_name"], {
+                        "location": location,
+                        "properties": {
+                            "securityRules": [security_rule(r) for r in subnet["nsg_rules"]]
+                        }
+                    }))
+            references.append(nsg_id)
+
+        if subnet.get("route_table_name"):
+            route_table_id = config.resource_id("route_tables", rg_name, subnet["route_table_name"])
+            subnet_properties["routeTable"] = {"id": route_table_id}
+            if config.find("route_tables", rg_name, subnet["route_table_name"]) is subnet:
+                resources.append(template_resource(
+                    config, rg_name, "Microsoft.Network/routeTables",
+                    subnet["route_table_name"], {
+                        "location": location,
+                        "properties": route_table_properties(subnet)
+                    }))
+            references.append(route_table_id)
+
+        subnets.append({"name": subnet["subnet_name"], "properties": subnet_properties})
+
+    # Subnets are part of the VNet body, so a redeploy never removes them
+    resources.append(template_resource(
+        config, rg_name, "Microsoft.Network/virtualNetworks", vnet["vnet_name"], {
+            "location": location,
+            "properties": {
+                "addressSpace": {"addressPrefixes": [vnet["address_space"]]},
+                "subnets": subnets
+            }
+        }, references))
+
+    for peering in vnet.get("peerings", []):
+        settings = peering["peering_settings"]
+        remote_vnet_id = config.vnet_id(settings["remote_virtual_network"])
+        resources.append(template_resource(
+            config, rg_name, "Microsoft.Network/virtualNetworks/virtualNetworkPeerings",
+            f"{vnet['vnet_name']}/{peering['peering_name']}", {
+                "properties": {
+                    "remoteVirtualNetwork": {"id": remote_vnet_id},
+                    "allowVirtualNetworkAccess":
+                        flag(settings.get("allow_virtual_network_access", True)),
+                    "allowForwardedTraffic": flag(settings.get("allow_forwarded_traffic", False)),
+                    "allowGatewayTransit": flag(settings.get("allow_gateway_transit", False)),
+                    "useRemoteGateways": flag(settings.get("use_remote_gateways", False))
+                }
+            }, [remote_vnet_id]))
+
+    return resources
+
+def dns_zone_resources(config, zone):
+    """
+    Compile a private DNS zone and its VNet links
+    """
+    rg_name = zone["resource_group"]
+    zone_name = zone["private_zone_name"]
+    resources = [template_resource(
+        config, rg_name, "Microsoft.Network/privateDnsZones", zone_name, {"location": "global"})]
+
+    for link in zone["virtual_network_links"]:
+        vnet_id = config.vnet_id(link["vnet_name"])
+        resources.append(template_resource(
+            config, rg_name, "Microsoft.Network/privateDnsZones/virtualNetworkLinks",
+            f"{zone_name}/{link['link_name']}", {
+                "location": "global",
+                "properties": {
+                    "registrationEnabled": flag(link["registration_enabled"]),
+                    "virtualNetwork": {"id": vnet_id}
+                }
+            }, [vnet_id]))
+
+    return resources
+
+def public_ip_resource(config, ip):
+    """
+    Compile a public IP address
+    """
+    return template_resource(
+        config, ip["resource_group"], "Microsoft.Network/publicIPAddresses", ip["name"], {
+            "location": ip["location"],
+            "sku": {"name": ip["sku"], "tier": ip["tier"]},
+            "properties": {
+                "publicIPAllocationMethod": ip["allocation_method"],
+                "publicIPAddressVersion": ip["version"]
+            }
+        })
+
+def local_gateway_resource(config, gateway):
+    """
+    Compile a local network gateway
+    """
+    return template_resource(
+        config, gateway["resource_group"], "Microsoft.Network/localNetworkGateways",
+        gateway["name"], {
+            "location": gateway["location"],
+            "properties": {
+                "gatewayIpAddress": gateway["ip_address"],
+                "localNetworkAddressSpace": {"addressPrefixes": gateway["address_prefixes"]}
+            }
+        })
+
+def shared_key_parameter(connection):
+    """
+    Name the secure template parameter that carries the shared key of a connection
+    """
+    return "sharedKey_" + re.sub(r"\W", "_", connection["name"])
+
+def gateway_resources(config, gateway):
+    """
+    Compile a virtual network gateway and its connections
+    """
+    rg_name = gateway["resource_group"]
+    subnet_id = config.subnet_id(gateway["vnet_name"], gateway["subnet_name"])
+    public_ip_id = config.resource_id("public_ips", rg_name, gateway["public_ip_name"])
+    gateway_id = config.resource_id("vpn_gateways", rg_name, gateway["name"])
+
+    resources = [template_resource(
+        config, rg_name, "Microsoft.Network/virtualNetworkGateways", gateway["name"], {
+            "location": gateway["location"],
+            "properties": {
+                "ipConfigurations": [{
+                    "name": "Default",
+                    "properties": {
+                        "subnet": {"id": subnet_id},
+                        "publicIPAddress": {"id": public_ip_id}
+                    }
+                }],
+                "gatewayType": gateway["gateway_type"],
+                "vpnType": gateway["vpn_type"],
+                "activeActive": flag(gateway["enable_active_active"]),
+                "sku": {"name": gateway["sku"], "tier": gateway["sku"]}
+            }
+        }, [subnet_id, public_ip_id])]
+
+    for connection in gateway.get("connections", []):
+        local_gateway_id = config.local_gateway_id(rg_name, connection["local_gateway_name"])
+        ipsec_policies = [{
+            "saLifeTimeSeconds": int(policy["sa_life_time_seconds"]),
+            "saDataSizeKilobytes": int(policy["sa_data_size_kilobytes"]),
+            "ipsecEncryption": policy["ipsec_encryption"],
+            "ipsecIntegrity": policy["ipsec_integrity"],
+            "ikeEncryption": policy["ike_encryption"],
+            "ikeIntegrity": policy["ike_integrity"],
+            "dhGroup": policy["dh_group"],
+            "pfsGroup": policy.get("pfs_group", "None")
+        } for policy in connection["ip_sec_policies"]]
+
+        parameter = shared_key_parameter(connection)
+        resources.append(template_resource(
+            config, rg_name, "Microsoft.Network/connections", connection["name"], {
+                "location": gateway["location"],
+                "properties": {
+                    "virtualNetworkGateway1": {"id": gateway_id},
+                    "localNetworkGateway2": {"id": local_gateway_id},
+                    "connectionType": connection["connection_type"],
+                    "dpdTimeoutSeconds": int(connection["dpd_timeout_seconds"]),
+                    "connectionProtocol": connection["protocol_type"],
+                    "sharedKey": f"[parameters('{parameter}')]",
+                    "enableBgp": flag(connection["enable_bgp"]),
+                    "ipsecPolicies": ipsec_policies
+                }
+            }, [gateway_id, local_gateway_id], [parameter]))
+
+    return resources
+
+def backend_address(config, address):
+    """
+    Convert a backend address from the input JSON into an ARM backend address, plus the
+    resource ID it references
+    """
+    if "backend_load_balancer_rg" in address:
+        frontend_id = config.resource_id(
+            "load_balancers", address["backend_load_balancer_rg"],
+            address["backend_load_balancer_name"]) \
+            + f"/frontendIPConfigurations/{address['backend_load_balancer_frontend_ip_name']}"
+        return {
+            "name": address["name"],
+            "properties": {"loadBalancerFrontendIPConfiguration": {"id": frontend_id}}
+        }, frontend_id
+
+    vnet_id = config.vnet_id(address["vnet_name"])
+    return {
+        "name": address["name"],
+        "properties": {
+            "virtualNetwork": {"id": vnet_id},
+            "subnet": {"id": config.subnet_id(address["vnet_name"], address["subnet_name"])},
+            "ipAddress": address["ip_address"]
+        }
+    }, vnet_id
+
+def load_balancer_resources(config, load_balancer):
+    """
+    Compile a load balancer, plus the backend pools of a cross-region load balancer
+    """
+    rg_name = load_balancer["resource_group"]
+    load_balancer_name = load_balancer["name"]
+    load_balancer_id = config.resource_id("load_balancers", rg_name, load_balancer_name)
+    cross_region = load_balancer["tier"] == "Global"
+    references = []
+
+    # Frontend in a subnet, or on a public IP
+    frontend_name = load_balancer["frontend_name"]
+    frontend_id = f"{load_balancer_id}/frontendIPConfigurations/{frontend_name}"
+    if load_balancer["type"] == "private":
+        subnet_id = config.subnet_id(load_balancer["vnet_name"], load_balancer["subnet_name"])
+        frontend_properties = {
+            "subnet": {"id": subnet_id},
+            "privateIPAllocationMethod": load_balancer["private_ip_allocation_method"],
+            "privateIPAddress": load_balancer["ip_address"]
+        }
+        references.append(subnet_id)
+    else:
+        public_ip_id = config.resource_id("public_ips", rg_name, load_balancer["public_ip_name"])
+        frontend_properties = {"publicIPAddress": {"id": public_ip_id}}
+        references.append(public_ip_id)
+
+    # Backend pools hold their IP addresses; a cross-region pool is filled in once the
+    # load balancer exists, as create_load_balancer.py does
+    pools = []
+    pool_resources = []
+    for backend_pool in load_balancer["backend_pools"]:
+        addresses = []
+        address_references = []
+        for address in backend_pool["backend_addresses"]:
+            address_config, referenced_id = backend_address(config, address)
+            addresses.append(address_config)
+            address_references.append(referenced_id)
+
+        if cross_region:
+            pools.append({"name": backend_pool["name"]})
+            pool_resources.append(template_resource(
+                config, rg_name, "Microsoft.Network/loadBalancers/backendAddressPools",
+                f"{load_balancer_name}/{backend_pool['name']}",
+                {"properties": {"loadBalancerBackendAddresses": addresses}},
+                address_references))
+        else:
+            pools.append({
+                "name": backend_pool["name"],
+                "properties": {"loadBalancerBackendAddresses": addresses}
+            })
+            references.extend(address_references)
+
+    probes = [{
+        "name": probe["name"],
+        "properties": {
+            "protocol": probe["protocol"],
+            "port": int(probe["port"]),
+            "intervalInSeconds": int(probe["interval"])
+        }
+    } for probe in load_balancer.get("health_probes", [])]
+
+    # Rules use the last backend pool and probe of the input, as create_load_balancer.py does
+    backend_pool_id = f"{load_balancer_id}/backendAddressPools/{pools[-1]['name']}"
+    rules = []
+    for rule in load_balancer["load_balancing_rules"]:
+        rule_properties = {
+            "frontendIPConfiguration": {"id": frontend_id},
+            "backendAddressPools": [{"id": backend_pool_id}],
+            "protocol": rule["protocol"],
+            "loadDistribution": rule["load_distribution"],
+            "frontendPort": int(rule["frontend_port"]),
+            "backendPort": int(rule["backend_port"]),
+            "idleTimeoutInMinutes": int(rule["idle_timeout"]),
+            "enableFloatingIP": flag(rule["floating_ip"])
+        }
+        if probes:
+            rule_properties["probe"] = {
+                "id": f"{load_balancer_id}/probes/{probes[-1]['name']}"
+            }
+        if "tcp_reset" in rule:
+            rule_properties["enableTcpReset"] = flag(rule["tcp_reset"])
+        if "disable_outbound_snat" in rule:
+            rule_properties["disableOutboundSnat"] = flag(rule["disable_outbound_snat"])
+        rules.append({"name": rule["name"], "properties": rule_properties})
+
+    outbound_rules = [{
+        "name": nat_rule["name"],
+        "properties": {
+            "allocatedOutboundPorts": int(nat_rule["allocated_outbound_ports"]),
+            "frontendIPConfigurations": [{"id": frontend_id}],
+            "backendAddressPool": {"id": backend_pool_id},
+            "protocol": nat_rule["protocol"],
+            "enableTcpReset": flag(nat_rule["tcp_reset"]),
+            "idleTimeoutInMinutes": int(nat_rule["idle_timeout"])
+        }
+    } for nat_rule in load_balancer.get("outbound_nat_rules", [])]
+
+    properties = {
+        "frontendIPConfigurations": [{"name": frontend_name, "properties": frontend_properties}],
+        "backendAddressPools": pools
+    }
+    if probes:
+        properties["probes"] = probes
+    properties["loadBalancingRules"] = rules
+    if outbound_rules:
+        properties["outboundRules"] = outbound_rules
+
+    return [template_resource(
+        config, rg_name, "Microsoft.Network/loadBalancers", load_balancer_name, {
+            "location": load_balancer["location"],
+            "sku": {"name": load_balancer["sku"], "tier": load_balancer["tier"]},
+            "properties": properties
+        }, references)] + pool_resources
+
+def compile_resources(config):
+    """
+    Compile every resource-group-level resource in the checked input config
+    """
+    resources = []
+    for vnet in config.get("vnets", []):
+        resources.extend(vnet_resources(config, vnet))
+    for zone in config.get("private_dns_zones", []):
+        resources.extend(dns_zone_resources(config, zone))
+    for ip in config.get("public_ips", []):
+        resources.append(public_ip_resource(config, ip))
+    for gateway in config.get("local_network_gateways", []):
+        resources.append(local_gateway_resource(config, gateway))
+    for gateway in config.get("vpn_gateways", []):
+        resources.extend(gateway_resources(config, gateway))
+    for load_balancer in config.get("load_balancers", []):
+        resources.extend(load_balancer_resources(config, load_balancer))
+    return resources
+
+def assign_tiers(resources):
+    """
+    Put every resource that references another resource group, or a resource in a links
+    deployment, in the links deployment of its own resource group
+    """
+    by_id = {resource["id"].lower(): resource for resource in resources}
+    for resource in resources:
+        resource["tier"] = RESOURCES_TIER
+
+    changed = True
+    while changed:
+        changed = False
+        for resource in resources:
+            if resource["tier"] == LINKS_TIER:
+                continue
+            scope = resource_scope(resource["id"])
+            for reference in resource["references"]:
+                target = by_id.get(top_level_id(reference).lower()) or by_id.get(reference.lower())
+                if resource_scope(reference) != scope or \
+                        (target and target["tier"] == LINKS_TIER):
+                    resource["tier"] = LINKS_TIER
+                    changed = True
+                    break
+
+    return by_id
+
+def deployment_name(rg_name, tier):
+    """
+    Name the nested deployment of one tier of a resource group
+    """
+    return f"{rg_name}-{tier}"
+
+def nested_deployment(rg_name, tier, members, by_id):
+    """
+    Build the nested deployment of one tier of a resource group
+    """
+    name = deployment_name(rg_name, tier)
+    member_ids = {member["id"].lower() for member in members}
+    depends_on = [f"[resourceId('Microsoft.Resources/resourceGroups', '{rg_name}')]"]
+    inner_resources = []
+    parameters = []
+
+    for member in members:
+        inner_depends_on = []
+        for reference in member["references"]:
+            target = by_id.get(reference.lower()) or by_id.get(top_level_id(reference).lower())
+            if target is None:
+                continue
+
+            # Same deployment: a dependsOn edge; another deployment of this subscription:
+            # wait for that whole deployment
+            if target["id"].lower() in member_ids:
+                if target["id"] not in inner_depends_on:
+                    inner_depends_on.append(target["id"])
+            elif target["subscription_id"].lower() == member["subscription_id"].lower():
+                dependency = f"[resourceId('{target['resource_group']}', " \
+                    f"'Microsoft.Resources/deployments', " \
+                    f"'{deployment_name(target['resource_group'], target['tier'])}')]"
+                if dependency not in depends_on:
+                    depends_on.append(dependency)
+
+        resource = dict(member["resource"])
+        if inner_depends_on:
+            resource["dependsOn"] = inner_depends_on
+        inner_resources.append(resource)
+        parameters.extend(p for p in member["parameters"] if p not in parameters)
+
+    secure_parameters = {parameter: {"type": "securestring"} for parameter in parameters}
+    return {
+        "type": "Microsoft.Resources/deployments",
+        "apiVersion": RESOURCES_API_VERSION,
+        "name": name,
+        "resourceGroup": rg_name,
+        "dependsOn": depends_on,
+        "properties": {
+            "mode": "Incremental",
+            "expressionEvaluationOptions": {"scope": "inner"},
+            "parameters": {
+                parameter: {"value": f"[parameters('{parameter}')]"} for parameter in parameters
+            },
+            "template": {
+                "$schema": RESOURCE_GROUP_SCHEMA,
+                "contentVersion": "1.0.0.0",
+                "parameters": secure_parameters,
+                "resources": inner_resources
+            }
+        }
+    }, secure_parameters
+
+def compile_templates(config):
+    """
+    Compile the checked input config into one subscription-level template per subscription
+    """
+    resources = compile_resources(config)
+    by_id = assign_tiers(resources)
+    templates = {}
+
+    for rg in config["resource_groups"]:
+        rg_name = rg["resource_group"]
+        template = templates.setdefault(rg["subscription_id"], {
+            "$schema": SUBSCRIPTION_SCHEMA,
+            "contentVersion": "1.0.0.0",
+            "parameters": {},
+            "resources": []
+        })
+        template["resources"].append({
+            "type": "Microsoft.Resources/resourceGroups",
+            "apiVersion": RESOURCES_API_VERSION,
+            "name": rg_name,
+            "location": rg["location"]
+        })
+
+    # Nested deployments follow the resource groups, resources tier first
+    for tier in (RESOURCES_TIER, LINKS_TIER):
+        for rg in config["resource_groups"]:
+            rg_name = rg["resource_group"]
+            members = [
+                resource for resource in resources
+                if resource["resource_group"].lower() == rg_name.lower()
+                and resource["tier"] == tier
+            ]
+            if not members:
+                continue
+
+            deployment, secure_parameters = nested_deployment(rg_name, tier, members, by_id)
+            template = templates[rg["subscription_id"]]
+            template["parameters"].update(secure_parameters)
+            template["resources"].append(deployment)
+
+    return templates
+
+def secure_values(config):
+    """
+    Return the values of the secure template parameters, taken from the input file
+    """
+    return {
+        shared_key_parameter(connection): {"value": connection["shared_key"]}
+        for gateway in config.get("vpn_gateways", [])
+        for connection in gateway.get("connections", [])
+    }
+
+def template_text(template):
+    """
+    Render a template the way the template files are written
+    """
+    return json.dumps(template, indent=2) + "\n"
+
+def template_path(template_dir, subscription_id):
+    """
+    Return the file path of the template of a subscription
+    """
+    return os.path.join(template_dir, f"{subscription_id}.json")
+
+def check_templates(templates, template_dir):
+    """
+    Compare the compiled templates with the files in the template directory
+    """
+    differences = 0
+    for subscription_id, template in templates.items():
+        path = template_path(template_dir, subscription_id)
+        if not os.path.exists(path):
+            print(f"{path}: missing")
+            differences += 1
+            continue
+
+        with open(path, 'r', encoding='utf-8') as f:
+            expected = f.read()
+        diff = list(difflib.unified_diff(
+            expected.splitlines(keepends=True), template_text(template).splitlines(keepends=True),
+            fromfile=path, tofile="compiled"))
+        if diff:
+            print("".join(diff), end="")
+            differences += 1
+
+    if differences:
+        raise Exception(f"{differences} template(s) differ from the files in {template_dir}")
+    print(f"{len(templates)} template(s) match the files in {template_dir}")
+
+def deployment_entry(subscription_id, deployment_result):
+    """
+    Build the output entry for a finished subscription deployment
+    """
+    return {
+        "deployment_name": deployment_result.name,
+        "subscription_id": subscription_id,
+        "provisioning_state": deployment_result.properties.provisioning_state,
+        "status": "success"
+    }
+
+def deploy_templates(config, templates, name, journal=None):
+    """
+    Submit one deployment per subscription, all at the same time
+    """
+    # Imported here so that compiling and checking work without the Azure SDK
+    from clients import ClientRegistry
+    from runner import execute_operations
+
+    parameters = secure_values(config)
+    operations = []
+    for subscription_id, template in templates.items():
+        location = next(
+            rg["location"] for rg in config["resource_groups"]
+            if rg["subscription_id"] == subscription_id)
+        operations.append({
+            "client_type": "resource",
+            "subscription_id": subscription_id,
+            "method": "deployments.begin_create_or_update_at_subscription_scope",
+            "args": [name, {
+                "location": location,
+                "properties": {
+                    "mode": "Incremental",
+                    "template": template,
+                    "parameters": {p: parameters[p] for p in template["parameters"]}
+                }
+            }],
+            "fields": {"deployment_name": name, "subscription_id": subscription_id},
+            "success": partial(deployment_entry, subscription_id)
+        })
+
+    clients = ClientRegistry()
+    return execute_operations(operations, len(operations), clients, journal=journal)
+
+def main():
+    """
+    Main Loop
+    """
+
+    # Set up argument parser for dynamic input file
+    parser = argparse.ArgumentParser(
+        description="Compile a JSON config file into one ARM template per subscription.")
+    parser.add_argument(
+        '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--template_dir', type=str, default='templates',
+        help='Directory of the <subscription ID>.json template files.')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        '--check', action='store_true',
+        help='Compare the compiled templates with the files in --template_dir instead of writing them.')
+    mode.add_argument(
+        '--deploy', action='store_true',
+        help='Also submit one deployment per subscription.')
+    parser.add_argument(
+        '--deployment_name', type=str, default='az700-lab',
+        help='Name of the subscription deployments.')
+    args = parser.parse_args()
+
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    templates = compile_templates(config)
+
+    if args.check:
+        check_templates(templates, args.template_dir)
+        return
+
+    # Write one template file per subscription
+    os.makedirs(args.template_dir, exist_ok=True)
+    for subscription_id, template in templates.items():
+        with open(template_path(args.template_dir, subscription_id), 'w', encoding='utf-8') as f:
+            f.write(template_text(template))
+    print(f"Wrote {len(templates)} template(s) to {args.template_dir}")
+
+    if not args.deploy:
+        return
+
+    # Submit the templates, journaling each deployment as it finishes
+    journal = Journal()
+    deploy_templates(config, templates, args.deployment_name, journal)
+
+    # Build output.json from the results journaled during the run
+    journal.write_output()
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,18 @@ create_load_balancer.py
 This script reads a JSON configuration file that defines an Azure Load
 Balancer and deploys it to specified vnet and subnet.
 
+Backend NICs are found through an index of (subnet, private IP) -> (NIC, IP
+configuration) built with one paged NIC listing per resource group (or per subscription
+with --index_all_nics); the same private IP in two subnets never matches the wrong NIC.
+Once every load balancer exists, each NIC is updated once with all of its backend pools,
+and the NIC updates run in parallel. With --skip_unchanged a NIC whose IP configurations
+are already in exactly those pools is not written again. With --inventory_file the NIC
+listings are answered from a prefetched inventory.
+
 Usage:
-    python create_load_balancer.py --input_file custom_input.json
+    python create_load_balancer.py --input_file custom_input.json [--max_parallel 10]
+        [--use_async] [--index_all_nics] [--skip_unchanged]
+        [--inventory_file inventory.db] [--cache_ttl 900]
 
 Requirements:
     - Azure CLI logged in OR environment credentials configured
@@ -14,15 +24,120 @@ Requirements:
 """
 
 # Import the needed credential and management objects from the libraries.
-import json
+import os
+import sys
 import argparse
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.network import NetworkManagementClient
+from functools import partial
 from azure.mgmt.network.models import \
     SubResource, FrontendIPConfiguration, LoadBalancerSku, \
     BackendAddressPool, LoadBalancerBackendAddress, LoadBalancingRule, Probe, OutboundRule
 
+# Helper modules shared by every week (runner.py, clients.py, ...) live in ../shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+from clients import ClientRegistry
+from config_model import load_config
+from journal import Journal
+from runner import execute_operations
+from inventory import DEFAULT_TTL, open_inventory
+
+def index_nics(clients, subscription_id, rg_name=None):
+    """
+    Map every (subnet ID, private IP) to its NIC and IP configuration with one NIC listing
+    """
+    index = {}
+    for nic in clients.list_resources("network", subscription_id, "network_interfaces", rg_name):
+        for ip_config in nic.ip_configurations or []:
+            if not ip_config.private_ip_address or not ip_config.subnet:
+                continue
+            key = (ip_config.subnet.id.lower(), ip_config.private_ip_address)
+
+            # Two NICs with one address in one subnet are ambiguous; None marks the key
+            if key in index and (index[key] is None or index[key][0].id != nic.id):
+                index[key] = None
+            else:
+                index[key] = (nic, ip_config)
+    return index
+
+def add_backend_nics(nic_updates, nic_indexes, clients, config, subscription_id, rg_name,
+                     backend_pool, backend_pool_id, index_all_nics, unmatched):
+    """
+    Record the backend pool on the NIC IP configuration of every backend address
+    """
+    # Build the index once per resource group, or once per subscription
+    scope = (subscription_id, None if index_all_nics else rg_name)
+    if scope not in nic_indexes:
+        nic_indexes[scope] = index_nics(clients, subscription_id, scope[1])
+
+    for backend_address in backend_pool["backend_addresses"]:
+        ip_address = backend_address["ip_address"]
+        subnet_id = config.subnet_id(backend_address["vnet_name"], backend_address["subnet_name"])
+        key = (subnet_id.lower(), ip_address)
+        if nic_indexes[scope].get(key) is None:
+            unmatched.append({
+                "backend_address_name": backend_address["name"],
+                "ip_address": ip_address,
+                "subnet_name": backend_address["subnet_name"],
+                "status": "failed",
+                "reason": "Several NICs found with this private IP address in the subnet"
+                if key in nic_indexes[scope]
+                else "No NIC found with this private IP address in the subnet"
+            })
+            continue
+
+        # Group by NIC so each NIC is written once with all of its pools
+        nic, ip_config = nic_indexes[scope][key]
+        update = nic_updates.setdefault(
+            nic.id, {"nic": nic, "subscription_id": subscription_id, "pools": {}})
+        update["pools"].setdefault(ip_config.name, []).append(backend_pool_id)
+
+def nic_entry(rg_name, nic_result):
+    """
+    Build the output entry for a NIC added to its backend pools
+    """
+    return {
+        "nic_name": nic_result.name,
+        "resource_group": rg_name,
+        "status": "success"
+    }
+
+def nic_operation(update, skip_unchanged=False):
+    """
+    Build the NIC update that sets the backend pools of its IP configurations in one PUT
+    """
+    nic = update["nic"]
+    nic_rg = nic.id.split("/")[4]
+
+    # The indexed NIC is live state, so an unchanged NIC is found without another read
+    if skip_unchanged and all(
+            {pool.id.lower() for pool in ip_config.load_balancer_backend_address_pools or []}
+            == {pool_id.lower() for pool_id in update["pools"][ip_config.name]}
+            for ip_config in nic.ip_configurations if ip_config.name in update["pools"]):
+        return {"result": {**nic_entry(nic_rg, nic), "action": "unchanged"}}
+
+    for ip_config in nic.ip_configurations:
+        if ip_config.name in update["pools"]:
+            ip_config.load_balancer_backend_address_pools = [
+                SubResource(id=pool_id) for pool_id in update["pools"][ip_config.name]
+            ]
+
+    # The NIC may live outside the load balancer's resource group
+    return {
+        "parent": nic.id,
+        "client_type": "network",
+        "subscription_id": update["subscription_id"],
+        "method": "network_interfaces.begin_create_or_update",
+        "args": [
+            nic_rg,
+            nic.name,
+            {
+                "location": nic.location,
+                "ip_configurations": nic.ip_configurations
+            }
+        ],
+        "fields": {"nic_name": nic.name, "resource_group": nic_rg},
+        "success": partial(nic_entry, nic_rg)
+    }
+
 def main():
     """
     Main Loop
@@ -33,20 +148,45 @@ def main():
         description="Create Azure VNets from a JSON config file.")
     parser.add_argument(
         '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--max_parallel', type=int, default=1,
+        help='Maximum number of NIC updates to run at the same time.')
+    parser.add_argument(
+        '--use_async', action='store_true',
+        help='Run the NIC updates on the asyncio engine with the aio SDK clients.')
+    parser.add_argument(
+        '--index_all_nics', action='store_true',
+        help='Index every NIC in the subscription, for backends outside the LB resource group.')
+    parser.add_argument(
+        '--skip_unchanged', action='store_true',
+        help='Only update the NICs whose backend pools differ from the input.')
+    parser.add_argument(
+        '--inventory_file', type=str, default=None,
+        help='SQLite inventory from prefetch_inventory.py; fresh entries answer reads instead of ARM.')
+    parser.add_argument(
+        '--cache_ttl', type=int, default=DEFAULT_TTL,
+        help='Seconds an inventory entry is trusted.')
     args = parser.parse_args()
 
-    # Load the input configuration JSON
-    with open(args.input_file, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
 
-    # Prepare output list to capture status for each VNet
-    output = []
+    # Shared SDK clients for the run (DefaultAzureCredential supports CLI, env, etc.)
+    clients = ClientRegistry(
+        pool_size=max(args.max_parallel, 10),
+        inventory=open_inventory(args.inventory_file, args.cache_ttl))
 
-    # Initialize credential object
-    credential = DefaultAzureCredential()
+    # Private IP -> (NIC, IP configuration) per listing scope, and pending NIC updates
+    nic_indexes = {}
+    nic_updates = {}
+    unmatched = []
 
     # Iterate through each load balancer
     for load_balancer in config["load_balancers"]:
+        resource_id = None
         try:
             rg_name = load_balancer["resource_group"]
             location = load_balancer["location"]
@@ -55,22 +195,16 @@ def main():
             sku = load_balancer["sku"]
             tier = load_balancer["tier"]
 
-            # Loop over each Resource Group to find the right subscription ID
-            for rg in config["resource_groups"]:
-                if rg["resource_group"] == rg_name:
-                    subscription_id = rg["subscription_id"]
-                    break
-
-            if not subscription_id:
-                raise Exception(f"Subscription ID not found for resource group: {rg_name}")
+            # Look up the subscription ID of the resource group
+            subscription_id = config.subscription(rg_name)
+            resource_id = config.resource_id("load_balancers", rg_name, load_balancer_name)
 
             # Public Global Load balancer
             if load_balancer_type == "public" and tier == "Global":
                 public_ip_name = load_balancer["public_ip_name"]
                 frontend_name = load_balancer["frontend_name"]
 
-                public_ip_id = f"/subscriptions/{subscription_id}/resourceGroups/" \
-                    f"{rg_name}/providers/Microsoft.Network/publicIPAddresses/{public_ip_name}"
+                public_ip_id = config.resource_id("public_ips", rg_name, public_ip_name)
 
                 # Construct SubResource objects from raw ID strings
                 public_ip_resource = SubResource(id=public_ip_id)
@@ -81,9 +215,8 @@ def main():
                     public_ip_address=public_ip_resource
                 )
 
-                # Initialize management clients
-                resource_client = ResourceManagementClient(credential, subscription_id)
-                network_client = NetworkManagementClient(credential, subscription_id)
+                # Reuse the shared network client for the subscription
+                network_client = clients.get("network", subscription_id)
 
                 # Contruct Backend Address Pool Object
                 for backend_pool in load_balancer["backend_pools"]:
@@ -98,20 +231,10 @@ def main():
                         backend_ip_address_config = backend_address[
                                                 "backend_load_balancer_frontend_ip_name"]
 
-                        # Loop over each Resource Group to find the right subscription ID
-                        for rg in config["resource_groups"]:
-                            if rg["resource_group"] == backend_load_balancer_rg:
-                                backend_lb_subscription_id = rg["subscription_id"]
-                                break
-
-                        if not backend_lb_subscription_id:
-                            raise Exception(f"Subscription ID not found for resource group: " \
-                                f"{backend_load_balancer_rg}")
-
-                        front_end_id = f"/subscriptions/{backend_lb_subscription_id}" \
-                            f"/resourceGroups/{backend_load_balancer_rg}/providers/" \
-                            f"Microsoft.Network/loadBalancers/{backend_load_balancer_name}" \
-                                f"/frontendIPConfigurations/{backend_ip_address_config}"
+                        # Resolve the backend load balancer's frontend from the indexed input file
+                        front_end_id = config.resource_id(
+                            "load_balancers", backend_load_balancer_rg, backend_load_balancer_name) \
+                            + f"/frontendIPConfigurations/{backend_ip_address_config}"
 
                         # Construct SubResource objects from raw ID strings
                         front_end_resource = SubResource(id=front_end_id)
@@ -164,7 +287,7 @@ def main():
                     )
 
                 # Check whether the resource group exists
-                rg_exists = resource_client.resource_groups.check_existence(rg_name)
+                rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
                 if not rg_exists:
                     result = {
@@ -172,7 +295,7 @@ def main():
                         "status": "failed",
                         "reason": "Resource group does not exist"
                     }
-                    output.append(result)
+                    journal.append(result, resource_id=resource_id)
                     continue
 
                 # Create or update the Load Balancer
@@ -214,8 +337,7 @@ def main():
                 public_ip_name = load_balancer["public_ip_name"]
                 frontend_name = load_balancer["frontend_name"]
 
-                public_ip_id = f"/subscriptions/{subscription_id}/resourceGroups/" \
-                    f"{rg_name}/providers/Microsoft.Network/publicIPAddresses/{public_ip_name}"
+                public_ip_id = config.resource_id("public_ips", rg_name, public_ip_name)
 
                 # Construct SubResource objects from raw ID strings
                 public_ip_resource = SubResource(id=public_ip_id)
@@ -226,9 +348,8 @@ def main():
                     public_ip_address=public_ip_resource
                 )
 
-                # Initialize management clients
-                resource_client = ResourceManagementClient(credential, subscription_id)
-                network_client = NetworkManagementClient(credential, subscription_id)
+                # Reuse the shared network client for the subscription
+                network_client = clients.get("network", subscription_id)
 
                 # Contruct Backend Address Pool Object
                 for backend_pool in load_balancer["backend_pools"]:
@@ -240,11 +361,8 @@ def main():
                         subnet = backend_address["subnet_name"]
                         backend_ip_address = backend_address["ip_address"]
 
-                        subnet_id = f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}" \
-                            f"/providers/Microsoft.Network/virtualNetworks/{vnet}/subnets/{subnet}"
-
-                        vnet_id = f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}" \
-                            f"/providers/Microsoft.Network/virtualNetworks/{vnet}"
+                        subnet_id = config.subnet_id(vnet, subnet)
+                        vnet_id = config.vnet_id(vnet)
 
                         # Construct SubResource objects from raw ID strings
                         subnet_resource = SubResource(id=subnet_id)
@@ -341,7 +459,7 @@ def main():
                 )
 
                 # Check whether the resource group exists
-                rg_exists = resource_client.resource_groups.check_existence(rg_name)
+                rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
                 if not rg_exists:
                     result = {
@@ -349,7 +467,7 @@ def main():
                         "status": "failed",
                         "reason": "Resource group does not exist"
                     }
-                    output.append(result)
+                    journal.append(result, resource_id=resource_id)
                     continue
 
                 # Create or update the Load Balancer
@@ -367,29 +485,10 @@ def main():
                     }
                 ).result()
 
-                # Update NICs to reference the backend pool
-                for backend_address in backend_pool["backend_addresses"]:
-                    ip_address = backend_address["ip_address"]
-
-                    for nic in network_client.network_interfaces.list(rg_name):
-                        for ip_config in nic.ip_configurations:
-                            if ip_config.private_ip_address == ip_address:
-                                ip_config.load_balancer_backend_address_pools = [
-                                    SubResource(id=backend_pool_id)
-                            ]
-
-                                nic_params = {
-                                    "location": nic.location,
-                                    "ip_configurations": nic.ip_configurations,
-                                }
-
-                                # Update NIC with backend pool
-                                nic_result = \
-                                network_client.network_interfaces.begin_create_or_update(
-                                    rg_name,
-                                    nic.name,
-                                    nic_params
-                                ).result()
+                # Queue the NICs of the backend addresses to join the backend pool
+                add_backend_nics(
+                    nic_updates, nic_indexes, clients, config, subscription_id, rg_name,
+                    backend_pool, backend_pool_id, args.index_all_nics, unmatched)
 
                 result = {
                     "load_balancer_name": load_balancer_result.name,
@@ -406,8 +505,7 @@ def main():
                 frontend_name = load_balancer["frontend_name"]
                 allocation_method = load_balancer["private_ip_allocation_method"]
 
-                subnet_id = f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}" \
-                    f"/providers/Microsoft.Network/virtualNetworks/{vnet}/subnets/{subnet}"
+                subnet_id = config.subnet_id(vnet, subnet)
 
                 # Construct SubResource objects from raw ID strings
                 subnet_resource = SubResource(id=subnet_id)
@@ -420,9 +518,8 @@ def main():
                     private_ip_address=frontend_ip_address
                 )
 
-                # Initialize management clients
-                resource_client = ResourceManagementClient(credential, subscription_id)
-                network_client = NetworkManagementClient(credential, subscription_id)
+                # Reuse the shared network client for the subscription
+                network_client = clients.get("network", subscription_id)
 
                 # Contruct Backend Address Pool Object
                 for backend_pool in load_balancer["backend_pools"]:
@@ -434,11 +531,8 @@ def main():
                         subnet = backend_address["subnet_name"]
                         backend_ip_address = backend_address["ip_address"]
 
-                        subnet_id = f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}" \
-                            f"/providers/Microsoft.Network/virtualNetworks/{vnet}/subnets/{subnet}"
-
-                        vnet_id = f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}" \
-                            f"/providers/Microsoft.Network/virtualNetworks/{vnet}"
+                        subnet_id = config.subnet_id(vnet, subnet)
+                        vnet_id = config.vnet_id(vnet)
 
                         # Construct SubResource objects from raw ID strings
                         subnet_resource = SubResource(id=subnet_id)
@@ -515,7 +609,7 @@ def main():
                     )
 
                 # Check whether the resource group exists
-                rg_exists = resource_client.resource_groups.check_existence(rg_name)
+                rg_exists = clients.resource_group_exists(subscription_id, rg_name)
 
                 if not rg_exists:
                     result = {
@@ -523,7 +617,7 @@ def main():
                         "status": "failed",
                         "reason": "Resource group does not exist"
                     }
-                    output.append(result)
+                    journal.append(result, resource_id=resource_id)
                     continue
 
                 # Create or update the Load Balancer
@@ -540,29 +634,10 @@ def main():
                     }
                 ).result()
 
-                # Update NICs to reference the backend pool
-                for backend_address in backend_pool["backend_addresses"]:
-                    ip_address = backend_address["ip_address"]
-
-                    for nic in network_client.network_interfaces.list(rg_name):
-                        for ip_config in nic.ip_configurations:
-                            if ip_config.private_ip_address == ip_address:
-                                ip_config.load_balancer_backend_address_pools = [
-                                    SubResource(id=backend_pool_id)
-                            ]
-
-                                nic_params = {
-                                    "location": nic.location,
-                                    "ip_configurations": nic.ip_configurations,
-                                }
-
-                                # Update NIC with backend pool
-                                nic_result = \
-                                    network_client.network_interfaces.begin_create_or_update(
-                                    rg_name,
-                                    nic.name,
-                                    nic_params
-                                ).result()
+                # Queue the NICs of the backend addresses to join the backend pool
+                add_backend_nics(
+                    nic_updates, nic_indexes, clients, config, subscription_id, rg_name,
+                    backend_pool, backend_pool_id, args.index_all_nics, unmatched)
 
                 result = {
                     "load_balancer_name": load_balancer_result.name,
@@ -580,12 +655,17 @@ def main():
                 "reason": str(e)
             }
 
-        # Add result to the output list
-        output.append(result)
+        # Journal the result as soon as it is known
+        journal.append(result, resource_id=resource_id)
+
+    # Report backend addresses without a NIC, then update every backend NIC once
+    journal.extend(unmatched)
+    execute_operations(
+        [nic_operation(update, args.skip_unchanged) for update in nic_updates.values()],
+        args.max_parallel, clients, args.use_async, journal=journal)
 
-    # Write results to JSON file
-    with open('output.json', 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+    # Build output.json from the results journaled during the run
+    journal.write_output()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,250 @@
+"""
+arm_batch.py
+
+Batched ARM reads through the management /batch endpoint.
+
+Preflight reads (subnet GETs before their update, the gateway and local gateway GETs of
+each connection, the reads behind --plan) are independent of each other but each costs
+its own HTTPS round trip. ARM also accepts up to BATCH_LIMIT requests in one POST to
+/batch and answers them all in one response:
+
+    POST https://management.azure.com/batch?api-version=2020-06-01
+    {"requests": [{"name": "0", "httpMethod": "GET", "url": "/subscriptions/..."}, ...]}
+
+    200 {"responses": [{"name": "0", "httpStatusCode": 200, "content": {...}}, ...]}
+
+A batch that takes longer is answered with 202 and a Location to poll for the same
+response. ARMBatch turns GET and check_existence operations into batch requests, sends
+them BATCH_LIMIT at a time over the registry's keep-alive session and gives each caller
+back what the SDK call would have returned: the SDK model, True/False, or the same
+azure.core exception (ResourceNotFoundError for a 404, HttpResponseError otherwise, with
+the status code and headers of that request, so a 429 is retried like any other).
+
+Only reads in BATCH_READS without extra kwargs are batched; conditional reads
+(If-None-Match from etag_store.py) still go through the SDK. arm_stub_server.py answers
+/batch locally; pass its address as the endpoint to try the scripts without a
+subscription.
+
+Usage:
+    clients = ClientRegistry(batch_endpoint=DEFAULT_ENDPOINT)
+    results = clients.batch.read([operation, ...])
+    clients.batch.report()
+"""
+
+import json
+import time
+import threading
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.mgmt.resource.resources.models import ResourceGroup
+from azure.mgmt.network.models import VirtualNetworkPeering
+from azure.mgmt.privatedns.models import VirtualNetworkLink
+from inventory import MODEL_CLASSES
+
+# Management endpoint the batches are sent to, and the scope of its tokens
+DEFAULT_ENDPOINT = "https://management.azure.com"
+ARM_SCOPE = "https://management.azure.com/.default"
+
+# Requests ARM accepts in one /batch call
+BATCH_LIMIT = 20
+
+BATCH_API_VERSION = "2020-06-01"
+
+# API versions of the batched reads, by client type
+API_VERSIONS = {
+    "resource": "2022-09-01",
+    "network": "2023-09-01",
+    "privatedns": "2020-06-01"
+}
+
+# Batchable read groups: (client type, provider, resource types below the resource group)
+BATCH_READS = {
+    "virtual_networks": ("network", "Microsoft.Network", ["virtualNetworks"]),
+    "subnets": ("network", "Microsoft.Network", ["virtualNetworks", "subnets"]),
+    "network_security_groups": ("network", "Microsoft.Network", ["networkSecurityGroups"]),
+    "route_tables": ("network", "Microsoft.Network", ["routeTables"]),
+    "network_interfaces": ("network", "Microsoft.Network", ["networkInterfaces"]),
+    "public_ip_addresses": ("network", "Microsoft.Network", ["publicIPAddresses"]),
+    "load_balancers": ("network", "Microsoft.Network", ["loadBalancers"]),
+    "virtual_network_gateways": ("network", "Microsoft.Network", ["virtualNetworkGateways"]),
+    "local_network_gateways": ("network", "Microsoft.Network", ["localNetworkGateways"]),
+    "private_zones": ("privatedns", "Microsoft.Network", ["privateDnsZones"]),
+    "virtual_network_peerings":
+        ("network", "Microsoft.Network", ["virtualNetworks", "virtualNetworkPeerings"]),
+    "virtual_network_links":
+        ("privatedns", "Microsoft.Network", ["privateDnsZones", "virtualNetworkLinks"]),
+    "resource_groups": ("resource", None, [])
+}
+
+# SDK model classes of the batched reads that the inventory does not cache
+READ_MODEL_CLASSES = {
+    **MODEL_CLASSES,
+    "virtual_network_peerings": VirtualNetworkPeering,
+    "virtual_network_links": VirtualNetworkLink,
+    "resource_groups": ResourceGroup
+}
+
+# Seconds between polls of a batch answered with 202 and no Retry-After
+BATCH_POLL_INTERVAL = 1
+
+
+def batchable(operation):
+    """
+    Check whether an operation is a plain GET or existence check that /batch can answer
+    """
+    group, name = operation["method"].rsplit(".", 1)
+    if group not in BATCH_READS or operation.get("kwargs"):
+        return False
+    if BATCH_READS[group][0] != operation.get("client_type", BATCH_READS[group][0]):
+        return False
+    return name == "get" or (group == "resource_groups" and name == "check_existence")
+
+
+def resource_id(operation):
+    """
+    Build the resource ID a read or write in BATCH_READS applies to, or None for other groups
+    """
+    group = operation["method"].rsplit(".", 1)[0]
+    if group not in BATCH_READS:
+        return None
+    _, provider, types = BATCH_READS[group]
+    rg_name, *names = operation["args"][:len(types) + 1]
+    path = f"/subscriptions/{operation['subscription_id']}/resourceGroups/{rg_name}"
+    if provider:
+        path += f"/providers/{provider}" + "".join(f"/{t}/{n}" for t, n in zip(types, names))
+    return path
+
+
+def request_url(operation):
+    """
+    Build the relative ARM URL of a batchable read
+    """
+    client_type = BATCH_READS[operation["method"].rsplit(".", 1)[0]][0]
+    return f"{resource_id(operation)}?api-version={API_VERSIONS[client_type]}"
+
+
+class BatchResponse:
+    """
+    Status, headers and body of one request answered inside a /batch response
+    """
+
+    def __init__(self, item):
+        self.status_code = item.get("httpStatusCode")
+        self.headers = item.get("headers") or {}
+        self.reason = ""
+        self.content = item.get("content")
+
+    def text(self):
+        """
+        Return the body as text, for azure.core to read the ARM error from
+        """
+        return json.dumps(self.content) if self.content is not None else ""
+
+
+def to_model(model_class, content):
+    """
+    Build the SDK model of a read from the REST JSON ARM answered with
+    """
+    # Resource groups are msrest models; network and private DNS models take the JSON as is
+    if hasattr(model_class, "deserialize"):
+        return model_class.deserialize(content)
+    return model_class(content)
+
+
+def batch_result(operation, item):
+    """
+    Turn one batch response into what the SDK read would have returned, or its exception
+    """
+    group, name = operation["method"].rsplit(".", 1)
+    response = BatchResponse(item)
+
+    if name == "check_existence":
+        if response.status_code in (200, 204, 404):
+            return response.status_code != 404
+    elif response.status_code == 200:
+        return to_model(READ_MODEL_CLASSES[group], response.content)
+
+    error_class = ResourceNotFoundError if response.status_code == 404 else HttpResponseError
+    return error_class(response=response)
+
+
+class ARMBatch:
+    """
+    Sends batchable reads to the /batch endpoint, BATCH_LIMIT per round trip
+    """
+
+    def __init__(self, session, credential=None, endpoint=DEFAULT_ENDPOINT):
+        self.session = session
+        self.credential = credential
+        self.endpoint = endpoint.rstrip("/")
+        self.lock = threading.Lock()
+        self.round_trips = 0
+        self.reads = 0
+
+    def headers(self):
+        """
+        Build the request headers; the local stand-in (plain HTTP) gets no token
+        """
+        headers = {"Content-Type": "application/json"}
+        if self.credential and self.endpoint.startswith("https://"):
+            headers["Authorization"] = f"Bearer {self.credential.get_token(ARM_SCOPE).token}"
+        return headers
+
+    def post(self, requests):
+        """
+        Send one batch and return its responses, polling while ARM answers 202
+        """
+        response = self.session.post(
+            f"{self.endpoint}/batch?api-version={BATCH_API_VERSION}",
+            data=json.dumps({"requests": requests}), headers=self.headers())
+        trips = 1
+        while response.status_code == 202:
+            time.sleep(float(response.headers.get("Retry-After", BATCH_POLL_INTERVAL)))
+            response = self.session.get(response.headers["Location"], headers=self.headers())
+            trips += 1
+
+        with self.lock:
+            self.round_trips += trips
+            self.reads += len(requests)
+
+        if response.status_code != 200:
+            # The whole batch failed (429, auth); every read in it fails the same way
+            try:
+                content = response.json()
+            except ValueError:
+                content = None
+            return [{
+                "httpStatusCode": response.status_code,
+                "headers": dict(response.headers),
+                "content": content
+            }] * len(requests)
+
+        by_name = {item["name"]: item for item in response.json()["responses"]}
+        return [by_name.get(request["name"], {"httpStatusCode": 500}) for request in requests]
+
+    def read(self, operations):
+        """
+        Answer the reads in order with SDK models, booleans or the exception to raise
+        """
+        results = []
+        for start in range(0, len(operations), BATCH_LIMIT):
+            chunk = operations[start:start + BATCH_LIMIT]
+            requests = [{
+                "name": str(index),
+                "httpMethod": "HEAD" if operation["method"].endswith("check_existence") else "GET",
+                "url": request_url(operation)
+            } for index, operation in enumerate(chunk)]
+            responses = self.post(requests)
+            results.extend(
+                batch_result(operation, item) for operation, item in zip(chunk, responses))
+        return results
+
+    def report(self):
+        """
+        Print how many round trips the batched reads took since the last report
+        """
+        with self.lock:
+            reads, round_trips = self.reads, self.round_trips
+            self.reads = self.round_trips = 0
+        if reads:
+            print(f"Batched reads: {reads} read(s) in {round_trips} round trip(s) "
+                  f"to {self.endpoint}/batch")
@@ -0,0 +1,193 @@
+"""
+arm_stub_server.py
+
+Local HTTP stand-in for the ARM reads that arm_batch.py sends.
+
+It answers POST /batch the way ARM does (up to MAX_BATCH_REQUESTS GET or HEAD requests per
+call, one response per request), and the same reads one at a time, so the scripts can be
+run with --batch_endpoint against it without a subscription. Resources come from
+--resources_file, a JSON object of resource ID -> REST body (e.g. a body saved from
+'az network vnet subnet show'); any other well-formed resource ID gets a minimal body with
+provisioningState Succeeded, or 404 with --only_listed.
+
+Every round trip is counted; GET /stats returns the counts and they are printed when the
+server stops. --latency_ms adds a delay to each round trip to make the difference
+between one GET per resource and one batch per BATCH_LIMIT resources visible.
+
+Usage:
+    python ../shared/arm_stub_server.py [--port 8080] [--resources_file resources.json]
+        [--only_listed] [--latency_ms 50]
+    python update_subnet.py --input_file inputs.json --batch_endpoint http://127.0.0.1:8080
+
+Requirements:
+    - Python 3 standard library only
+"""
+
+# Import the needed server objects from the standard library.
+import json
+import time
+import argparse
+import threading
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Requests ARM accepts in one /batch call
+MAX_BATCH_REQUESTS = 20
+
+class StubState:
+    """
+    Resources served by the stub and its round trip counters
+    """
+
+    def __init__(self, resources, only_listed, latency):
+        self.resources = {resource_id.lower(): body for resource_id, body in resources.items()}
+        self.only_listed = only_listed
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.stats = {"round_trips": 0, "batches": 0, "batched_requests": 0, "single_requests": 0}
+
+    def count(self, **increments):
+        """
+        Add to the round trip counters
+        """
+        with self.lock:
+            self.stats["round_trips"] += 1
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def answer(self, method, url):
+        """
+        Return (status code, body) for one GET or HEAD of a resource path
+        """
+        path = urlsplit(url).path.rstrip("/")
+        parts = path.split("/")
+
+        # /subscriptions/{s}/resourceGroups/{rg}[/providers/{ns}/{type}/{name}...]
+        if len(parts) < 5 or len(parts) % 2 == 0 or parts[1].lower() != "subscriptions" \
+                or parts[3].lower() != "resourcegroups" \
+                or (len(parts) > 5 and parts[5].lower() != "providers"):
+            return 400, {"error": {
+                "code": "InvalidRequestUri", "message": f"Unknown path {path}"}}
+
+        body = self.resources.get(path.lower())
+        if body is None and not self.only_listed:
+            body = {
+                "id": path,
+                "name": parts[-1],
+                "location": "centralus",
+                "properties": {"provisioningState": "Succeeded"}
+            }
+            if len(parts) > 5:
+                body["type"] = "/".join([parts[6]] + parts[7::2])
+                body["etag"] = 'W/"00000000-0000-0000-0000-000000000001"'
+
+        if body is None:
+            return 404, {"error": {
+                "code": "ResourceNotFound", "message": f"The resource '{path}' was not found."}}
+        if method == "HEAD":
+            return 204, None
+        return 200, body
+
+def handler_class(state):
+    """
+    Build the request handler bound to the stub state
+    """
+
+    class StubHandler(BaseHTTPRequestHandler):
+        """
+        Answers /batch, single reads and /stats
+        """
+
+        def log_message(self, format, *args):
+            # One line per round trip is enough; the default also logs the client address
+            status = args[1] if len(args) > 1 else ""
+            print(f"{self.command} {self.path.split('?')[0]} -> {status}")
+
+        def reply(self, status, body=None):
+            data = json.dumps(body).encode("utf-8") if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(data)
+
+        def do_POST(self):
+            if urlsplit(self.path).path.rstrip("/") != "/batch":
+                self.reply(404, {"error": {"code": "NotFound", "message": self.path}})
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            requests = json.loads(self.rfile.read(length) or b"{}").get("requests", [])
+            if len(requests) > MAX_BATCH_REQUESTS:
+                self.reply(400, {"error": {
+                    "code": "BatchRequestLimitExceeded",
+                    "message": f"A batch can hold at most {MAX_BATCH_REQUESTS} requests."}})
+                return
+
+            time.sleep(state.latency)
+            state.count(batches=1, batched_requests=len(requests))
+            responses = []
+            for request in requests:
+                status, content = state.answer(request["httpMethod"].upper(), request["url"])
+                response = {"name": request.get("name"), "httpStatusCode": status, "headers": {}}
+                if content is not None:
+                    response["content"] = content
+                responses.append(response)
+            self.reply(200, {"responses": responses})
+
+        def do_GET(self):
+            if urlsplit(self.path).path.rstrip("/") == "/stats":
+                with state.lock:
+                    self.reply(200, dict(state.stats))
+                return
+            time.sleep(state.latency)
+            state.count(single_requests=1)
+            self.reply(*state.answer("GET", self.path))
+
+        def do_HEAD(self):
+            time.sleep(state.latency)
+            state.count(single_requests=1)
+            self.reply(state.answer("HEAD", self.path)[0])
+
+    return StubHandler
+
+def main():
+    """
+    Main Loop
+    """
+
+    # Set up argument parser for the stub options
+    parser = argparse.ArgumentParser(
+        description="Serve ARM /batch and resource reads locally.")
+    parser.add_argument(
+        '--port', type=int, default=8080, help='Port to listen on (127.0.0.1).')
+    parser.add_argument(
+        '--resources_file', type=str, default=None,
+        help='JSON object of resource ID -> REST body to serve.')
+    parser.add_argument(
+        '--only_listed', action='store_true',
+        help='Answer 404 for resources that are not in --resources_file.')
+    parser.add_argument(
+        '--latency_ms', type=int, default=0,
+        help='Delay added to every round trip, in milliseconds.')
+    args = parser.parse_args()
+
+    resources = {}
+    if args.resources_file:
+        with open(args.resources_file, 'r', encoding='utf-8') as f:
+            resources = json.load(f)
+
+    state = StubState(resources, args.only_listed, args.latency_ms / 1000)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler_class(state))
+    print(f"ARM stub listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(state.stats))
+
+if __name__ == "__main__":
+    main()
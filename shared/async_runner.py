@@ -0,0 +1,236 @@
+"""
+async_runner.py
+
+asyncio execution engine for the operation lists built by the scripts (see runner.py).
+
+Operations run on the azure.mgmt.*.aio clients with an async DefaultAzureCredential.
+Every operation is a coroutine and each SDK call is guarded by a semaphore, so thousands
+of pollers can be in flight from one process without a thread per operation. Writes to
+the same parent resource are serialized with one asyncio.Lock per parent, and every
+call waits for a slot on its subscription under the RateGovernor (throttling.py); a call
+that fails with 429 Too Many Requests waits for a slot again instead of failing. LROs
+are polled on the schedule of their resource type (polling.py), and GETs are answered
+from the inventory (inventory.py) when one is given. The time a successful LRO chain
+spent in calls is recorded into the DurationHistory (durations.py) when one is given,
+every result is appended to the Journal (journal.py) as soon as it is known, and the
+state of every operation is committed to the Checkpoint (checkpoint.py).
+
+Requirements:
+    - 'aiohttp' installed alongside the Azure SDK libraries
+"""
+
+import time
+import asyncio
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+from azure.identity.aio import DefaultAzureCredential
+from azure.mgmt.resource.resources.aio import ResourceManagementClient
+from azure.mgmt.network.aio import NetworkManagementClient
+from azure.mgmt.privatedns.aio import PrivateDnsManagementClient
+from runner import get_method, is_poller, failed_entry, index_operations, report_serialized
+from polling import PollingReport
+from etag_store import MAX_CONFLICT_RETRIES, not_modified, precondition_failed
+from arm_batch import resource_id
+from throttling import (
+    MAX_THROTTLE_RETRIES, THROTTLE_WAIT, RateGovernor, ThrottlingPolicy, throttled_retry_after)
+
+# Async SDK client classes referenced by an operation's "client_type"
+CLIENT_CLASSES = {
+    "resource": ResourceManagementClient,
+    "network": NetworkManagementClient,
+    "privatedns": PrivateDnsManagementClient
+}
+
+
+async def run_all(operations, max_parallel, governor, inventory=None, durations=None,
+                  journal=None, checkpoint=None):
+    """
+    Run every operation as a coroutine with at most max_parallel in flight
+    """
+    keys = index_operations(operations)
+    policy = ThrottlingPolicy(governor)
+    polling_report = PollingReport(use_async=True)
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+    finished = {key: asyncio.Event() for key in keys}
+    parent_locks = {}
+    held = {}
+    results = {}
+    clients = {}
+    call_seconds = {}
+    attempts = {}
+    resource_ids = {}
+    heads = {}
+    first_slot = journal.reserve(len(operations)) if journal else 0
+
+    async def call(credential, operation, report_key):
+        # Start the call and wait for the poller when the method is an LRO
+        key = (operation["client_type"], operation["subscription_id"])
+        if key not in clients:
+            clients[key] = CLIENT_CLASSES[key[0]](
+                credential, key[1], per_retry_policies=[policy])
+        kwargs = dict(operation.get("kwargs", {}))
+        polling = None if "polling" in kwargs else polling_report.polling(
+            report_key, operation["method"])
+        if polling:
+            kwargs["polling"] = polling
+        started = time.monotonic()
+        result = await get_method(clients[key], operation["method"])(
+            *operation["args"], **kwargs)
+        if is_poller(result):
+            if checkpoint:
+                checkpoint.submitted(heads[report_key], operation, result)
+            result = await result.result()
+        call_seconds[report_key] = call_seconds.get(report_key, 0) + time.monotonic() - started
+        return result
+
+    @asynccontextmanager
+    async def subscription_slot(subscription_id):
+        # Wait for a free slot under the subscription's adaptive ARM limit
+        while not governor.try_acquire(subscription_id, max(1, max_parallel)):
+            await asyncio.sleep(THROTTLE_WAIT)
+        try:
+            yield
+        except Exception:
+            governor.release(subscription_id, False)
+            raise
+        governor.release(subscription_id)
+
+    async def call_serialized(credential, operation, report_key):
+        # Writes to the same parent and throttled subscriptions wait outside the
+        # semaphore, so they never block the slots other operations could use
+        parent = operation.get("parent")
+        if not parent:
+            async with subscription_slot(operation["subscription_id"]), semaphore:
+                return await call(credential, operation, report_key)
+
+        lock = parent_locks.setdefault(parent, asyncio.Lock())
+        if lock.locked():
+            held[parent] = held.get(parent, 0) + 1
+        async with lock:
+            async with subscription_slot(operation["subscription_id"]), semaphore:
+                return await call(credential, operation, report_key)
+
+    async def call_retried(credential, operation, report_key):
+        # A call throttled with 429 waits for its subscription again instead of failing
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            try:
+                return await call_serialized(credential, operation, report_key)
+            except Exception as e:
+                retry_after = throttled_retry_after(e)
+                if retry_after is None or attempt == MAX_THROTTLE_RETRIES:
+                    raise
+                governor.retried(operation["subscription_id"], retry_after)
+                attempts[report_key] = attempts.get(report_key, 1) + 1
+
+    async def call_cached(credential, operation, report_key):
+        # Fresh cached GETs never reach ARM; everything that does is written back
+        cached = inventory.lookup(operation) if inventory else None
+        if cached is not None:
+            return cached
+        try:
+            result = await call_retried(credential, operation, report_key)
+        except Exception as e:
+            # A conditional read answered with 304 goes on with the stored body
+            if "not_modified" in operation and not_modified(e):
+                return operation["not_modified"]
+            raise
+        if inventory:
+            inventory.record(operation, result)
+        return result
+
+    async def execute(credential, operation):
+        # Every call of a then-chain is reported under the operation that started it
+        report_key = id(operation)
+        head = operation
+        heads[report_key] = head
+        conflicts = 0
+        while True:
+            try:
+                result = await call_cached(credential, operation, report_key)
+                while "then" in operation:
+                    operation = operation["then"](result)
+                    if "result" in operation:
+                        return polling_report.annotate(report_key, operation["result"])
+                    result = await call_cached(credential, operation, report_key)
+                entry = operation["success"](result)
+                resource_ids[report_key] = getattr(result, "id", None)
+
+                # Only chains that waited on an LRO say anything about provisioning times
+                if durations and entry.get("status") == "success" \
+                        and report_key in polling_report.pollings:
+                    durations.record(head, call_seconds.get(report_key, 0))
+                return polling_report.annotate(report_key, entry)
+            except Exception as e:
+                # A write another writer got to first starts over from a fresh read
+                if "retry_on_conflict" in operation and precondition_failed(e) \
+                        and conflicts < MAX_CONFLICT_RETRIES:
+                    conflicts += 1
+                    attempts[report_key] = attempts.get(report_key, 1) + 1
+                    if inventory:
+                        inventory.forget(operation)
+                    operation = operation["retry_on_conflict"]
+                    continue
+                resource_ids[report_key] = resource_id(operation)
+                return polling_report.annotate(report_key, failed_entry(operation, e))
+
+    async def run(credential, index, operation):
+        started = datetime.now(timezone.utc)
+        if "result" in operation:
+            result = operation["result"]
+        else:
+            # Wait for every dependency and fail straight away if one did not succeed
+            failed = None
+            for dependency in operation.get("depends_on", []):
+                await finished[dependency].wait()
+                if results[dependency].get("status") != "success":
+                    failed = dependency
+                    break
+
+            started = datetime.now(timezone.utc)
+            if failed:
+                result = failed_entry(operation, f"Dependency failed: {failed}")
+            else:
+                result = await execute(credential, operation)
+
+        # Append the result to the journal and checkpoint as soon as it is known
+        if checkpoint:
+            checkpoint.finished(operation, result)
+        if journal:
+            journal.append(
+                result, first_slot + index, started, attempts.get(id(operation), 1),
+                resource_ids.get(id(operation))
+                or (resource_id(operation) if "method" in operation else None))
+
+        if "key" in operation:
+            results[operation["key"]] = result
+            finished[operation["key"]].set()
+        return result
+
+    if checkpoint:
+        checkpoint.planned(operations)
+
+    async with DefaultAzureCredential() as credential:
+        try:
+            # Start the coroutines highest priority first so they reach the semaphore first
+            order = sorted(
+                range(len(operations)), key=lambda index: -operations[index].get("priority", 0))
+            tasks = {index: asyncio.ensure_future(run(credential, index, operations[index]))
+                     for index in order}
+            output = await asyncio.gather(*(tasks[index] for index in range(len(operations))))
+            report_serialized(held)
+            governor.report()
+            polling_report.report()
+            return output
+        finally:
+            for client in clients.values():
+                await client.close()
+
+
+def run_operations_async(operations, max_parallel=1, governor=None, inventory=None,
+                         durations=None, journal=None, checkpoint=None):
+    """
+    Run the operations on the asyncio engine and return their results in input order
+    """
+    return list(asyncio.run(run_all(
+        operations, max_parallel, governor or RateGovernor(), inventory, durations, journal,
+        checkpoint)))
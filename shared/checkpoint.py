@@ -0,0 +1,244 @@
+"""
+checkpoint.py
+
+SQLite checkpoint of the state of every operation of a run, for --resume.
+
+When a 300-resource run stops halfway (an expired credential, a network blip, Ctrl-C),
+running it again re-PUTs every resource that had already succeeded and starts a second
+LRO next to each one that was still provisioning. Checkpoint records every operation of
+the run in checkpoint.db as its state changes, committed before the run goes on:
+
+    pending    planned, not started yet
+    submitted  the LRO was accepted; the continuation token of its poller is stored
+    succeeded  finished, with its output entry
+    failed     finished, with its output entry
+
+Runs are identified by the run ID of the journal (journal.py), so tail_journal.py --list
+shows the runs there are to resume. checkpoint.db is only created once a run records an
+operation, so --plan, --estimate or a run stopped by a config error leave no file. Operations are identified by their graph key, or by
+their method and path arguments (deploy_state.py), numbered when one appears twice.
+
+With --resume RUN_ID, every operation is matched with the same operation of that run:
+
+    - succeeded operations are not run again; their stored entry is returned
+    - submitted operations reattach to the LRO in flight: the step of the chain that was
+      submitted (same method and path arguments) is called with the continuation token,
+      so the SDK polls the existing operation instead of sending the request again.
+      Earlier steps of a then-chain run again; they are reads or PUTs of the same body
+    - pending and failed operations run again
+
+An LRO whose token can no longer be polled fails in the resumed run and starts over on
+the next --resume. The resumed run is checkpointed under its own run ID, with the
+operations it skipped recorded as succeeded, so it can be resumed in turn.
+
+Usage:
+    checkpoint = Checkpoint(args.checkpoint_file, journal.run_id, resume=args.resume)
+    output = execute_operations(operations, max_parallel, clients, checkpoint=checkpoint)
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import threading
+from functools import partial
+from deploy_state import operation_identity
+from journal import timestamp
+
+# Checkpoint file used when the scripts are not given --checkpoint_file
+DEFAULT_CHECKPOINT_FILE = "checkpoint.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    script TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    resumed_from TEXT
+);
+CREATE TABLE IF NOT EXISTS operations (
+    run_id TEXT NOT NULL,
+    identity TEXT NOT NULL,
+    state TEXT NOT NULL,
+    method TEXT,
+    path TEXT,
+    continuation_token TEXT,
+    result TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (run_id, identity)
+);
+"""
+
+
+def step_path(operation):
+    """
+    Join the path arguments of a call (resource group and names), e.g. 'rg/vnet/subnet'
+    """
+    return "/".join(str(arg) for arg in operation["args"] if isinstance(arg, str))
+
+
+def reattach(operation, saved):
+    """
+    Give the step of an operation that was in flight its continuation token
+    """
+    if operation.get("method") == saved["method"] and step_path(operation) == saved["path"]:
+        # The SDK skips the initial request when given a continuation token
+        return {**operation, "kwargs": {
+            **operation.get("kwargs", {}),
+            "continuation_token": saved["continuation_token"]
+        }}
+    if "then" in operation:
+        return {**operation, "then": partial(reattached_then, operation["then"], saved)}
+    return operation
+
+
+def reattached_then(then, saved, result):
+    """
+    Build the follow-up of a then-chain, reattaching it when it is the step in flight
+    """
+    follow_up = then(result)
+    return follow_up if "result" in follow_up else reattach(follow_up, saved)
+
+
+class Checkpoint:
+    """
+    Per-run operation states in a SQLite file, committed as they change
+    """
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_FILE, run_id=None, script=None, resume=None):
+        self.path = path
+        self.run_id = run_id
+        self.resume = resume
+        self.script = script or os.path.basename(sys.argv[0])
+        self.lock = threading.Lock()
+
+        # The file is only created once the run has an operation to record
+        self.connection = None
+        if resume:
+            if not os.path.exists(path):
+                raise Exception(f"Run not found in {path}: {resume}")
+            with self.lock:
+                self.connect()
+
+        self.resumed = self.load(resume) if resume else {}
+
+    def connect(self):
+        """
+        Open the checkpoint file and record the run on first use; lock held by the caller
+        """
+        if self.connection is not None:
+            return
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        with connection:
+            connection.executescript(SCHEMA)
+            if self.resume:
+                row = connection.execute(
+                    "SELECT script FROM runs WHERE run_id = ?", (self.resume,)).fetchone()
+                if row is None:
+                    raise Exception(f"Run not found in {self.path}: {self.resume}")
+                if row[0] != self.script:
+                    raise Exception(
+                        f"Run {self.resume} was started by {row[0]}, not {self.script}")
+            connection.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?)",
+                (self.run_id, self.script, timestamp(), self.resume))
+        self.connection = connection
+
+    def load(self, run_id):
+        """
+        Return the saved operations of a run by identity
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT identity, state, method, path, continuation_token, result "
+                "FROM operations WHERE run_id = ?", (run_id,)).fetchall()
+        return {
+            identity: {
+                "state": state,
+                "method": method,
+                "path": path,
+                "continuation_token": token,
+                "result": json.loads(result) if result else None
+            }
+            for identity, state, method, path, token, result in rows
+        }
+
+    def prepare(self, operations):
+        """
+        Tag every operation with its identity and, when resuming, skip or reattach it
+        """
+        prepared = []
+        seen = {}
+        skipped = reattached = 0
+        for operation in operations:
+            if "key" not in operation and "method" not in operation:
+                prepared.append(operation)
+                continue
+            identity = operation_identity(operation)
+            seen[identity] = seen.get(identity, 0) + 1
+            if seen[identity] > 1:
+                identity += f"#{seen[identity]}"
+
+            saved = self.resumed.get(identity)
+            if "result" in operation or saved is None:
+                prepared.append({**operation, "checkpoint": identity})
+            elif saved["state"] == "succeeded":
+                entry = {"checkpoint": identity, "result": {
+                    "resumed_from": self.resume, **saved["result"]}}
+                if "key" in operation:
+                    entry["key"] = operation["key"]
+                prepared.append(entry)
+                skipped += 1
+            elif saved["state"] == "submitted" and saved["continuation_token"]:
+                prepared.append({**reattach(operation, saved), "checkpoint": identity})
+                reattached += 1
+            else:
+                prepared.append({**operation, "checkpoint": identity})
+
+        if self.resume:
+            print(f"Resuming {self.resume}: {skipped} succeeded, {reattached} reattached, "
+                  f"{len(operations) - skipped - reattached} to run")
+        return prepared
+
+    def row(self, operation, state, step=None, token=None, result=None):
+        """
+        Build the row of a tagged operation, or None when it is not checkpointed
+        """
+        identity = operation.get("checkpoint")
+        if identity is None:
+            return None
+        return (self.run_id, identity, state,
+                step["method"] if step else None, step_path(step) if step else None, token,
+                json.dumps(result) if result is not None else None, timestamp())
+
+    def save(self, rows):
+        """
+        Commit rows in one transaction
+        """
+        rows = [row for row in rows if row]
+        if not rows:
+            return
+        with self.lock:
+            self.connect()
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO operations VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def planned(self, operations):
+        """
+        Record the operations of a run that still have to start as pending
+        """
+        self.save(self.row(operation, "pending")
+                  for operation in operations if "result" not in operation)
+
+    def submitted(self, operation, step, poller):
+        """
+        Record the continuation token of the LRO an operation (or a step of its chain) started
+        """
+        self.save([self.row(operation, "submitted", step, poller.continuation_token())])
+
+    def finished(self, operation, result):
+        """
+        Record the output entry of an operation that finished
+        """
+        state = "succeeded" if result.get("status") == "success" else "failed"
+        self.save([self.row(operation, state, result=result)])
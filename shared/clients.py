@@ -0,0 +1,235 @@
+"""
+clients.py
+
+Shared Azure SDK clients for a single run.
+
+Building a management client sets up a new HTTP pipeline and connection pool, so creating
+one per resource repeats the TLS handshake and pipeline setup on every iteration.
+ClientRegistry builds each client once per (client type, subscription ID) and every client
+shares one credential and one keep-alive HTTP session.
+
+Resource group existence checks are answered from one resource_groups.list() call per
+subscription instead of a check_existence request per resource. A group that is still
+being deleted does not count as existing, so a deployment never races an unfinished delete.
+
+Every client pipeline reports ARM rate-limit headers and 429s to the registry's
+RateGovernor (throttling.py), which the runners use to adapt concurrency per subscription.
+
+With an Inventory (inventory.py), read() and list_resources() answer GETs and listings
+from the local cache while it is fresh, and store what they fetch from ARM.
+
+With a batch endpoint (arm_batch.py), read_all() sends many independent GETs through ARM's
+/batch endpoint, BATCH_LIMIT per round trip, and read() answers them from the results.
+Batching never changes what read() returns or raises: a read the batch did not answer
+successfully (or a batch that failed as a whole) is sent again as its own GET. The
+runners batch their ready reads the same way.
+
+Usage:
+    clients = ClientRegistry()
+    network_client = clients.get("network", subscription_id)
+    if clients.resource_group_exists(subscription_id, rg_name): ...
+    nics = clients.list_resources("network", subscription_id, "network_interfaces", rg_name)
+"""
+
+import threading
+from requests import Session
+from requests.adapters import HTTPAdapter
+from azure.core.pipeline.transport import RequestsTransport
+from azure.identity import DefaultAzureCredential
+from azure.mgmt.resource import ResourceManagementClient
+from azure.mgmt.network import NetworkManagementClient
+from azure.mgmt.privatedns import PrivateDnsManagementClient
+from throttling import RateGovernor, ThrottlingPolicy
+from arm_batch import ARMBatch
+
+# SDK client classes referenced by client type
+CLIENT_CLASSES = {
+    "resource": ResourceManagementClient,
+    "network": NetworkManagementClient,
+    "privatedns": PrivateDnsManagementClient
+}
+
+# Connections kept open to management.azure.com; should cover --max_parallel
+DEFAULT_POOL_SIZE = 50
+
+# Provisioning state of a resource group whose delete has not finished
+DELETING_STATE = "Deleting"
+
+
+class ClientRegistry:
+    """
+    Cache of SDK clients keyed by (client type, subscription ID)
+    """
+
+    def __init__(self, credential=None, pool_size=DEFAULT_POOL_SIZE, governor=None,
+                 inventory=None, batch_endpoint=None):
+        self.credential = credential or DefaultAzureCredential()
+
+        # Optional local cache of resources, shared with the runners
+        self.inventory = inventory
+
+        # Concurrency limits per subscription, fed by every client's responses
+        self.governor = governor or RateGovernor()
+        self.policy = ThrottlingPolicy(self.governor)
+
+        # One keep-alive session shared by every client's pipeline
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.transport = RequestsTransport(session=self.session, session_owner=False)
+
+        # Optional /batch sender for independent reads, and the reads it already answered
+        self.batch = ARMBatch(self.session, self.credential, batch_endpoint) \
+            if batch_endpoint else None
+        self.batched_reads = {}
+
+        self.clients = {}
+        self.lock = threading.Lock()
+
+        # Resource group name (lower case) -> provisioning state, per subscription
+        self.resource_groups = {}
+        self.rg_lock = threading.Lock()
+
+    def get(self, client_type, subscription_id):
+        """
+        Return the client for a subscription, building it on first use
+        """
+        key = (client_type, subscription_id)
+        with self.lock:
+            if key not in self.clients:
+                self.clients[key] = CLIENT_CLASSES[client_type](
+                    self.credential, subscription_id, transport=self.transport,
+                    per_retry_policies=[self.policy])
+            return self.clients[key]
+
+    def read(self, client_type, subscription_id, method, *args):
+        """
+        Call a GET method such as 'subnets.get', answering it from the inventory when fresh
+        """
+        operation = {"subscription_id": subscription_id, "method": method, "args": list(args)}
+        key = (subscription_id, method, *args)
+
+        # Only successful batched answers are used; errors are left to the SDK call below
+        batched = self.batched_reads.get(key)
+        if batched is not None and not isinstance(batched, Exception):
+            return batched
+
+        if self.inventory:
+            cached = self.inventory.lookup(operation)
+            if cached is not None:
+                return cached
+
+        group, name = method.split(".")
+        result = getattr(getattr(self.get(client_type, subscription_id), group), name)(*args)
+        if self.inventory:
+            self.inventory.record(operation, result)
+        return result
+
+    def read_all(self, reads):
+        """
+        Read (client type, subscription ID, method, *args) tuples through /batch up front
+        """
+        if not self.batch:
+            return
+
+        operations = []
+        for client_type, subscription_id, method, *args in reads:
+            operation = {
+                "client_type": client_type,
+                "subscription_id": subscription_id,
+                "method": method,
+                "args": list(args)
+            }
+            if self.inventory and self.inventory.lookup(operation) is not None:
+                continue
+            if operation not in operations:
+                operations.append(operation)
+
+        try:
+            results = self.batch.read(operations)
+        except Exception as e:
+            # read() sends every GET on its own instead
+            print(f"Batched reads failed, reading one at a time: {e}")
+            return
+
+        for operation, result in zip(operations, results):
+            if self.inventory and not isinstance(result, Exception):
+                self.inventory.record(operation, result)
+            self.batched_reads[
+                (operation["subscription_id"], operation["method"], *operation["args"])] = result
+        self.batch.report()
+
+    def list_resources(self, client_type, subscription_id, group, rg_name=None, refresh=False):
+        """
+        List the resources of a resource group (or subscription) through the inventory
+        """
+        if self.inventory and not refresh:
+            cached = self.inventory.listed(subscription_id, group, rg_name)
+            if cached is not None:
+                return cached
+
+        # Private DNS zones are listed per subscription with list() rather than list_all()
+        operations = getattr(self.get(client_type, subscription_id), group)
+        if rg_name:
+            resources = list(operations.list(rg_name))
+        else:
+            resources = list(getattr(operations, "list_all", operations.list)())
+        if self.inventory:
+            self.inventory.put_listing(subscription_id, group, resources, rg_name)
+        return resources
+
+    def list_resource_groups(self, subscription_id):
+        """
+        Return the subscription's resource groups, listing them once on first use
+        """
+        with self.rg_lock:
+            if subscription_id not in self.resource_groups:
+                resource_client = self.get("resource", subscription_id)
+                self.resource_groups[subscription_id] = {
+                    rg.name.lower(): rg.properties.provisioning_state
+                    for rg in resource_client.resource_groups.list()
+                }
+            return self.resource_groups[subscription_id]
+
+    def resource_group_state(self, subscription_id, rg_name):
+        """
+        Return the provisioning state of a resource group, or None when it does not exist
+        """
+        # Resource group names are case-insensitive in Azure
+        return self.list_resource_groups(subscription_id).get(rg_name.lower())
+
+    def resource_group_exists(self, subscription_id, rg_name):
+        """
+        Check whether a resource group exists without a request per resource
+        """
+        state = self.resource_group_state(subscription_id, rg_name)
+        return state is not None and state != DELETING_STATE
+
+    def record_resource_group(self, subscription_id, rg_name, provisioning_state="Succeeded"):
+        """
+        Add a resource group created during the run to the cache
+        """
+        # A subscription that was never listed will pick the group up when it is
+        with self.rg_lock:
+            if subscription_id in self.resource_groups:
+                self.resource_groups[subscription_id][rg_name.lower()] = provisioning_state
+
+    def forget_resource_group(self, subscription_id, rg_name):
+        """
+        Drop a resource group deleted during the run from the cache
+        """
+        with self.rg_lock:
+            if subscription_id in self.resource_groups:
+                self.resource_groups[subscription_id].pop(rg_name.lower(), None)
+        if self.inventory:
+            self.inventory.forget_resource_group(subscription_id, rg_name)
+
+    def close(self):
+        """
+        Close every client and the shared session at the end of the run
+        """
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients.clear()
+        self.session.close()
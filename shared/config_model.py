@@ -0,0 +1,215 @@
+"""
+config_model.py
+
+Compiled view of the input JSON shared by every script.
+
+The scripts used to find the subscription of a resource group, or a VNet by name, by
+scanning the config lists again for every item. load_config() parses the file once,
+builds dictionary indexes over it and resolves every cross-reference (peerings, DNS
+links, gateways, load balancer backends) to a full resource ID. Every dangling reference
+in the file is reported together before any Azure call is made.
+
+Usage:
+    config = load_config(args.input_file)
+    subscription_id = config.subscription(rg_name)
+    remote_vnet_id = config.vnet_id(remote_vnet_name)
+"""
+
+import json
+
+# Sections looked up by (resource group, name) and their Microsoft.Network resource types
+RESOURCE_TYPES = {
+    "nsgs": "networkSecurityGroups",
+    "route_tables": "routeTables",
+    "public_ips": "publicIPAddresses",
+    "vpn_gateways": "virtualNetworkGateways",
+    "local_network_gateways": "localNetworkGateways",
+    "load_balancers": "loadBalancers"
+}
+
+
+def network_id(subscription_id, rg_name, resource_type, name):
+    """
+    Build the resource ID of a Microsoft.Network resource
+    """
+    return f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}" \
+        f"/providers/Microsoft.Network/{resource_type}/{name}"
+
+
+class LabConfig(dict):
+    """
+    The input JSON plus name indexes; still readable as a plain dict
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        # Resource group -> subscription ID
+        self.subscriptions = {
+            rg["resource_group"]: rg["subscription_id"] for rg in self.get("resource_groups", [])
+        }
+
+        # VNets are referenced by name alone (peerings, DNS links, gateways, backends)
+        self.vnets = {}
+        for vnet in self.get("vnets", []):
+            self.vnets.setdefault(vnet["vnet_name"], vnet)
+
+        # Everything else is referenced by name within a resource group
+        self.resources = {section: {} for section in RESOURCE_TYPES}
+        for vnet in self.get("vnets", []):
+            for subnet in vnet["subnets"]:
+                if subnet.get("nsg_name"):
+                    self.resources["nsgs"].setdefault(
+                        (vnet["resource_group"], subnet["nsg_name"]), subnet)
+                if subnet.get("route_table_name"):
+                    self.resources["route_tables"].setdefault(
+                        (vnet["resource_group"], subnet["route_table_name"]), subnet)
+
+        for section in ("public_ips", "vpn_gateways", "local_network_gateways", "load_balancers"):
+            for item in self.get(section, []):
+                self.resources[section].setdefault((item["resource_group"], item["name"]), item)
+
+    def subscription(self, rg_name):
+        """
+        Return the subscription ID of a resource group in the input file
+        """
+        if rg_name not in self.subscriptions:
+            raise Exception(f"Subscription ID not found for resource group: {rg_name}")
+        return self.subscriptions[rg_name]
+
+    def find(self, section, rg_name, name):
+        """
+        Return the input record for a named resource, or None when it is not defined
+        """
+        return self.resources[section].get((rg_name, name))
+
+    def resource_id(self, section, rg_name, name):
+        """
+        Return the resource ID of a named resource in a resource group of the input file
+        """
+        return network_id(self.subscription(rg_name), rg_name, RESOURCE_TYPES[section], name)
+
+    def local_gateway(self, rg_name, name):
+        """
+        Return the input record of the local network gateway a connection in rg_name uses
+        """
+        # The connection's own resource group first, then the one group that defines the name
+        record = self.find("local_network_gateways", rg_name, name)
+        if record is not None:
+            return record
+        matches = [
+            item for (_, item_name), item in self.resources["local_network_gateways"].items()
+            if item_name == name
+        ]
+        if not matches:
+            raise Exception(f"local_network_gateways entry '{name}' not found")
+        if len(matches) > 1:
+            raise Exception(
+                f"local_network_gateways entry '{name}' is defined in several resource groups: "
+                + ", ".join(item["resource_group"] for item in matches))
+        return matches[0]
+
+    def local_gateway_id(self, rg_name, name):
+        """
+        Return the resource ID of the local network gateway a connection in rg_name uses
+        """
+        record = self.local_gateway(rg_name, name)
+        return self.resource_id("local_network_gateways", record["resource_group"], name)
+
+    def vnet_id(self, vnet_name):
+        """
+        Return the resource ID of a VNet defined in the input file
+        """
+        if vnet_name not in self.vnets:
+            raise Exception(f"VNet not found in input file: {vnet_name}")
+        rg_name = self.vnets[vnet_name]["resource_group"]
+        return network_id(self.subscription(rg_name), rg_name, "virtualNetworks", vnet_name)
+
+    def subnet_id(self, vnet_name, subnet_name):
+        """
+        Return the resource ID of a subnet in a VNet defined in the input file
+        """
+        return f"{self.vnet_id(vnet_name)}/subnets/{subnet_name}"
+
+    def check_references(self):
+        """
+        Resolve every cross-reference in the file and return a list of the ones that fail
+        """
+        problems = []
+
+        def check(where, resolve, *args):
+            try:
+                resolve(*args)
+            except Exception as e:
+                problems.append(f"{where}: {e}")
+
+        def check_named(where, section, rg_name, name):
+            if self.find(section, rg_name, name) is None:
+                problems.append(f"{where}: {section} entry '{name}' not found in {rg_name}")
+
+        # Every section that deploys into a resource group needs its subscription
+        for section in ("vnets", "private_dns_zones", *RESOURCE_TYPES):
+            for item in self.get(section, []):
+                name = item.get("vnet_name") or item.get("private_zone_name") or item.get("name")
+                check(f"{section} '{name}'", self.subscription, item["resource_group"])
+
+        for vnet in self.get("vnets", []):
+            for peering in vnet.get("peerings", []):
+                where = f"peering '{peering['peering_name']}'"
+                remote_vnet_name = peering.get("peering_settings", {}).get("remote_virtual_network")
+                if not remote_vnet_name:
+                    problems.append(f"{where}: no 'remote_virtual_network' specified")
+                else:
+                    check(where, self.vnet_id, remote_vnet_name)
+
+        for zone in self.get("private_dns_zones", []):
+            for link in zone["virtual_network_links"]:
+                where = f"DNS link '{link['link_name']}'"
+                check(where, self.vnet_id, link["vnet_name"])
+                vnet = self.vnets.get(link["vnet_name"])
+                if vnet and vnet["resource_group"] != link["vnet_resource_group"]:
+                    problems.append(
+                        f"{where}: VNet {link['vnet_name']} is not in {link['vnet_resource_group']}")
+
+        for gateway in self.get("vpn_gateways", []):
+            where = f"VPN gateway '{gateway['name']}'"
+            rg_name = gateway["resource_group"]
+            check(where, self.vnet_id, gateway["vnet_name"])
+            check_named(where, "public_ips", rg_name, gateway["public_ip_name"])
+            for connection in gateway.get("connections", []):
+                check(
+                    f"connection '{connection['name']}'",
+                    self.local_gateway_id, rg_name, connection["local_gateway_name"])
+
+        for load_balancer in self.get("load_balancers", []):
+            where = f"load balancer '{load_balancer['name']}'"
+            rg_name = load_balancer["resource_group"]
+            if load_balancer["type"] == "private":
+                check(where, self.vnet_id, load_balancer["vnet_name"])
+            else:
+                check_named(where, "public_ips", rg_name, load_balancer["public_ip_name"])
+
+            for backend_pool in load_balancer.get("backend_pools", []):
+                for backend_address in backend_pool.get("backend_addresses", []):
+                    if "backend_load_balancer_rg" in backend_address:
+                        check(where, self.subscription, backend_address["backend_load_balancer_rg"])
+                    else:
+                        check(where, self.vnet_id, backend_address["vnet_name"])
+
+        return problems
+
+
+def load_config(input_file):
+    """
+    Load the input JSON, index it and fail on every unresolved reference at once
+    """
+    with open(input_file, 'r', encoding='utf-8') as f:
+        config = LabConfig(json.load(f))
+
+    problems = config.check_references()
+    if problems:
+        raise Exception(
+            f"{len(problems)} unresolved reference(s) in {input_file}:\n  - "
+            + "\n  - ".join(problems))
+
+    return config
@@ -0,0 +1,166 @@
+"""
+deploy_state.py
+
+Content hashes of the applied desired state, for incremental runs.
+
+A one-line change to one NSG rule still makes the scripts rebuild and PUT every resource
+in the input. DeployState keeps, per resource, a SHA-256 of the canonical JSON of its
+desired spec together with the output entry of the last successful apply:
+
+    {
+        "network_security_groups.begin_create_or_update/rg-az-700-labs-central/nsg-app": {
+            "hash": "9f2c...",
+            "result": {"nsg_name": "nsg-app", "status": "success", ...},
+            "applied_at": "2025-01-01T00:00:00+00:00"
+        }
+    }
+
+The spec of an operation is its method and arguments (the request body is built only
+from the resource's subtree of the input, so it changes exactly when that subtree does),
+or its "spec" entry when it is a then-chain whose body is only known after a read. With
+--incremental, runner.py replaces every operation whose hash matches the state file by
+its stored result, without reading live state, and runs the rest plus every operation
+that depends on one of them. Then-chains without a "spec" always run.
+
+Changes made outside these runs (in the portal, or by another tool) are not seen. A run
+without --incremental applies everything and, when the state file exists, refreshes it.
+
+Usage:
+    deploy_state = open_deploy_state(args.deploy_state, args.incremental)
+    output = execute_operations(operations, max_parallel, clients, deploy_state=deploy_state)
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+from plan import to_plain
+
+# State file used when the scripts are not given --deploy_state
+DEFAULT_DEPLOY_STATE_FILE = "deploy_state.json"
+
+
+def spec_hash(spec):
+    """
+    Hash the canonical JSON of a desired spec
+    """
+    canonical = json.dumps(to_plain(spec), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def operation_identity(operation):
+    """
+    Name the resource an operation applies: its graph key, or its method and path arguments
+    """
+    if "key" in operation:
+        return operation["key"]
+    path = [str(arg) for arg in operation["args"] if isinstance(arg, str)]
+    return "/".join([operation["method"]] + path).lower()
+
+
+def operation_spec(operation):
+    """
+    Return the desired spec of an operation, or None when it cannot be hashed
+    """
+    if "spec" in operation:
+        return operation["spec"]
+    if "then" in operation:
+        return None
+    return {
+        "subscription_id": operation["subscription_id"],
+        "method": operation["method"],
+        "args": operation["args"]
+    }
+
+
+class DeployState:
+    """
+    Spec hashes and last results by resource, persisted to a JSON file
+    """
+
+    def __init__(self, path=DEFAULT_DEPLOY_STATE_FILE, incremental=False):
+        self.path = path
+        self.incremental = incremental
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def stored_result(self, operation):
+        """
+        Return the last result of an operation whose spec has not changed, or None
+        """
+        spec = operation_spec(operation)
+        entry = self.entries.get(operation_identity(operation))
+        if spec is None or entry is None or entry["hash"] != spec_hash(spec):
+            return None
+        return entry["result"]
+
+    def replace_unchanged(self, operations):
+        """
+        Replace the unchanged operations by their stored result, keeping their dependents
+        """
+        stored = [
+            None if "result" in operation else self.stored_result(operation)
+            for operation in operations
+        ]
+
+        # An operation runs again when anything it depends on runs, transitively
+        keys = {op["key"]: index for index, op in enumerate(operations) if "key" in op}
+        changed = True
+        while changed:
+            changed = False
+            for index, operation in enumerate(operations):
+                if stored[index] is None:
+                    continue
+                if any(dependency not in keys or stored[keys[dependency]] is None
+                       for dependency in operation.get("depends_on", [])):
+                    stored[index] = None
+                    changed = True
+
+        skipped = []
+        for operation, result in zip(operations, stored):
+            if result is None:
+                skipped.append(operation)
+                continue
+            entry = {"result": {**result, "action": "unchanged"}}
+            if "key" in operation:
+                entry["key"] = operation["key"]
+            skipped.append(entry)
+
+        unchanged = sum(result is not None for result in stored)
+        print(f"Incremental: {unchanged} unchanged, {len(operations) - unchanged} to apply")
+        return skipped
+
+    def record(self, operations, results):
+        """
+        Store the spec hash and result of every operation that was applied successfully
+        """
+        applied_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        for operation, result in zip(operations, results):
+            if "result" in operation or result.get("status") != "success":
+                continue
+            spec = operation_spec(operation)
+            if spec is None:
+                continue
+            self.entries[operation_identity(operation)] = {
+                "hash": spec_hash(spec),
+                "result": result,
+                "applied_at": applied_at
+            }
+
+    def save(self):
+        """
+        Write the state file
+        """
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+
+
+def open_deploy_state(path, incremental=False):
+    """
+    Open the state file for an incremental run, or to refresh one that already exists
+    """
+    if incremental or os.path.exists(path):
+        return DeployState(path, incremental)
+    return None
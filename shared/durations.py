@@ -0,0 +1,240 @@
+"""
+durations.py
+
+Operation durations from past runs, for critical-path scheduling and wall time estimates.
+
+Provisioning times differ by orders of magnitude: a subnet is ready in seconds, a public
+IP in about a minute and a VPN gateway in 30-45 minutes. When max_parallel caps the
+number of operations in flight, starting them in input order can leave a gateway (and
+the connections that wait for it) queued behind dozens of quick writes. DurationHistory
+keeps the mean time of every finished LRO in a local file, by operation group, SKU and
+region:
+
+    {
+        "virtual_network_gateways/VpnGw1/centralus": {"count": 3, "mean_seconds": 1712.4},
+        "public_ip_addresses/Standard/centralus": {"count": 6, "mean_seconds": 48.9},
+        "subnets/-/-": {"count": 40, "mean_seconds": 6.2}
+    }
+
+A then-chain is timed as a whole and kept under the group of its "duration_group" entry
+when its first call is only a read (e.g. the gateway GETs before a connection). Keys
+that were never seen fall back to the same group and SKU in another region, then to
+DEFAULT_SECONDS.
+
+prioritize() sets the "priority" of every operation to the length of the longest chain
+of estimated durations from it to the end of the graph, so runner.py and async_runner.py
+start the critical path first. estimate() replays the graph on max_parallel slots with
+those estimates (parents serialized as in runner.py, no throttling) and predicts the wall
+time of a run before anything is written.
+
+Usage:
+    durations = DurationHistory(args.durations_file)
+    output = execute_operations(operations, max_parallel, clients, durations=durations)
+    total, entries = durations.estimate(operations, max_parallel)
+"""
+
+import os
+import json
+import heapq
+from plan import to_plain
+from polling import operation_group
+from runner import index_operations
+
+# History file used when the scripts are not given --durations_file
+DEFAULT_DURATIONS_FILE = "durations.json"
+
+# Seconds assumed for an operation group with no history
+DEFAULT_SECONDS = {
+    "resource_groups": 5,
+    "virtual_networks": 10,
+    "subnets": 5,
+    "network_security_groups": 10,
+    "route_tables": 10,
+    "virtual_network_peerings": 15,
+    "private_zones": 40,
+    "virtual_network_links": 40,
+    "public_ip_addresses": 60,
+    "network_interfaces": 20,
+    "load_balancers": 30,
+    "local_network_gateways": 60,
+    "virtual_network_gateways": 1800,
+    "virtual_network_gateway_connections": 120,
+    "deployments": 600
+}
+
+# Seconds assumed for groups that are not listed above
+DEFAULT_DURATION = 30
+
+# Active-active gateways take about half as long again as single-instance ones
+ACTIVE_ACTIVE_FACTOR = 1.5
+
+# Runs averaged into a mean before older runs start to fade out
+HISTORY_WINDOW = 20
+
+
+def duration_key(operation):
+    """
+    Build the history key of an operation: operation group, SKU and region
+    """
+    group = operation.get("duration_group") or operation_group(operation["method"])
+    parameters = to_plain(operation["args"][-1]) if operation.get("args") else None
+    if not isinstance(parameters, dict):
+        parameters = {}
+
+    sku = parameters.get("sku")
+    sku = (sku.get("name") if isinstance(sku, dict) else getattr(sku, "name", sku)) or "-"
+    if group == "virtual_network_gateways" and parameters.get("active"):
+        sku += " active-active"
+    region = str(parameters.get("location") or "-").replace(" ", "").lower()
+    return f"{group}/{sku}/{region}"
+
+
+class DurationHistory:
+    """
+    Mean durations by operation group, SKU and region, persisted to a JSON file
+    """
+
+    def __init__(self, path=DEFAULT_DURATIONS_FILE):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def seconds(self, operation):
+        """
+        Estimate how long an operation (and its then-chain) takes, from history or defaults
+        """
+        if "result" in operation:
+            return 0
+        key = duration_key(operation)
+        if key in self.entries:
+            return self.entries[key]["mean_seconds"]
+
+        # Same group and SKU in other regions, weighted by how often each was seen
+        group, sku, _ = key.split("/")
+        similar = [entry for other, entry in self.entries.items()
+                   if other.startswith(f"{group}/{sku}/")]
+        if similar:
+            count = sum(entry["count"] for entry in similar)
+            return sum(entry["mean_seconds"] * entry["count"] for entry in similar) / count
+
+        seconds = DEFAULT_SECONDS.get(group, DEFAULT_DURATION)
+        if sku.endswith(" active-active"):
+            seconds *= ACTIVE_ACTIVE_FACTOR
+        return seconds
+
+    def record(self, operation, seconds):
+        """
+        Fold the measured duration of a successful operation into its mean
+        """
+        entry = self.entries.setdefault(
+            duration_key(operation), {"count": 0, "mean_seconds": 0.0})
+        entry["count"] += 1
+        weight = min(entry["count"], HISTORY_WINDOW)
+        entry["mean_seconds"] = round(
+            entry["mean_seconds"] + (seconds - entry["mean_seconds"]) / weight, 1)
+
+    def critical_paths(self, operations):
+        """
+        Return, per operation, the estimated seconds from its start to the end of the graph
+        """
+        keys = index_operations(operations)
+        dependents = {}
+        for index, operation in enumerate(operations):
+            for dependency in operation.get("depends_on", []):
+                dependents.setdefault(keys[dependency], []).append(index)
+
+        lengths = {}
+
+        def length(index):
+            if index not in lengths:
+                lengths[index] = self.seconds(operations[index]) + max(
+                    (length(dependent) for dependent in dependents.get(index, [])), default=0)
+            return lengths[index]
+
+        return [length(index) for index in range(len(operations))]
+
+    def prioritize(self, operations):
+        """
+        Return the operations with their critical path length (seconds) as priority
+        """
+        return [
+            operation if "result" in operation else {**operation, "priority": round(path, 1)}
+            for operation, path in zip(operations, self.critical_paths(operations))
+        ]
+
+    def estimate(self, operations, max_parallel):
+        """
+        Simulate a run on max_parallel slots; return the wall time and an entry per operation
+        """
+        keys = index_operations(operations)
+        paths = self.critical_paths(operations)
+        pending = sorted(
+            (index for index, operation in enumerate(operations) if "result" not in operation),
+            key=lambda index: -paths[index])
+        done = {index for index, operation in enumerate(operations) if "result" in operation}
+        starts = {}
+        running = []
+        busy_parents = set()
+        now = 0
+
+        while pending or running:
+            # Start every ready operation, critical path first, while a slot is free
+            for index in list(pending):
+                if len(running) >= max(1, max_parallel):
+                    break
+                operation = operations[index]
+                if any(keys[dependency] not in done
+                       for dependency in operation.get("depends_on", [])):
+                    continue
+                parent = operation.get("parent")
+                if parent and parent in busy_parents:
+                    continue
+                pending.remove(index)
+                starts[index] = now
+                if parent:
+                    busy_parents.add(parent)
+                heapq.heappush(running, (now + self.seconds(operation), index))
+
+            if not running:
+                break
+
+            # Move on to the next operation that finishes
+            now, index = heapq.heappop(running)
+            done.add(index)
+            busy_parents.discard(operations[index].get("parent"))
+
+        entries = []
+        for index, operation in enumerate(operations):
+            if "result" in operation:
+                entries.append(operation["result"])
+                continue
+            entries.append({
+                **operation.get("fields", {}),
+                "duration_key": duration_key(operation),
+                "estimated_seconds": round(self.seconds(operation), 1),
+                "estimated_start_seconds": round(starts.get(index, now), 1),
+                "critical_path_seconds": round(paths[index], 1)
+            })
+        return now, entries
+
+    def save(self):
+        """
+        Write the history file
+        """
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+
+
+def report_estimate(total, entries, max_parallel):
+    """
+    Print the predicted wall time and the operations on the critical path
+    """
+    timed = [entry for entry in entries if "critical_path_seconds" in entry]
+    print(f"Estimate: {len(timed)} operation(s) in about {total / 60:.1f} minute(s) "
+          f"with max_parallel {max_parallel}")
+    if timed:
+        longest = max(timed, key=lambda entry: entry["critical_path_seconds"])
+        print(f"Critical path: {longest['critical_path_seconds'] / 60:.1f} minute(s) "
+              f"starting with {longest['duration_key']}")
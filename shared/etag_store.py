@@ -0,0 +1,120 @@
+"""
+etag_store.py
+
+ETags for conditional reads and optimistic-concurrency writes.
+
+A read-modify-write (GET the subnet, change its NSG, PUT it back) downloads the whole
+resource on every run and overwrites whatever another writer changed between the GET and
+the PUT. EtagStore keeps the last ETag and body seen for each resource ID in a local file:
+
+    - conditional_read() adds If-None-Match with the stored ETag to a GET; when ARM
+      answers 304 Not Modified, runner.py uses the stored body instead ("not_modified")
+    - if_match() adds If-Match with the ETag of the body being written back; when another
+      writer changed the resource in the meantime ARM answers 412 Precondition Failed and
+      runner.py starts the operation's "retry_on_conflict" (a fresh read) instead of
+      overwriting the change, up to MAX_CONFLICT_RETRIES times
+
+The file maps resource IDs (lower case) to the ETag and the REST JSON of the resource
+(as_dict() of the SDK model, rebuilt with the model class on a 304):
+
+    {
+        "/subscriptions/.../virtualnetworks/vnet-lab-central/subnets/snet-app": {
+            "etag": "W/\\"...\\"",
+            "body": {...}
+        }
+    }
+
+Usage:
+    etags = EtagStore("etags.json")
+    read = etags.conditional_read(operation, resource_id, Subnet)
+    write = if_match(write, subnet)
+    etags.save()
+"""
+
+import os
+import json
+from azure.core.exceptions import ResourceNotModifiedError
+
+# ETag file used when the scripts are not given --etag_file
+DEFAULT_ETAG_FILE = "etags.json"
+
+# Times an operation is read and written again after a 412 before it is failed
+MAX_CONFLICT_RETRIES = 3
+
+
+def not_modified(error):
+    """
+    Check whether an exception is the 304 answer to a conditional read
+    """
+    return isinstance(error, ResourceNotModifiedError) or \
+        getattr(error, "status_code", None) == 304
+
+
+def precondition_failed(error):
+    """
+    Check whether an exception is the 412 answer to a write whose If-Match did not match
+    """
+    response = getattr(error, "response", None)
+    status_code = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    return status_code == 412
+
+
+def with_header(operation, name, value):
+    """
+    Return a copy of an operation that sends one more request header
+    """
+    kwargs = dict(operation.get("kwargs", {}))
+    kwargs["headers"] = {**kwargs.get("headers", {}), name: value}
+    return {**operation, "kwargs": kwargs}
+
+
+def if_match(operation, resource):
+    """
+    Make a write conditional on the ETag of the body it writes back
+    """
+    if not getattr(resource, "etag", None):
+        return operation
+    return with_header(operation, "If-Match", resource.etag)
+
+
+class EtagStore:
+    """
+    ETag and body of each resource seen, persisted to a JSON file between runs
+    """
+
+    def __init__(self, path=DEFAULT_ETAG_FILE):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def remember(self, resource):
+        """
+        Store the ETag and body of a resource that was read or written
+        """
+        if getattr(resource, "etag", None) and getattr(resource, "id", None):
+            self.entries[resource.id.lower()] = {
+                "etag": resource.etag,
+                "body": resource.as_dict()
+            }
+        return resource
+
+    def conditional_read(self, operation, resource_id, model_class):
+        """
+        Make a GET conditional on the stored ETag, with the stored body as its 304 result
+        """
+        entry = self.entries.get(resource_id.lower())
+        if entry is None:
+            return operation
+        return {
+            **with_header(operation, "If-None-Match", entry["etag"]),
+            "not_modified": model_class(entry["body"])
+        }
+
+    def save(self):
+        """
+        Write the ETags back to the file
+        """
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
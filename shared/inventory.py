@@ -0,0 +1,275 @@
+"""
+inventory.py
+
+Local SQLite cache of the network resources in each subscription.
+
+The scripts read the resources they build on one at a time: update_subnet.py GETs every
+subnet, create_vng_connection.py GETs both gateways of every connection and
+create_load_balancer.py lists the NICs of every resource group again. prefetch_inventory.py
+pages through each resource type once per subscription, all subscriptions and types at
+the same time, and stores every resource here. With --inventory_file a script answers
+its reads from that file instead:
+
+    - a GET is answered when the resource was fetched less than the TTL ago; anything
+      else (a miss, a stale entry) falls through to ARM and the answer is stored
+    - a listing is answered when the whole scope (subscription, or resource group) was
+      listed less than the TTL ago
+    - every create, update or GET that reaches ARM writes its result back, and a delete
+      removes the resource, so later reads in the same run see the new state
+
+Resources are stored as the REST JSON of the SDK model (as_dict(), read-only fields
+included, so IDs, etags and provisioning states are kept) and rebuilt from it as the same
+model class on the way out, so a cached subnet or gateway can be modified and written
+back like a fetched one. The cache only saves round trips: a resource that cannot be
+stored is logged and left to the next read.
+
+Usage:
+    inventory = open_inventory("inventory.db", ttl=900)
+    clients = ClientRegistry(inventory=inventory)
+    gateway = clients.read("network", subscription_id, "virtual_network_gateways.get",
+                           rg_name, gateway_name)
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from azure.mgmt.network.models import (
+    VirtualNetwork, Subnet, NetworkSecurityGroup, RouteTable, NetworkInterface,
+    PublicIPAddress, LoadBalancer, VirtualNetworkGateway, LocalNetworkGateway)
+from azure.mgmt.privatedns.models import PrivateZone
+
+# Inventory file written by prefetch_inventory.py
+DEFAULT_INVENTORY_FILE = "inventory.db"
+
+# Seconds a cached resource or listing is trusted
+DEFAULT_TTL = 900
+
+# SDK model classes of the cached resource types, by SDK operation group
+MODEL_CLASSES = {
+    "virtual_networks": VirtualNetwork,
+    "subnets": Subnet,
+    "network_security_groups": NetworkSecurityGroup,
+    "route_tables": RouteTable,
+    "network_interfaces": NetworkInterface,
+    "public_ip_addresses": PublicIPAddress,
+    "load_balancers": LoadBalancer,
+    "virtual_network_gateways": VirtualNetworkGateway,
+    "local_network_gateways": LocalNetworkGateway,
+    "private_zones": PrivateZone
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    subscription_id TEXT NOT NULL,
+    operation_group TEXT NOT NULL,
+    path TEXT NOT NULL,
+    resource_group TEXT NOT NULL,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (subscription_id, operation_group, path)
+);
+CREATE TABLE IF NOT EXISTS listings (
+    subscription_id TEXT NOT NULL,
+    operation_group TEXT NOT NULL,
+    resource_group TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (subscription_id, operation_group, resource_group)
+);
+"""
+
+
+def resource_path(names):
+    """
+    Build the cache path of a resource from its resource group and names, e.g. 'rg/vnet/subnet'
+    """
+    return "/".join(str(name) for name in names).lower()
+
+
+def id_names(resource_id):
+    """
+    Split a resource ID into its resource group and resource names
+    """
+    # /subscriptions/{s}/resourceGroups/{rg}/providers/{ns}/{type}/{name}[/{type}/{name}]
+    parts = resource_id.split("/")
+    return [parts[4]] + parts[8::2]
+
+
+class Inventory:
+    """
+    SQLite store of SDK models with a TTL, keyed by subscription, operation group and path
+    """
+
+    def __init__(self, path=DEFAULT_INVENTORY_FILE, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def fresh_since(self):
+        """
+        Return the oldest fetch time that is still within the TTL
+        """
+        return time.time() - self.ttl
+
+    def store(self, subscription_id, group, model, fetched_at=None):
+        """
+        Store one resource, plus the subnets of a VNet; lock held by the caller
+        """
+        names = id_names(model.id)
+        fetched_at = fetched_at or time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?)",
+            (subscription_id.lower(), group, resource_path(names), names[0].lower(),
+             json.dumps(model.as_dict()), fetched_at))
+
+        # A VNet carries its subnets
+        if group == "virtual_networks":
+            for subnet in model.subnets or []:
+                self.store(subscription_id, "subnets", subnet, fetched_at)
+
+    def put(self, subscription_id, group, model):
+        """
+        Store a resource read or written during the run
+        """
+        if group not in MODEL_CLASSES or not getattr(model, "id", None):
+            return
+        with self.lock, self.connection:
+            self.store(subscription_id, group, model)
+
+            # The cached VNet still carries the previous copy of the subnet
+            if group == "subnets":
+                self.connection.execute(
+                    "DELETE FROM resources WHERE subscription_id = ? AND operation_group = ? "
+                    "AND path = ?",
+                    (subscription_id.lower(), "virtual_networks",
+                     resource_path(id_names(model.id)[:2])))
+
+    def put_listing(self, subscription_id, group, models, rg_name=None):
+        """
+        Replace every resource of a listed scope and mark the scope as listed
+        """
+        subscription_id = subscription_id.lower()
+        scope = (rg_name or "").lower()
+        groups = [group, "subnets"] if group == "virtual_networks" else [group]
+        now = time.time()
+
+        with self.lock, self.connection:
+            # Drop what the listing no longer returns, so deleted resources disappear
+            for listed_group in groups:
+                if scope:
+                    self.connection.execute(
+                        "DELETE FROM resources WHERE subscription_id = ? "
+                        "AND operation_group = ? AND resource_group = ?",
+                        (subscription_id, listed_group, scope))
+                else:
+                    self.connection.execute(
+                        "DELETE FROM resources WHERE subscription_id = ? "
+                        "AND operation_group = ?",
+                        (subscription_id, listed_group))
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?)",
+                    (subscription_id, listed_group, scope, now))
+
+            for model in models:
+                self.store(subscription_id, group, model, now)
+
+    def lookup(self, operation):
+        """
+        Return the fresh cached result of a GET operation, or None
+        """
+        group, name = operation["method"].rsplit(".", 1)
+        if name != "get" or group not in MODEL_CLASSES:
+            return None
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT data FROM resources WHERE subscription_id = ? AND operation_group = ? "
+                "AND path = ? AND fetched_at >= ?",
+                (operation["subscription_id"].lower(), group,
+                 resource_path(operation["args"]), self.fresh_since())).fetchone()
+        if row is None:
+            return None
+        return MODEL_CLASSES[group](json.loads(row[0]))
+
+    def listed(self, subscription_id, group, rg_name=None):
+        """
+        Return the cached resources of a scope when all of it was listed within the TTL
+        """
+        subscription_id = subscription_id.lower()
+        scope = (rg_name or "").lower()
+
+        with self.lock:
+            # A subscription-wide listing also covers each of its resource groups
+            covered = self.connection.execute(
+                "SELECT 1 FROM listings WHERE subscription_id = ? AND operation_group = ? "
+                "AND resource_group IN (?, '') AND fetched_at >= ?",
+                (subscription_id, group, scope, self.fresh_since())).fetchone()
+            if covered is None:
+                return None
+
+            query = "SELECT data FROM resources WHERE subscription_id = ? AND operation_group = ?"
+            values = [subscription_id, group]
+            if scope:
+                query += " AND resource_group = ?"
+                values.append(scope)
+            rows = self.connection.execute(query, values).fetchall()
+
+        return [MODEL_CLASSES[group](json.loads(data)) for (data,) in rows]
+
+    def record(self, operation, result):
+        """
+        Keep the cache in line with an operation that reached ARM
+        """
+        group, name = operation["method"].rsplit(".", 1)
+        if group not in MODEL_CLASSES:
+            return
+
+        # The operation itself succeeded; a cache that cannot be updated is only logged
+        try:
+            if name.endswith("delete"):
+                self.forget(operation)
+            elif name == "get" or name.endswith("create_or_update") or name == "update_tags":
+                self.put(operation["subscription_id"], group, result)
+        except Exception as e:
+            print(f"Inventory not updated after {operation['method']}: {e}")
+
+    def forget(self, operation):
+        """
+        Drop the resource an operation deletes or writes, and everything below it
+        """
+        group, name = operation["method"].rsplit(".", 1)
+        args = operation["args"] if name.endswith("delete") else operation["args"][:-1]
+        path = resource_path(args)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM resources WHERE subscription_id = ? AND "
+                "((operation_group = ? AND path = ?) OR path LIKE ?)",
+                (operation["subscription_id"].lower(), group, path, f"{path}/%"))
+
+    def forget_resource_group(self, subscription_id, rg_name):
+        """
+        Drop every cached resource of a deleted resource group
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM resources WHERE subscription_id = ? AND resource_group = ?",
+                (subscription_id.lower(), rg_name.lower()))
+            self.connection.execute(
+                "DELETE FROM listings WHERE subscription_id = ? AND resource_group = ?",
+                (subscription_id.lower(), rg_name.lower()))
+
+    def close(self):
+        """
+        Close the SQLite connection
+        """
+        with self.lock:
+            self.connection.close()
+
+
+def open_inventory(path, ttl=DEFAULT_TTL):
+    """
+    Open the inventory file given on the command line, or return None without one
+    """
+    return Inventory(path, ttl) if path else None
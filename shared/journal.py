@@ -0,0 +1,197 @@
+"""
+journal.py
+
+Crash-safe journal of the results of every run, one JSON line per finished resource.
+
+The scripts used to keep their results in memory and write output.json after the last
+resource, so a run killed an hour into a gateway deployment lost every result, and each
+run overwrote the results of the one before. Journal appends each result to journal.jsonl
+the moment it is known (flushed and fsynced, so a killed process loses at most the line
+being written) and never rewrites the file:
+
+    {"event": "run_started", "run_id": "20250101T120000Z-1a2b3c4d", "script": "deploy_all.py",
+     "started_at": "2025-01-01T12:00:00+00:00"}
+    {"event": "result", "run_id": "20250101T120000Z-1a2b3c4d", "slot": 3,
+     "resource_id": "/subscriptions/.../virtualNetworks/vnet-lab-central",
+     "started_at": "...", "finished_at": "...", "duration_seconds": 12.4, "attempts": 1,
+     "status": "success", "result": {"vnet_name": "vnet-lab-central", ...}}
+    {"event": "run_finished", "run_id": "20250101T120000Z-1a2b3c4d", ...}
+
+Each result takes the output slot it was given by reserve(), so results that finish out
+of order still land at their place; write_output() builds output.json from the lines of
+the run, in slot order, exactly as the scripts wrote it before. A slot journaled again
+(a peering created, then Connected) holds its latest result. tail_journal.py shows the
+progress of a run while it is going.
+
+When one operation stands for several output entries (one VNet update carrying the NSG
+associations of several subnets), SplitJournal journals the entries of each operation as
+soon as it finishes, in the slots reserved for them.
+
+Usage:
+    journal = Journal()
+    output = execute_operations(operations, max_parallel, clients, journal=journal)
+    journal.append(result, resource_id=resource_id)
+    journal.write_output()
+"""
+
+import os
+import sys
+import json
+import uuid
+import threading
+from datetime import datetime, timezone
+
+# Journal file used by every script in the working directory
+DEFAULT_JOURNAL_FILE = "journal.jsonl"
+
+
+def timestamp(moment=None):
+    """
+    Format a moment (default now) as an ISO 8601 UTC timestamp
+    """
+    moment = moment or datetime.now(timezone.utc)
+    return moment.isoformat(timespec="milliseconds")
+
+
+def parse_journal(text):
+    """
+    Parse journal lines, skipping a last line cut off by a crash
+    """
+    lines = []
+    for line in text.splitlines():
+        try:
+            lines.append(json.loads(line))
+        except ValueError:
+            continue
+    return lines
+
+
+def read_journal(path=DEFAULT_JOURNAL_FILE):
+    """
+    Return the journal lines as dictionaries
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_journal(f.read())
+
+
+class Journal:
+    """
+    Append-only JSON Lines log of the results of one run
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_FILE, script=None):
+        started = datetime.now(timezone.utc)
+        self.path = path
+        self.run_id = f"{started.strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:8]}"
+        self.script = script or os.path.basename(sys.argv[0])
+        self.lock = threading.Lock()
+        self.slots = 0
+        self.last_finished = started
+        self.file = open(path, 'a', encoding='utf-8')
+        self.write({
+            "event": "run_started",
+            "script": self.script,
+            "started_at": timestamp(started)
+        })
+
+    def write(self, line):
+        """
+        Append one line and push it to disk before returning
+        """
+        with self.lock:
+            self.file.write(json.dumps({**line, "run_id": self.run_id}) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def reserve(self, count=1):
+        """
+        Reserve count consecutive output slots and return the first one
+        """
+        with self.lock:
+            first = self.slots
+            self.slots += count
+        return first
+
+    def append(self, result, slot=None, started_at=None, attempts=1, resource_id=None):
+        """
+        Journal one finished resource; a result without a start began when the last one ended
+        """
+        if slot is None:
+            slot = self.reserve()
+        finished = datetime.now(timezone.utc)
+        started = started_at or self.last_finished
+        self.last_finished = max(self.last_finished, finished)
+        self.write({
+            "event": "result",
+            "slot": slot,
+            "resource_id": resource_id,
+            "started_at": timestamp(started),
+            "finished_at": timestamp(finished),
+            "duration_seconds": round((finished - started).total_seconds(), 3),
+            "attempts": attempts,
+            "status": result.get("status"),
+            "result": result
+        })
+
+    def extend(self, results):
+        """
+        Journal results that were all known at once, such as plan entries or an estimate
+        """
+        first = self.reserve(len(results))
+        for offset, result in enumerate(results):
+            self.append(result, first + offset)
+
+    def results(self):
+        """
+        Return the latest result journaled in each slot by this run, in slot order
+        """
+        slots = {}
+        for line in read_journal(self.path):
+            if line.get("run_id") == self.run_id and line.get("event") == "result":
+                slots[line["slot"]] = line["result"]
+        return [slots[slot] for slot in sorted(slots)]
+
+    def write_output(self, path='output.json'):
+        """
+        Close the run and build output.json from its journaled results
+        """
+        output = self.results()
+        statuses = {}
+        for result in output:
+            statuses[result.get("status")] = statuses.get(result.get("status"), 0) + 1
+        self.write({
+            "event": "run_finished",
+            "finished_at": timestamp(),
+            "results": len(output),
+            "statuses": statuses
+        })
+        self.file.close()
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        return output
+
+
+class SplitJournal:
+    """
+    Journal view that writes the result of each operation as several output entries
+    """
+
+    def __init__(self, journal, split):
+        self.journal = journal
+        self.split = split
+
+    def reserve(self, count=1):
+        """
+        The entries have slots of their own, so the runner's slot is the operation index
+        """
+        return 0
+
+    def append(self, result, slot=None, started_at=None, attempts=1, resource_id=None):
+        """
+        Journal the (slot, resource ID, entry) tuples split(index, result) returns
+        """
+        for entry_slot, entry_resource_id, entry in self.split(slot, result):
+            self.journal.append(entry, entry_slot, started_at, attempts, entry_resource_id)
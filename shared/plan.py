@@ -0,0 +1,241 @@
+"""
+plan.py
+
+Compare the desired state built from the input JSON with the live state in Azure.
+
+Every script PUTs every resource on every run, even when nothing changed, which costs a
+full LRO per resource and can undo changes made by other scripts (a subnet PUT without
+its NSG drops the association). With --plan or --skip_unchanged, runner.py first GETs
+each resource an operation would create or update and compares it with the parameters:
+
+    - only the fields the input sets are compared, so properties Azure adds (IDs,
+      provisioning state, associations made by other scripts) never count as changes
+    - strings are compared case-insensitively and locations without spaces
+      ("East US" == "eastus"), numbers and booleans by value ("45" == 45)
+    - a referenced resource ({"id": ...}) is compared by its ID alone
+    - lists of named items (rules, routes, subnets) are matched by name and must have
+      the same length; other lists of objects are compared in order and lists of
+      values regardless of order
+    - fields ARM never returns (WRITE_ONLY_FIELDS) are skipped
+    - the live resource is read field by field, by SDK attribute name (address_space)
+      or by REST name (addressSpace), so input dicts and SDK models nested in them
+      (which as_dict() turns into REST JSON) are compared with the same live model
+
+--plan writes the plan to output.json without changing anything. --skip_unchanged writes
+only the resources that are missing or differ; a rerun of an unchanged config makes no
+writes at all.
+
+Usage:
+    read = read_operation(operation)      # GET operation for the runner, or None
+    entry = plan_entry(operation, read_result)
+    operation = skip_if_unchanged(operation, entry)
+"""
+
+from functools import partial
+from collections.abc import Mapping
+
+# Fields the service accepts on a PUT but never returns, by SDK operation group
+WRITE_ONLY_FIELDS = {
+    "virtual_network_gateway_connections": {"shared_key"}
+}
+
+
+def to_plain(value):
+    """
+    Convert SDK models (desired parameters or GET results) into plain dicts and lists
+    """
+    if hasattr(value, "as_dict"):
+        value = value.as_dict()
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    return value
+
+
+def field(live, name):
+    """
+    Read one field of a live resource by its REST name or SDK attribute name, or None
+    """
+    if isinstance(live, Mapping) and name in live:
+        return live[name]
+    if isinstance(live, dict):
+        return None
+    return getattr(live, name, None)
+
+
+def is_object(value):
+    """
+    Check whether a live value is a resource, a sub-resource or a dict rather than a scalar
+    """
+    return value is not None and not isinstance(value, (str, int, float, bool, list))
+
+
+def normalize(key, value):
+    """
+    Normalize a scalar for comparison
+    """
+    text = str(getattr(value, "value", value)).lower()
+    if key == "location":
+        text = text.replace(" ", "")
+    return text
+
+
+def differences(desired, live, path="", ignore=()):
+    """
+    Return the paths of every field the desired state sets to something else than live
+    """
+    if desired is None:
+        return []
+    key = path.rsplit(".", 1)[-1]
+
+    if isinstance(desired, dict):
+        if not is_object(live):
+            return [path or "."]
+
+        # A reference to another resource only needs the same ID
+        if "id" in desired:
+            return [] if normalize("id", desired["id"]) == normalize("id", field(live, "id")) \
+                else [f"{path}.id" if path else "id"]
+
+        found = []
+        for name, value in desired.items():
+            if name in ignore:
+                continue
+            found += differences(value, field(live, name), f"{path}.{name}" if path else name)
+        return found
+
+    if isinstance(desired, list):
+        if not isinstance(live, list) or len(desired) != len(live):
+            return [path]
+
+        # Named items (rules, routes, subnets) are matched by name
+        if all(isinstance(item, dict) and "name" in item for item in desired):
+            live_items = {
+                normalize("name", field(item, "name")): item for item in live
+                if is_object(item)
+            }
+            found = []
+            for item in desired:
+                item_path = f"{path}[{item['name']}]"
+                if normalize("name", item["name"]) not in live_items:
+                    found.append(item_path)
+                else:
+                    found += differences(
+                        item, live_items[normalize("name", item["name"])], item_path)
+            return found
+
+        # Other lists of objects (IPsec policies) are compared in order
+        if any(isinstance(item, dict) for item in desired):
+            found = []
+            for position, (item, live_item) in enumerate(zip(desired, live)):
+                found += differences(item, live_item, f"{path}[{position}]")
+            return found
+
+        if sorted(normalize(key, item) for item in desired) \
+                != sorted(normalize(key, item) for item in live):
+            return [path]
+        return []
+
+    if live is None or normalize(key, desired) != normalize(key, live):
+        return [path]
+    return []
+
+
+def read_operation(operation):
+    """
+    Build the GET operation that reads the live state of a create or update operation
+    """
+    if "result" in operation or "then" in operation:
+        return None
+    group, name = operation["method"].rsplit(".", 1)
+    if not name.endswith("create_or_update"):
+        return None
+
+    # The GET takes the same path arguments, without the request body
+    return {
+        "client_type": operation["client_type"],
+        "subscription_id": operation["subscription_id"],
+        "method": f"{group}.get",
+        "args": operation["args"][:-1],
+        "fields": operation.get("fields", {}),
+        "success": partial(compare_live, operation)
+    }
+
+
+def compare_live(operation, live):
+    """
+    Build the plan entry of an operation from the live state of its resource
+    """
+    group = operation["method"].split(".")[0]
+    found = differences(
+        to_plain(operation["args"][-1]), live,
+        ignore=WRITE_ONLY_FIELDS.get(group, ()))
+    return {
+        **operation.get("fields", {}),
+        "action": "update" if found else "unchanged",
+        "differences": found,
+        "status": "success"
+    }
+
+
+def plan_entry(operation, read_result):
+    """
+    Build the plan entry of an operation from the result of its read (or None)
+    """
+    if "result" in operation:
+        return operation["result"]
+
+    fields = operation.get("fields", {})
+    if read_result is None:
+        # Operations that do not create or update one resource are always written
+        return {**fields, "action": "write", "status": "success"}
+
+    if read_result.get("status") == "success":
+        return read_result
+
+    # A resource that cannot be found is created; any other read error keeps the write
+    if "NotFound" in read_result.get("reason", ""):
+        return {**fields, "action": "create", "status": "success"}
+    return {
+        **fields,
+        "action": "update",
+        "status": "success",
+        "reason": f"Live state could not be read: {read_result.get('reason')}"
+    }
+
+
+def with_action(action, success, result):
+    """
+    Add the planned action to the output entry of a written resource
+    """
+    return {**success(result), "action": action}
+
+
+def skip_if_unchanged(operation, entry):
+    """
+    Replace an operation whose resource already matches the input by its plan entry
+    """
+    action = entry.get("action")
+    if action == "unchanged":
+        skipped = {"result": entry}
+        if "key" in operation:
+            skipped["key"] = operation["key"]
+        return skipped
+    if action in ("create", "update") and "success" in operation:
+        return {**operation, "success": partial(with_action, action, operation["success"])}
+    return operation
+
+
+def report_plan(entries):
+    """
+    Print how many resources would be created, updated, left unchanged or always written
+    """
+    counts = {}
+    for entry in entries:
+        action = entry.get("action", "failed" if entry.get("status") == "failed" else "write")
+        counts[action] = counts.get(action, 0) + 1
+
+    print(f"Plan: {counts.get('create', 0)} to create, {counts.get('update', 0)} to update, "
+          f"{counts.get('unchanged', 0)} unchanged, {counts.get('write', 0)} always written, "
+          f"{counts.get('failed', 0)} failed")
@@ -0,0 +1,183 @@
+"""
+polling.py
+
+Polling schedules for long-running operations (LROs), per resource type.
+
+The SDK polls every LRO at the same interval (or the Retry-After the service sends),
+whether the resource is a subnet that is ready in seconds or a VPN gateway that takes
+tens of minutes. AdaptiveARMPolling starts with a short delay, grows it exponentially and
+caps it at a value that fits how long that resource type usually takes, so quick
+resources are seen as done almost straight away and slow ones do not spend the read
+quota on thousands of status requests.
+
+Each polling object counts the status requests it sends and keeps its last delay, which
+bounds how late the completion was detected. PollingReport hands one polling object to
+every begin_* call made by runner.py or async_runner.py, adds "polls" and
+"detection_latency_max_seconds" to the output entries and prints a summary per resource
+type at the end of the run.
+
+The schedule replaces LROBasePolling._extract_delay, the step where azure-core picks
+the next delay from Retry-After or its fixed interval. The public polling_interval and
+timeout options only set that fixed interval, and Retry-After (often 10s or more on ARM)
+would still win over a short first delay. The method is not part of the documented
+azure-core API, so the version is pinned below and tests/test_polling.py runs a real
+LRO through the sync and aio clients to check that every delay comes from the schedule.
+
+Usage:
+    poller = network_client.virtual_network_gateways.begin_create_or_update(
+        rg_name, gateway_name, parameters, polling=adaptive_polling("virtual_network_gateways"))
+
+Requirements:
+    - 'azure-core>=1.41,<2' and 'azure-mgmt-core' (the versions tests/test_polling.py ran on)
+"""
+
+from azure.mgmt.core.polling.arm_polling import ARMPolling
+from azure.mgmt.core.polling.async_arm_polling import AsyncARMPolling
+
+# (first delay, growth factor, cap) in seconds, by SDK operation group; the cap is
+# roughly a tenth of the time the resource type usually takes to provision
+POLLING_PROFILES = {
+    "resource_groups": (10, 1.5, 60),
+    "virtual_networks": (2, 1.5, 10),
+    "subnets": (1, 1.5, 5),
+    "network_security_groups": (2, 1.5, 10),
+    "route_tables": (2, 1.5, 10),
+    "virtual_network_peerings": (2, 1.5, 10),
+    "private_zones": (5, 1.5, 30),
+    "virtual_network_links": (5, 1.5, 30),
+    "public_ip_addresses": (2, 1.5, 10),
+    "network_interfaces": (2, 1.5, 10),
+    "load_balancers": (2, 1.5, 15),
+    "local_network_gateways": (5, 1.5, 30),
+    "virtual_network_gateways": (60, 1.5, 240),
+    "virtual_network_gateway_connections": (10, 1.5, 60),
+    "deployments": (10, 1.5, 60)
+}
+
+# Schedule for operation groups without a profile
+DEFAULT_PROFILE = (5, 1.5, 30)
+
+
+def operation_group(method):
+    """
+    Return the SDK operation group of a dotted method name, e.g. 'subnets'
+    """
+    return method.split(".")[0]
+
+
+def is_lro(method):
+    """
+    Check whether a dotted method name starts a long-running operation
+    """
+    return method.split(".")[-1].startswith("begin_")
+
+
+class AdaptiveSchedule:
+    """
+    Exponential polling delay with a cap, plus poll counting
+    """
+
+    def __init__(self, profile, **kwargs):
+        self.first_delay, self.growth, self.cap = profile
+        self.next_delay = self.first_delay
+        self.last_delay = 0
+        self.polls = 0
+        super().__init__(timeout=self.first_delay, **kwargs)
+
+    def _extract_delay(self):
+        # Replaces the SDK's fixed interval / Retry-After with the resource type's schedule;
+        # private in azure-core, see the pin in the module docstring
+        self.last_delay = self.next_delay
+        self.next_delay = min(self.next_delay * self.growth, self.cap)
+        return self.last_delay
+
+
+class AdaptiveARMPolling(AdaptiveSchedule, ARMPolling):
+    """
+    ARMPolling on an adaptive schedule for the synchronous SDK clients
+    """
+
+    def update_status(self):
+        """
+        Send one status request and count it
+        """
+        self.polls += 1
+        super().update_status()
+
+
+class AsyncAdaptiveARMPolling(AdaptiveSchedule, AsyncARMPolling):
+    """
+    AsyncARMPolling on an adaptive schedule for the aio SDK clients
+    """
+
+    async def update_status(self):
+        """
+        Send one status request and count it
+        """
+        self.polls += 1
+        await super().update_status()
+
+
+def adaptive_polling(group, use_async=False):
+    """
+    Build the polling object for an LRO on one SDK operation group
+    """
+    polling_class = AsyncAdaptiveARMPolling if use_async else AdaptiveARMPolling
+    return polling_class(POLLING_PROFILES.get(group, DEFAULT_PROFILE))
+
+
+def polling_fields(pollings):
+    """
+    Build the polling cost fields of an output entry from the pollings of one operation
+    """
+    return {
+        "polls": sum(polling.polls for polling in pollings),
+        "detection_latency_max_seconds": round(
+            max(polling.last_delay for polling in pollings), 1)
+    }
+
+
+class PollingReport:
+    """
+    Polling objects handed out during a run, grouped by operation
+    """
+
+    def __init__(self, use_async=False):
+        self.use_async = use_async
+        self.pollings = {}
+
+    def polling(self, key, method):
+        """
+        Return a new polling object for an LRO method, or None for a plain call
+        """
+        if not is_lro(method):
+            return None
+        polling = adaptive_polling(operation_group(method), self.use_async)
+        self.pollings.setdefault(key, []).append((operation_group(method), polling))
+        return polling
+
+    def annotate(self, key, entry):
+        """
+        Add the polling cost of an operation to its output entry
+        """
+        pollings = [polling for _, polling in self.pollings.get(key, [])]
+        if pollings:
+            entry.update(polling_fields(pollings))
+        return entry
+
+    def report(self):
+        """
+        Print the number of status requests and the detection latency per resource type
+        """
+        totals = {}
+        for pollings in self.pollings.values():
+            for group, polling in pollings:
+                total = totals.setdefault(group, {"operations": 0, "polls": 0, "latency": 0})
+                total["operations"] += 1
+                total["polls"] += polling.polls
+                total["latency"] = max(total["latency"], polling.last_delay)
+
+        for group, total in totals.items():
+            print(f"Polling {group}: {total['polls']} status request(s) for "
+                  f"{total['operations']} operation(s), completion detected at most "
+                  f"{total['latency']:.1f}s late")
@@ -0,0 +1,140 @@
+"""
+prefetch_inventory.py
+
+This script reads a JSON configuration file and pages through the network resources of
+every subscription it references into a local SQLite inventory (see inventory.py):
+VNets and their subnets, NSGs, route tables, NICs, public IPs, load balancers, private
+DNS zones, and the virtual and local network gateways of every resource group. All of
+the listings run at the same time.
+
+Scripts run with --inventory_file afterwards answer their GETs and NIC listings from the
+inventory while it is younger than --cache_ttl, instead of one request per resource.
+
+Usage:
+    python ../shared/prefetch_inventory.py --input_file custom_input.json [--inventory_file inventory.db] [--max_parallel 10]
+
+Requirements:
+    - Azure CLI logged in OR environment credentials configured
+    - 'azure-identity', 'azure-mgmt-resource', 'azure-mgmt-network', and 'azure-mgmt-privatedns' libraries installed
+    - A valid JSON configuration file with the required structure
+"""
+
+# Import the needed credential and management objects from the libraries.
+import time
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from clients import ClientRegistry, DELETING_STATE
+from config_model import load_config
+from inventory import DEFAULT_INVENTORY_FILE, Inventory
+from journal import Journal
+
+# Resource types listed once per subscription: (client type, SDK operation group)
+SUBSCRIPTION_LISTINGS = [
+    ("network", "virtual_networks"),
+    ("network", "network_security_groups"),
+    ("network", "route_tables"),
+    ("network", "network_interfaces"),
+    ("network", "public_ip_addresses"),
+    ("network", "load_balancers"),
+    ("privatedns", "private_zones")
+]
+
+# Resource types without a subscription-wide listing, listed per resource group
+RESOURCE_GROUP_LISTINGS = [
+    ("network", "virtual_network_gateways"),
+    ("network", "local_network_gateways")
+]
+
+def prefetch(clients, client_type, subscription_id, group, rg_name=None):
+    """
+    List one resource type in one scope into the inventory and build its output entry
+    """
+    started = time.perf_counter()
+    result = {"subscription_id": subscription_id, "resource_type": group}
+    if rg_name:
+        result["resource_group"] = rg_name
+
+    try:
+        resources = clients.list_resources(
+            client_type, subscription_id, group, rg_name, refresh=True)
+        result["count"] = len(resources)
+        result["status"] = "success"
+    except Exception as e:
+        # Capture error and report failure
+        result["status"] = "failed"
+        result["reason"] = str(e)
+
+    result["seconds"] = round(time.perf_counter() - started, 1)
+    return result
+
+def main():
+    """
+    Main Loop
+    """
+
+    # Set up argument parser for dynamic input file
+    parser = argparse.ArgumentParser(
+        description="Prefetch the network resources of every subscription into a local inventory.")
+    parser.add_argument(
+        '--input_file', type=str, required=True, help='Path to the input JSON file.')
+    parser.add_argument(
+        '--inventory_file', type=str, default=DEFAULT_INVENTORY_FILE,
+        help='SQLite file to write the inventory to.')
+    parser.add_argument(
+        '--max_parallel', type=int, default=10,
+        help='Maximum number of listings to run at the same time.')
+    args = parser.parse_args()
+
+    # Load the input configuration JSON and check its references
+    config = load_config(args.input_file)
+
+    # Results are appended to journal.jsonl as they finish, not only at the end
+    journal = Journal()
+
+    # Shared SDK clients for the run, writing every listing to the inventory
+    inventory = Inventory(args.inventory_file)
+    clients = ClientRegistry(pool_size=max(args.max_parallel, 10), inventory=inventory)
+
+    # One listing per resource type and subscription, or per resource group
+    subscriptions = sorted({rg["subscription_id"] for rg in config["resource_groups"]})
+    listings = []
+    for subscription_id in subscriptions:
+        for client_type, group in SUBSCRIPTION_LISTINGS:
+            listings.append((client_type, subscription_id, group, None))
+
+        resource_groups = clients.list_resource_groups(subscription_id)
+        for rg_name, state in sorted(resource_groups.items()):
+            if state == DELETING_STATE:
+                continue
+            for client_type, group in RESOURCE_GROUP_LISTINGS:
+                listings.append((client_type, subscription_id, group, rg_name))
+
+    def journaled(slot, listing):
+        # Journal each listing under the scope it covers as soon as it is done
+        _, subscription_id, _, rg_name = listing
+        scope = f"/subscriptions/{subscription_id}"
+        if rg_name:
+            scope += f"/resourceGroups/{rg_name}"
+        started_at = datetime.now(timezone.utc)
+        result = prefetch(clients, *listing)
+        journal.append(result, slot, started_at, resource_id=scope)
+        return result
+
+    # Page through every listing at the same time
+    started = time.perf_counter()
+    first_slot = journal.reserve(len(listings))
+    with ThreadPoolExecutor(max_workers=max(1, args.max_parallel)) as executor:
+        output = list(executor.map(
+            lambda item: journaled(first_slot + item[0], item[1]), enumerate(listings)))
+
+    count = sum(result.get("count", 0) for result in output)
+    print(f"Prefetched {count} resource(s) from {len(listings)} listing(s) in "
+          f"{time.perf_counter() - started:.1f}s into {args.inventory_file}")
+    inventory.close()
+
+    # Build output.json from the results journaled during the run
+    journal.write_output()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+"""
+runner.py
+
+Helpers for running Azure long-running operations (LROs) with bounded concurrency.
+
+Each operation is a dictionary describing one SDK call:
+
+    {
+        "client_type": "network",
+        "subscription_id": subscription_id,
+        "method": "virtual_networks.begin_create_or_update",
+        "args": [rg_name, vnet_name, parameters],
+        "fields": {"vnet_name": vnet_name, "resource_group": rg_name},
+        "success": function that builds the output entry from the SDK result
+    }
+
+An operation may also define:
+    - "kwargs": keyword arguments passed along with args (for example the
+      continuation_token that rebuilds a poller saved by an earlier run)
+    - "then": a function that receives the SDK result and returns a follow-up operation
+      to run in the same output slot (for example associating an NSG with a subnet
+      once the NSG exists); the follow-up may name its own "parent", or be a "result"
+      when there is nothing left to write
+    - "key" and "depends_on": the operation starts only after every operation named in
+      depends_on has succeeded, and fails straight away if one of them failed
+    - "priority": a number; of the operations that are ready, higher priorities are
+      submitted first (for example so 45-minute gateway LROs start before quick writes)
+    - "parent": the resource ID of the parent being written (for example the VNet of a
+      subnet or the zone of a DNS link); operations with the same parent never run at the
+      same time, while operations on different parents run in parallel. ARM rejects
+      concurrent writes to one parent with AnotherOperationInProgress (409), so every
+      write held back behind another one on its parent is counted and reported at the end
+    - "not_modified": the result to use when a conditional GET (If-None-Match) is
+      answered with 304 Not Modified, usually the body stored with the ETag
+    - "retry_on_conflict": the operation to start over with when a conditional write
+      (If-Match) fails with 412 Precondition Failed, usually a fresh read (etag_store.py)
+    - "duration_group": the operation group a then-chain that starts with a read is timed
+      under (durations.py), for example the connection created after two gateway GETs
+    - "checkpoint": the identity the operation is checkpointed under (checkpoint.py)
+
+An operation that already has a "result" entry (for example a failed preflight check)
+is not submitted and its result is returned as-is.
+
+run_operations() takes the shared ClientRegistry from clients.py, submits up to
+max_parallel calls, collects the pollers as they finish and returns the output entries
+in the same order as the operations. The same operation list can be run on the asyncio
+engine in async_runner.py instead.
+
+Both engines also respect the registry's RateGovernor (throttling.py): an operation only
+starts when its subscription has a free slot under the adaptive limit, and an operation
+that fails with 429 Too Many Requests is put back in the queue instead of failing.
+Every begin_* call is polled on the schedule of its resource type (polling.py), and the
+output entries carry the number of status requests and the detection latency. When the
+client registry has an inventory (inventory.py), fresh cached GETs never reach ARM and
+every result that does is written back to it. When it has a batch endpoint (arm_batch.py),
+the threaded engine sends the GETs that are ready at the same time through /batch, up to
+BATCH_LIMIT per round trip; each batch takes one slot of its subscription. A read the
+batch does not answer successfully (or a batch that fails as a whole) is sent again as
+its own GET, so batching never changes what a read returns or raises.
+
+execute_operations() can first compare every create or update with the live state of its
+resource (plan.py): plan=True returns the plan without writing anything, and
+skip_unchanged=True submits only the operations whose resource is missing or differs.
+With a DeployState (deploy_state.py) whose incremental flag is set, operations whose spec
+hash matches the last applied run are not even read; their stored result is returned.
+With a DurationHistory (durations.py), every operation gets its critical path length as
+priority, and the time each successful LRO (with its then-chain) spent in calls is
+recorded into the history. With a Journal (journal.py), every result is appended to the
+journal the moment it is known, with its resource ID, timing and number of attempts.
+With a Checkpoint (checkpoint.py), the state of every operation and the continuation
+token of every LRO it submits are committed as they change, and a resumed run skips the
+operations that succeeded before and reattaches to the ones still in flight.
+"""
+
+import time
+from datetime import datetime, timezone
+from throttling import MAX_THROTTLE_RETRIES, THROTTLE_WAIT, throttled_retry_after
+from polling import PollingReport
+from plan import read_operation, plan_entry, skip_if_unchanged, report_plan
+from etag_store import MAX_CONFLICT_RETRIES, not_modified, precondition_failed
+from arm_batch import BATCH_LIMIT, batchable, resource_id
+
+# Seconds to wait on an in-flight poller before checking the others again
+POLL_INTERVAL = 1
+
+
+def get_method(client, method):
+    """
+    Resolve a dotted method name such as 'subnets.begin_create_or_update' on a client
+    """
+    target = client
+    for attribute in method.split("."):
+        target = getattr(target, attribute)
+    return target
+
+
+def is_poller(value):
+    """
+    Check whether an SDK call returned a poller rather than a finished result
+    """
+    return hasattr(value, "done") and hasattr(value, "result")
+
+
+def failed_entry(operation, error):
+    """
+    Build the output entry for an operation that raised an exception
+    """
+    return {
+        **operation.get("fields", {}),
+        "status": "failed",
+        "reason": str(error)
+    }
+
+
+def index_operations(operations):
+    """
+    Map operation keys to their position and reject unknown or circular dependencies
+    """
+    keys = {op["key"]: index for index, op in enumerate(operations) if "key" in op}
+
+    for operation in operations:
+        for dependency in operation.get("depends_on", []):
+            if dependency not in keys:
+                raise Exception(f"Unknown dependency '{dependency}' in operation list")
+
+    # Depth-first walk to find cycles
+    visiting, visited = set(), set()
+
+    def visit(key):
+        if key in visited:
+            return
+        if key in visiting:
+            raise Exception(f"Circular dependency involving '{key}'")
+        visiting.add(key)
+        for dependency in operations[keys[key]].get("depends_on", []):
+            visit(dependency)
+        visiting.discard(key)
+        visited.add(key)
+
+    for key in keys:
+        visit(key)
+
+    return keys
+
+
+def dependency_state(operation, results, keys):
+    """
+    Return 'ready', 'waiting', or the key of the first dependency that did not succeed
+    """
+    for dependency in operation.get("depends_on", []):
+        result = results[keys[dependency]]
+        if result is None:
+            return "waiting"
+        if result.get("status") != "success":
+            return dependency
+    return "ready"
+
+
+def report_serialized(held):
+    """
+    Print how many writes waited for another write to the same parent resource
+    """
+    if held:
+        print(f"Serialized {sum(held.values())} write(s) on {len(held)} parent resource(s) "
+              f"to avoid AnotherOperationInProgress conflicts")
+
+
+def run_operations(operations, max_parallel=1, clients=None, durations=None, journal=None,
+                   checkpoint=None):
+    """
+    Submit the operations with at most max_parallel in flight and return their results
+    """
+    keys = index_operations(operations)
+    current = list(operations)
+    results = [operation.get("result") for operation in operations]
+    pending = sorted(
+        (index for index, operation in enumerate(operations) if "result" not in operation),
+        key=lambda index: -operations[index].get("priority", 0))
+    in_flight = {}
+    busy_parents = {}
+    held = {}
+    held_indexes = set()
+    governor = clients.governor
+    inventory = clients.inventory
+    slots = {}
+    throttle_retries = {}
+    conflict_retries = {}
+    polling_report = PollingReport()
+    batches = {}
+    unbatched = set()
+    call_started = {}
+    call_seconds = {}
+    started_at = {}
+    resource_ids = {}
+    first_slot = journal.reserve(len(operations)) if journal else 0
+
+    def submit(index, operation):
+        # Start the call; calls that are not LROs finish straight away
+        call_started[index] = time.monotonic()
+        try:
+            cached = inventory.lookup(operation) if inventory else None
+            if cached is not None:
+                finish(index, operation, cached)
+                return
+
+            client = clients.get(operation["client_type"], operation["subscription_id"])
+            begin = get_method(client, operation["method"])
+            kwargs = dict(operation.get("kwargs", {}))
+            polling = None if "polling" in kwargs else polling_report.polling(
+                index, operation["method"])
+            if polling:
+                kwargs["polling"] = polling
+            poller = begin(*operation["args"], **kwargs)
+            if is_poller(poller):
+                if checkpoint:
+                    checkpoint.submitted(operations[index], operation, poller)
+                in_flight[index] = (operation, poller)
+            else:
+                finish(index, operation, recorded(operation, poller))
+        except Exception as e:
+            fail(index, operation, e)
+
+    def recorded(operation, result):
+        # Keep the inventory in line with everything that reached ARM
+        if inventory:
+            inventory.record(operation, result)
+        return result
+
+    def finish(index, operation, result):
+        # Add the time spent in the call, then record the result or start the follow-up
+        if index in call_started:
+            call_seconds[index] = call_seconds.get(index, 0) + \
+                time.monotonic() - call_started.pop(index)
+
+        if "then" not in operation:
+            resource_ids[index] = getattr(result, "id", None)
+            complete(index, operation["success"](result))
+            return
+
+        follow_up = operation["then"](result)
+        if "result" in follow_up:
+            complete(index, follow_up["result"])
+        elif index in slots and follow_up.get("parent") in (None, busy_parents.get(index)):
+            submit(index, follow_up)
+        else:
+            # The follow-up writes another parent, or its read went out in a batch that
+            # held no slot of its own; queue it like any other operation
+            requeue(index, follow_up, True)
+
+    def fail(index, operation, error):
+        # A conditional read answered with 304 goes on with the stored body
+        if "not_modified" in operation and not_modified(error):
+            finish(index, operation, operation["not_modified"])
+            return
+
+        # A write another writer got to first starts over from a fresh read
+        if "retry_on_conflict" in operation and precondition_failed(error) \
+                and conflict_retries.get(index, 0) < MAX_CONFLICT_RETRIES:
+            conflict_retries[index] = conflict_retries.get(index, 0) + 1
+            if inventory:
+                inventory.forget(operation)
+            requeue(index, operation["retry_on_conflict"], False)
+            return
+
+        # Put an operation throttled with 429 back in the queue instead of failing it
+        retry_after = throttled_retry_after(error)
+        if retry_after is not None and throttle_retries.get(index, 0) < MAX_THROTTLE_RETRIES:
+            throttle_retries[index] = throttle_retries.get(index, 0) + 1
+            governor.retried(operation["subscription_id"], retry_after)
+            requeue(index, operation, False)
+        else:
+            complete(index, failed_entry(operation, error))
+
+    def requeue(index, operation, succeeded):
+        busy_parents.pop(index, None)
+        if index in slots:
+            governor.release(slots.pop(index), succeeded)
+        current[index] = operation
+        pending.insert(0, index)
+
+    def complete(index, result):
+        # Only chains that waited on an LRO say anything about provisioning times
+        if durations and result.get("status") == "success" and index in polling_report.pollings:
+            durations.record(operations[index], call_seconds.get(index, 0))
+        results[index] = polling_report.annotate(index, result)
+        persisted(index)
+        busy_parents.pop(index, None)
+        if index in slots:
+            governor.release(slots.pop(index), result.get("status") == "success")
+
+    def persisted(index):
+        # Append the result to the journal and checkpoint as soon as it is known
+        if checkpoint:
+            checkpoint.finished(operations[index], results[index])
+        if not journal:
+            return
+        operation = current[index]
+        journal.append(
+            results[index], first_slot + index, started_at.get(index),
+            1 + throttle_retries.get(index, 0) + conflict_retries.get(index, 0),
+            resource_ids.get(index) or (resource_id(operation) if "method" in operation else None))
+
+    def send_batch(batch):
+        # Answer fresh cached reads locally and the rest in one /batch round trip
+        reads = []
+        for index, operation in batch:
+            cached = inventory.lookup(operation) if inventory else None
+            if cached is None:
+                reads.append((index, operation))
+                continue
+            try:
+                finish(index, operation, cached)
+            except Exception as e:
+                fail(index, operation, e)
+
+        try:
+            answers = clients.batch.read([operation for _, operation in reads]) if reads else []
+        except Exception as e:
+            print(f"Batched reads failed, reading one at a time: {e}")
+            answers = [None] * len(reads)
+
+        for (index, operation), answer in zip(reads, answers):
+            # A read the batch did not answer successfully is sent again as its own GET
+            if answer is None or isinstance(answer, Exception):
+                unbatched.add(index)
+                requeue(index, operation, False)
+                continue
+            try:
+                finish(index, operation, recorded(operation, answer))
+            except Exception as e:
+                fail(index, operation, e)
+
+    if checkpoint:
+        checkpoint.planned(operations)
+    for index, operation in enumerate(operations):
+        if "result" in operation:
+            persisted(index)
+
+    while pending or in_flight:
+        # Submit every ready operation until the concurrency limit is reached
+        for index in list(pending):
+            if len(in_flight) >= max(1, max_parallel):
+                break
+
+            operation = current[index]
+            state = dependency_state(operation, results, keys)
+            if state == "waiting":
+                continue
+
+            # Hold the write back while another one on the same parent is running
+            parent = operation.get("parent")
+            if state == "ready" and parent in busy_parents.values():
+                if index not in held_indexes:
+                    held_indexes.add(index)
+                    held[parent] = held.get(parent, 0) + 1
+                continue
+
+            if state != "ready":
+                pending.remove(index)
+                results[index] = failed_entry(operation, f"Dependency failed: {state}")
+                persisted(index)
+                continue
+
+            # Reads ready at the same time share one slot per batch of BATCH_LIMIT
+            subscription_id = operation["subscription_id"]
+            if clients.batch and batchable(operation) and index not in unbatched:
+                open_batches = batches.setdefault(subscription_id, [])
+                if not open_batches or len(open_batches[-1]) >= BATCH_LIMIT:
+                    if not governor.try_acquire(subscription_id, max(1, max_parallel)):
+                        continue
+                    open_batches.append([])
+                pending.remove(index)
+                started_at.setdefault(index, datetime.now(timezone.utc))
+                open_batches[-1].append((index, operation))
+                continue
+
+            # Wait for a free slot under the subscription's adaptive ARM limit
+            if not governor.try_acquire(subscription_id, max(1, max_parallel)):
+                continue
+
+            pending.remove(index)
+            started_at.setdefault(index, datetime.now(timezone.utc))
+            slots[index] = subscription_id
+            unbatched.discard(index)
+            if parent:
+                busy_parents[index] = parent
+            submit(index, operation)
+
+        # Send the batched reads; their follow-ups are queued for the next round
+        sent = bool(batches)
+        for subscription_id, open_batches in batches.items():
+            for batch in open_batches:
+                send_batch(batch)
+                governor.release(subscription_id)
+        batches.clear()
+
+        if not in_flight:
+            # Everything left is waiting for a throttled subscription
+            if pending and not sent:
+                time.sleep(THROTTLE_WAIT)
+            continue
+
+        # Block on the oldest poller for a moment, then collect everything that finished
+        next(iter(in_flight.values()))[1].wait(POLL_INTERVAL)
+        finished = [index for index, (_, poller) in in_flight.items() if poller.done()]
+
+        for index in finished:
+            operation, poller = in_flight.pop(index)
+            try:
+                finish(index, operation, recorded(operation, poller.result()))
+            except Exception as e:
+                fail(index, operation, e)
+
+    report_serialized(held)
+    governor.report()
+    polling_report.report()
+    if clients.batch:
+        clients.batch.report()
+    return results
+
+
+def plan_operations(operations, max_parallel=1, clients=None, use_async=False):
+    """
+    Read the live state behind every create or update and return one plan entry per operation
+    """
+    reads = [read_operation(operation) for operation in operations]
+
+    # The reads are independent of each other, so they all run in parallel
+    read_results = iter(execute_operations(
+        [read for read in reads if read], max_parallel, clients, use_async))
+
+    entries = [
+        plan_entry(operation, next(read_results) if read else None)
+        for operation, read in zip(operations, reads)
+    ]
+    report_plan(entries)
+    return entries
+
+
+def execute_operations(operations, max_parallel=1, clients=None, use_async=False,
+                       plan=False, skip_unchanged=False, deploy_state=None, durations=None,
+                       journal=None, checkpoint=None):
+    """
+    Run the operations on the threaded pollers or on the asyncio engine
+    """
+    # Operations whose spec hash is unchanged are not even read
+    if deploy_state and deploy_state.incremental:
+        operations = deploy_state.replace_unchanged(operations)
+    applied = operations
+
+    # A resumed run skips what succeeded before and reattaches to LROs in flight
+    if checkpoint:
+        operations = checkpoint.prepare(operations)
+
+    if plan or skip_unchanged:
+        entries = plan_operations(operations, max_parallel, clients, use_async)
+        if plan:
+            if journal:
+                journal.extend(entries)
+            return entries
+        operations = [
+            skip_if_unchanged(operation, entry) for operation, entry in zip(operations, entries)]
+
+    # Start the longest chains first when max_parallel holds operations back
+    if durations:
+        operations = durations.prioritize(operations)
+
+    if use_async:
+        # Imported here so the aio dependencies are only needed when asked for
+        from async_runner import run_operations_async
+        results = run_operations_async(
+            operations, max_parallel, clients.governor, clients.inventory, durations, journal,
+            checkpoint)
+    else:
+        results = run_operations(
+            operations, max_parallel, clients, durations, journal, checkpoint)
+
+    if deploy_state:
+        deploy_state.record(applied, results)
+        deploy_state.save()
+    if durations:
+        durations.save()
+    return results
@@ -0,0 +1,149 @@
+"""
+tail_journal.py
+
+This script shows the progress of a run from the journal (see journal.py) that every
+script appends its results to. Each finished resource is printed with its status, time,
+attempts and resource ID, followed by the counts per status; with --follow the script
+keeps reading the journal while the run is going and stops when it finishes.
+
+It only reads journal.jsonl, so it can be started in a second terminal at any point of a
+run, or after a run was killed to see which resources had finished.
+
+Usage:
+    python ../shared/tail_journal.py [--journal_file journal.jsonl] [--run_id RUN_ID] [--follow]
+    python ../shared/tail_journal.py --list
+
+Requirements:
+    - Python 3 standard library only
+"""
+
+# Import the needed objects from the standard library.
+import os
+import time
+import argparse
+from journal import DEFAULT_JOURNAL_FILE, parse_journal, read_journal
+
+# Seconds between reads of the journal with --follow
+FOLLOW_INTERVAL = 1
+
+def result_line(line):
+    """
+    Format one journaled result
+    """
+    status = line.get("status") or "-"
+    where = line.get("resource_id") or ", ".join(
+        str(value) for key, value in line["result"].items()
+        if key.endswith("_name") or key == "resource_group")
+    text = f"{line['finished_at'][11:19]}  {status:<9} {line['duration_seconds']:>8.1f}s"
+    if line.get("attempts", 1) > 1:
+        text += f"  attempts {line['attempts']}"
+    text += f"  {where}"
+    if line["result"].get("reason"):
+        text += f"\n{'':>30}{line['result']['reason']}"
+    return text
+
+def status_counts(counts):
+    """
+    Format the number of results per status
+    """
+    return ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+
+def list_runs(lines):
+    """
+    Print every run in the journal with its script and how it ended
+    """
+    runs = {}
+    for line in lines:
+        run = runs.setdefault(line["run_id"], {"script": "?", "results": 0, "finished": False})
+        if line["event"] == "run_started":
+            run["script"] = line["script"]
+        elif line["event"] == "result":
+            run["results"] += 1
+        elif line["event"] == "run_finished":
+            run["finished"] = True
+
+    for run_id, run in runs.items():
+        state = "finished" if run["finished"] else "running or interrupted"
+        print(f"{run_id}  {run['script']:<34} {run['results']:>5} result(s), {state}")
+
+def read_new_lines(path, offset):
+    """
+    Return the complete journal lines written after offset, and the new offset
+    """
+    if not os.path.exists(path):
+        return [], offset
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+
+    # A line still being written is read again on the next pass
+    complete = data[:data.rfind(b"\n") + 1]
+    return parse_journal(complete.decode("utf-8")), offset + len(complete)
+
+def main():
+    """
+    Main Loop
+    """
+
+    # Set up argument parser for the journal and run
+    parser = argparse.ArgumentParser(
+        description="Show the progress of a run from the result journal.")
+    parser.add_argument(
+        '--journal_file', type=str, default=DEFAULT_JOURNAL_FILE,
+        help='Journal the scripts append their results to.')
+    parser.add_argument(
+        '--run_id', type=str, default=None,
+        help='Run to show (default: the latest run in the journal).')
+    parser.add_argument(
+        '--follow', action='store_true',
+        help='Keep printing results until the run finishes.')
+    parser.add_argument(
+        '--list', action='store_true',
+        help='List the runs in the journal instead.')
+    args = parser.parse_args()
+
+    if args.list:
+        list_runs(read_journal(args.journal_file))
+        return
+
+    # Pick the latest run unless one was asked for
+    run_id = args.run_id
+    if run_id is None:
+        started = [line for line in read_journal(args.journal_file)
+                   if line["event"] == "run_started"]
+        if not started:
+            print(f"No runs in {args.journal_file}")
+            return
+        run_id = started[-1]["run_id"]
+
+    counts = {}
+    offset = 0
+    finished = None
+    while True:
+        lines, offset = read_new_lines(args.journal_file, offset)
+        for line in lines:
+            if line.get("run_id") != run_id:
+                continue
+            if line["event"] == "run_started":
+                print(f"Run {run_id}: {line['script']} started at {line['started_at']}")
+            elif line["event"] == "result":
+                status = line.get("status") or "-"
+                counts[status] = counts.get(status, 0) + 1
+                print(result_line(line))
+            elif line["event"] == "run_finished":
+                finished = line
+
+        if finished or not args.follow:
+            break
+        if lines:
+            print(f"-- {sum(counts.values())} result(s): {status_counts(counts)}")
+        time.sleep(FOLLOW_INTERVAL)
+
+    print(f"{sum(counts.values())} result(s): {status_counts(counts) or 'none yet'}")
+    if finished:
+        print(f"Run finished at {finished['finished_at']}")
+    else:
+        print("Run has not finished (still running, or interrupted)")
+
+if __name__ == "__main__":
+    main()
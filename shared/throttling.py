@@ -0,0 +1,217 @@
+"""
+throttling.py
+
+Adaptive concurrency per subscription for ARM requests.
+
+ARM limits reads and writes per subscription and region, and answers with 429 Too Many
+Requests plus a Retry-After header once a limit is reached. Every response also carries
+the remaining budget in x-ms-ratelimit-remaining-subscription-writes/reads. RateGovernor
+keeps a concurrency limit per subscription and adjusts it the way TCP does
+(additive-increase, multiplicative-decrease):
+
+    - each finished operation raises the limit by 1/limit, so about +1 per full round
+    - a 429, or a remaining budget below LOW_REMAINING, halves it (once per COOLDOWN)
+    - a 429 pauses new operations on the subscription until Retry-After has passed
+
+ThrottlingPolicy is added to every client pipeline by clients.py and reports each
+response to the governor, including the 429s the SDK retries on its own. runner.py and
+async_runner.py start an operation only when its subscription has a free slot, and put
+an operation that still failed with 429 back in the queue instead of failing it.
+
+Usage:
+    governor = RateGovernor()
+    if governor.try_acquire(subscription_id, max_parallel): ...
+    governor.release(subscription_id)
+"""
+
+import re
+import time
+import threading
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+
+# Response headers with the remaining ARM request budget of the subscription
+REMAINING_HEADERS = (
+    "x-ms-ratelimit-remaining-subscription-writes",
+    "x-ms-ratelimit-remaining-subscription-reads",
+    "x-ms-ratelimit-remaining-subscription-global-writes",
+    "x-ms-ratelimit-remaining-subscription-global-reads"
+)
+
+# Remaining requests below which the limit is cut before ARM starts returning 429
+LOW_REMAINING = 100
+
+# Factor applied to the limit on a 429 or a low remaining budget
+DECREASE_FACTOR = 0.5
+
+# Seconds after a cut during which further throttling signals do not cut again
+COOLDOWN = 5
+
+# Seconds to pause a subscription when a 429 has no usable Retry-After header
+DEFAULT_RETRY_AFTER = 10
+
+# Times an operation is put back in the queue after a 429 before it is failed
+MAX_THROTTLE_RETRIES = 5
+
+# Seconds between checks for a free slot while a subscription is full or paused
+THROTTLE_WAIT = 0.5
+
+SUBSCRIPTION_PATTERN = re.compile(r"/subscriptions/([^/?]+)", re.IGNORECASE)
+
+
+def retry_after_seconds(headers):
+    """
+    Read the Retry-After header as seconds, falling back to DEFAULT_RETRY_AFTER
+    """
+    try:
+        return max(float(headers.get("Retry-After")), 0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+def throttled_retry_after(error):
+    """
+    Return the Retry-After seconds of an exception caused by a 429, or None
+    """
+    response = getattr(error, "response", None)
+    status_code = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status_code != 429:
+        return None
+    return retry_after_seconds(response.headers if response is not None else {})
+
+
+class RateGovernor:
+    """
+    AIMD concurrency limit and Retry-After pause per subscription
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.limits = {}
+        self.in_flight = {}
+        self.paused_until = {}
+        self.last_cut = {}
+        self.stats = {}
+
+    def subscription_stats(self, subscription_id):
+        """
+        Return the throttling counters of a subscription, creating them on first use
+        """
+        return self.stats.setdefault(
+            subscription_id, {"throttled": 0, "retried": 0, "lowest_limit": None})
+
+    def try_acquire(self, subscription_id, ceiling):
+        """
+        Take a slot on the subscription if it is below its limit and not paused
+        """
+        with self.lock:
+            if time.monotonic() < self.paused_until.get(subscription_id, 0):
+                return False
+
+            limit = min(self.limits.setdefault(subscription_id, float(ceiling)), ceiling)
+            self.limits[subscription_id] = limit
+            if self.in_flight.get(subscription_id, 0) >= int(limit):
+                return False
+
+            self.in_flight[subscription_id] = self.in_flight.get(subscription_id, 0) + 1
+            return True
+
+    def release(self, subscription_id, succeeded=True):
+        """
+        Free a slot; a finished operation raises the limit additively
+        """
+        with self.lock:
+            self.in_flight[subscription_id] = max(self.in_flight.get(subscription_id, 0) - 1, 0)
+            if succeeded and subscription_id in self.limits:
+                self.limits[subscription_id] += 1 / self.limits[subscription_id]
+
+    def cut(self, subscription_id):
+        """
+        Cut the limit multiplicatively; called with the lock held
+        """
+        # One cut per COOLDOWN, however many throttling signals arrive at once
+        now = time.monotonic()
+        if now - self.last_cut.get(subscription_id, 0) < COOLDOWN:
+            return
+        self.last_cut[subscription_id] = now
+
+        limit = max(self.limits.get(subscription_id, 1) * DECREASE_FACTOR, 1)
+        self.limits[subscription_id] = limit
+        stats = self.subscription_stats(subscription_id)
+        if stats["lowest_limit"] is None or limit < stats["lowest_limit"]:
+            stats["lowest_limit"] = int(limit)
+
+    def pause(self, subscription_id, retry_after):
+        """
+        Pause the subscription for Retry-After seconds and cut its limit; lock held
+        """
+        self.paused_until[subscription_id] = max(
+            self.paused_until.get(subscription_id, 0), time.monotonic() + retry_after)
+        self.cut(subscription_id)
+
+    def throttled(self, subscription_id, retry_after):
+        """
+        Record a 429 response seen by the pipeline
+        """
+        with self.lock:
+            self.subscription_stats(subscription_id)["throttled"] += 1
+            self.pause(subscription_id, retry_after)
+
+    def remaining(self, subscription_id, remaining):
+        """
+        Record the remaining request budget reported by ARM
+        """
+        if remaining < LOW_REMAINING:
+            with self.lock:
+                self.cut(subscription_id)
+
+    def retried(self, subscription_id, retry_after):
+        """
+        Record an operation that failed with 429 and is put back in the queue
+        """
+        # The pipeline normally paused the subscription already; pausing again is harmless
+        with self.lock:
+            self.subscription_stats(subscription_id)["retried"] += 1
+            self.pause(subscription_id, retry_after)
+
+    def report(self):
+        """
+        Print the throttling seen per subscription, if any
+        """
+        for subscription_id, stats in self.stats.items():
+            if stats["lowest_limit"] is None:
+                continue
+            print(f"Subscription {subscription_id}: {stats['throttled']} throttled "
+                  f"response(s), {stats['retried']} operation(s) retried, concurrency "
+                  f"lowered to {stats['lowest_limit']}, ended at "
+                  f"{int(self.limits[subscription_id])}")
+
+
+class ThrottlingPolicy(SansIOHTTPPolicy):
+    """
+    Pipeline policy that reports ARM rate-limit headers and 429s to a RateGovernor
+    """
+
+    def __init__(self, governor):
+        super().__init__()
+        self.governor = governor
+
+    def on_response(self, request, response):
+        """
+        Report the response of every attempt, including the ones the SDK retries
+        """
+        match = SUBSCRIPTION_PATTERN.search(request.http_request.url)
+        if not match:
+            return
+        subscription_id = match.group(1)
+        headers = response.http_response.headers
+
+        if response.http_response.status_code == 429:
+            self.governor.throttled(subscription_id, retry_after_seconds(headers))
+            return
+
+        for header in REMAINING_HEADERS:
+            if header in headers:
+                try:
+                    self.governor.remaining(subscription_id, int(headers[header]))
+                except ValueError:
+                    pass
@@ -0,0 +1,100 @@
+"""
+conftest.py
+
+Put the shared helper modules on the import path, the way the week scripts do, and
+serve arm_stub_server.py to the tests that need ARM.
+"""
+
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+
+# Imported once shared/ is on the path
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+from azure.mgmt.network import NetworkManagementClient
+from arm_stub_server import StubState, handler_class
+from clients import ClientRegistry
+
+SUBSCRIPTION_ID = "00000000-0000-0000-0000-000000000000"
+
+RG_ID = f"/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/rg-lab"
+VNET_ID = f"{RG_ID}/providers/Microsoft.Network/virtualNetworks/vnet-lab"
+
+
+def read(method, *args, client_type="network"):
+    """
+    Build a read operation as the scripts queue it
+    """
+    return {
+        "client_type": client_type,
+        "subscription_id": SUBSCRIPTION_ID,
+        "method": method,
+        "args": list(args),
+        "fields": {"name": args[-1]},
+        "success": lambda result: {"name": result.name, "status": "success"}
+    }
+
+
+def subnet_reads(*names):
+    """
+    Build the GETs of subnets of the lab VNet
+    """
+    return [read("subnets.get", "rg-lab", "vnet-lab", name) for name in names]
+
+
+class StubCredential:
+    """
+    Credential that is never asked for a token: the stub is plain HTTP
+    """
+
+    def get_token(self, *scopes, **kwargs):
+        raise AssertionError("The ARM stub needs no token")
+
+
+class ArmStub:
+    """
+    arm_stub_server.py running on a free local port
+    """
+
+    def __init__(self, resources=None, only_listed=False):
+        self.state = StubState(resources or {}, only_listed, 0)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class(self.state))
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def clients(self, batch_endpoint=None):
+        """
+        Build a ClientRegistry whose network client and /batch sender both use the stub
+        """
+        clients = ClientRegistry(StubCredential(), batch_endpoint=batch_endpoint or self.endpoint)
+        clients.clients[("network", SUBSCRIPTION_ID)] = NetworkManagementClient(
+            clients.credential, SUBSCRIPTION_ID, base_url=self.endpoint,
+            authentication_policy=SansIOHTTPPolicy())
+        return clients
+
+    def close(self):
+        """
+        Stop serving
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def arm_stub():
+    """
+    Start an ARM stub per test; call it with the resources to serve
+    """
+    stubs = []
+
+    def start(resources=None, only_listed=False):
+        stubs.append(ArmStub(resources, only_listed))
+        return stubs[-1]
+
+    yield start
+    for stub in stubs:
+        stub.close()
@@ -0,0 +1,89 @@
+"""
+Tests for arm_batch.py and the runner's batched reads, against arm_stub_server.py
+"""
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.mgmt.network.models import Subnet, VirtualNetworkPeering
+from azure.mgmt.resource.resources.models import ResourceGroup
+from conftest import SUBSCRIPTION_ID, VNET_ID, read, subnet_reads
+from runner import run_operations
+
+
+def test_batch_answers_models(arm_stub):
+    stub = arm_stub({
+        f"{VNET_ID}/subnets/snet-app": {
+            "id": f"{VNET_ID}/subnets/snet-app",
+            "name": "snet-app",
+            "properties": {"addressPrefix": "10.0.1.0/24"}
+        }
+    })
+    batch = stub.clients().batch
+
+    subnet, peering, group, exists = batch.read([
+        *subnet_reads("snet-app"),
+        read("virtual_network_peerings.get", "rg-lab", "vnet-lab", "peer-hub"),
+        read("resource_groups.get", "rg-lab", client_type="resource"),
+        read("resource_groups.check_existence", "rg-lab", client_type="resource")
+    ])
+
+    assert isinstance(subnet, Subnet) and subnet.address_prefix == "10.0.1.0/24"
+    assert isinstance(peering, VirtualNetworkPeering) and peering.name == "peer-hub"
+    assert isinstance(group, ResourceGroup) and group.name == "rg-lab"
+    assert exists is True
+    assert stub.state.stats["batches"] == 1 and stub.state.stats["single_requests"] == 0
+
+
+def test_batch_splits_at_the_limit(arm_stub):
+    stub = arm_stub()
+    batch = stub.clients().batch
+
+    results = batch.read(subnet_reads(*(f"snet-{number}" for number in range(45))))
+
+    assert [result.name for result in results] == [f"snet-{number}" for number in range(45)]
+    assert stub.state.stats["batches"] == 3
+
+
+def test_batch_answers_errors_per_read(arm_stub):
+    stub = arm_stub({f"{VNET_ID}/subnets/snet-app": {"name": "snet-app"}}, only_listed=True)
+    batch = stub.clients().batch
+
+    found, missing, exists = batch.read([
+        *subnet_reads("snet-app", "snet-missing"),
+        read("resource_groups.check_existence", "rg-missing", client_type="resource")
+    ])
+
+    assert found.name == "snet-app"
+    assert isinstance(missing, ResourceNotFoundError) and missing.status_code == 404
+    assert exists is False
+
+
+def test_runner_batches_ready_reads(arm_stub):
+    stub = arm_stub()
+
+    results = run_operations(subnet_reads("snet-a", "snet-b", "snet-c"), 4, stub.clients())
+
+    assert results == [{"name": name, "status": "success"} for name in ("snet-a", "snet-b", "snet-c")]
+    assert stub.state.stats["batches"] == 1 and stub.state.stats["single_requests"] == 0
+
+
+def test_runner_sends_failed_batch_reads_on_their_own(arm_stub):
+    stub = arm_stub({f"{VNET_ID}/subnets/snet-a": {"name": "snet-a"}}, only_listed=True)
+
+    results = run_operations(subnet_reads("snet-a", "snet-missing"), 4, stub.clients())
+
+    assert results[0] == {"name": "snet-a", "status": "success"}
+    assert results[1]["status"] == "failed" and "ResourceNotFound" in results[1]["reason"]
+    assert stub.state.stats["batches"] == 1 and stub.state.stats["single_requests"] == 1
+
+
+def test_runner_falls_back_when_the_whole_batch_fails(arm_stub, capsys):
+    stub = arm_stub()
+    unreachable = arm_stub()
+    unreachable.close()
+    clients = stub.clients(batch_endpoint=unreachable.endpoint)
+
+    results = run_operations(subnet_reads("snet-a", "snet-b"), 4, clients)
+
+    assert results == [{"name": name, "status": "success"} for name in ("snet-a", "snet-b")]
+    assert stub.state.stats["single_requests"] == 2
+    assert "Batched reads failed, reading one at a time" in capsys.readouterr().out
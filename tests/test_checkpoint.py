@@ -0,0 +1,121 @@
+"""
+Tests for checkpoint.py: what a resumed run skips, reattaches and runs again
+"""
+
+import os
+import pytest
+from checkpoint import Checkpoint
+from runner import execute_operations
+from conftest import VNET_ID, subnet_reads
+
+
+class Poller:
+    """
+    The part of an SDK poller the checkpoint stores
+    """
+
+    def __init__(self, token):
+        self.token = token
+
+    def continuation_token(self):
+        return self.token
+
+
+def write(name):
+    """
+    Build a subnet write as the scripts queue it
+    """
+    return {
+        "client_type": "network",
+        "subscription_id": "sub",
+        "method": "subnets.begin_create_or_update",
+        "args": ["rg-lab", "vnet-lab", name, {"address_prefix": "10.0.1.0/24"}],
+        "fields": {"subnet_name": name},
+        "success": lambda result: {"subnet_name": result.name, "status": "success"}
+    }
+
+
+def test_file_is_created_on_first_record(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    checkpoint = Checkpoint(path, "run-1", script="create_subnet.py")
+
+    checkpoint.planned(checkpoint.prepare([{"result": {"status": "failed"}}]))
+    assert not os.path.exists(path)
+
+    checkpoint.planned(checkpoint.prepare([write("snet-app")]))
+    assert os.path.exists(path)
+
+
+def test_resume_skips_reattaches_and_reruns(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    operations = [write("snet-a"), write("snet-b"), write("snet-c"), write("snet-d")]
+    first = Checkpoint(path, "run-1", script="create_subnet.py")
+    prepared = first.prepare(operations)
+    first.planned(prepared)
+    first.finished(prepared[0], {"subnet_name": "snet-a", "status": "success"})
+    first.submitted(prepared[1], prepared[1], Poller("token-b"))
+    first.finished(prepared[3], {"subnet_name": "snet-d", "status": "failed"})
+
+    resumed = Checkpoint(path, "run-2", script="create_subnet.py", resume="run-1")
+    skipped, reattached, pending, failed = resumed.prepare(operations)
+
+    assert skipped["result"] == {
+        "resumed_from": "run-1", "subnet_name": "snet-a", "status": "success"}
+    assert reattached["kwargs"] == {"continuation_token": "token-b"}
+    assert "kwargs" not in pending and "result" not in pending
+    assert "kwargs" not in failed and "result" not in failed
+    assert [operation["checkpoint"] for operation in (reattached, pending, failed)] == [
+        "subnets.begin_create_or_update/rg-lab/vnet-lab/snet-b",
+        "subnets.begin_create_or_update/rg-lab/vnet-lab/snet-c",
+        "subnets.begin_create_or_update/rg-lab/vnet-lab/snet-d"]
+
+
+def test_reattach_reaches_the_step_in_flight(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    read = {**write("snet-a"), "method": "subnets.get", "args": ["rg-lab", "vnet-lab", "snet-a"],
+            "then": lambda subnet: write("snet-a")}
+    first = Checkpoint(path, "run-1", script="update_subnet.py")
+    prepared = first.prepare([read])
+    first.submitted(prepared[0], write("snet-a"), Poller("token-a"))
+
+    (resumed,) = Checkpoint(path, "run-2", script="update_subnet.py", resume="run-1").prepare([read])
+
+    # The read runs again; the write it leads to picks up the LRO in flight
+    assert "kwargs" not in resumed
+    assert resumed["then"](None)["kwargs"] == {"continuation_token": "token-a"}
+
+
+def test_resume_checks_the_run(tmp_path):
+    path = str(tmp_path / "checkpoint.db")
+    with pytest.raises(Exception, match="Run not found"):
+        Checkpoint(path, "run-2", resume="run-1")
+    assert not os.path.exists(path)
+
+    first = Checkpoint(path, "run-1", script="create_subnet.py")
+    first.planned(first.prepare([write("snet-a")]))
+    with pytest.raises(Exception, match="Run not found"):
+        Checkpoint(path, "run-2", script="create_subnet.py", resume="run-0")
+    with pytest.raises(Exception, match="was started by create_subnet.py, not create_nsg.py"):
+        Checkpoint(path, "run-2", script="create_nsg.py", resume="run-1")
+
+
+def test_resumed_run_only_reads_what_did_not_succeed(tmp_path, arm_stub):
+    path = str(tmp_path / "checkpoint.db")
+    stub = arm_stub({f"{VNET_ID}/subnets/snet-a": {"name": "snet-a"}}, only_listed=True)
+    operations = subnet_reads("snet-a", "snet-b")
+
+    first = execute_operations(
+        operations, 2, stub.clients(), checkpoint=Checkpoint(path, "run-1", script="t.py"))
+    assert [result["status"] for result in first] == ["success", "failed"]
+
+    stub.state.resources[f"{VNET_ID}/subnets/snet-b".lower()] = {"name": "snet-b"}
+    reads = stub.state.stats["batched_requests"] + stub.state.stats["single_requests"]
+    resumed = execute_operations(
+        operations, 2, stub.clients(),
+        checkpoint=Checkpoint(path, "run-2", script="t.py", resume="run-1"))
+
+    assert resumed == [
+        {"resumed_from": "run-1", "name": "snet-a", "status": "success"},
+        {"name": "snet-b", "status": "success"}]
+    assert stub.state.stats["batched_requests"] + stub.state.stats["single_requests"] \
+        == reads + 1
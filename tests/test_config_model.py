@@ -0,0 +1,73 @@
+"""
+Tests for config_model.py: cross-references resolved across resource groups
+"""
+
+import pytest
+from config_model import LabConfig, network_id
+
+CONFIG = {
+    "resource_groups": [
+        {"resource_group": "rg-hub", "subscription_id": "sub-hub", "location": "eastus"},
+        {"resource_group": "rg-edge", "subscription_id": "sub-edge", "location": "eastus"}
+    ],
+    "vnets": [{"vnet_name": "vnet-hub", "resource_group": "rg-hub", "subnets": []}],
+    "public_ips": [{"name": "pip-vgw", "resource_group": "rg-hub"}],
+    "local_network_gateways": [{"name": "lgw-home", "resource_group": "rg-edge"}],
+    "vpn_gateways": [{
+        "name": "vgw-hub",
+        "resource_group": "rg-hub",
+        "vnet_name": "vnet-hub",
+        "public_ip_name": "pip-vgw",
+        "connections": [{"name": "con-home", "local_gateway_name": "lgw-home"}]
+    }]
+}
+
+
+def config_with(**sections):
+    """
+    Build the lab config with some sections replaced
+    """
+    return LabConfig({**CONFIG, **sections})
+
+
+def test_local_gateway_in_another_resource_group():
+    config = config_with()
+
+    assert config.check_references() == []
+    assert config.local_gateway("rg-hub", "lgw-home")["resource_group"] == "rg-edge"
+    assert config.local_gateway_id("rg-hub", "lgw-home") == network_id(
+        "sub-edge", "rg-edge", "localNetworkGateways", "lgw-home")
+
+
+def test_local_gateway_in_the_connection_group_wins():
+    config = config_with(local_network_gateways=[
+        {"name": "lgw-home", "resource_group": "rg-edge"},
+        {"name": "lgw-home", "resource_group": "rg-hub"}
+    ])
+
+    assert config.check_references() == []
+    assert config.local_gateway("rg-hub", "lgw-home")["resource_group"] == "rg-hub"
+
+
+def test_ambiguous_local_gateway_is_rejected():
+    config = config_with(
+        resource_groups=CONFIG["resource_groups"] + [
+            {"resource_group": "rg-dr", "subscription_id": "sub-edge", "location": "westus"}],
+        local_network_gateways=[
+            {"name": "lgw-home", "resource_group": "rg-edge"},
+            {"name": "lgw-home", "resource_group": "rg-dr"}
+        ])
+
+    assert config.check_references() == [
+        "connection 'con-home': local_network_gateways entry 'lgw-home' is defined in several "
+        "resource groups: rg-edge, rg-dr"]
+
+
+def test_missing_references_are_reported_together():
+    config = config_with(local_network_gateways=[], public_ips=[])
+
+    assert config.check_references() == [
+        "VPN gateway 'vgw-hub': public_ips entry 'pip-vgw' not found in rg-hub",
+        "connection 'con-home': local_network_gateways entry 'lgw-home' not found"]
+    with pytest.raises(Exception, match="VNet not found in input file: vnet-spoke"):
+        config.vnet_id("vnet-spoke")
@@ -0,0 +1,64 @@
+"""
+Tests for etag_store.py: stored bodies come back as SDK models for 304 answers
+"""
+
+from azure.core.exceptions import ResourceNotModifiedError
+from azure.mgmt.network.models import Subnet
+from etag_store import EtagStore, if_match, not_modified
+
+SUBNET_ID = ("/subscriptions/x/resourceGroups/rg-lab/providers/Microsoft.Network/"
+             "virtualNetworks/vnet-lab/subnets/snet-app")
+
+READ = {
+    "client_type": "network",
+    "subscription_id": "x",
+    "method": "subnets.get",
+    "args": ["rg-lab", "vnet-lab", "snet-app"]
+}
+
+
+def live_subnet(etag='W/"3"'):
+    """
+    Build a subnet as ARM returns it
+    """
+    return Subnet({
+        "id": SUBNET_ID,
+        "name": "snet-app",
+        "etag": etag,
+        "properties": {"addressPrefix": "10.0.1.0/24", "provisioningState": "Succeeded"}
+    })
+
+
+def test_body_round_trip_through_file(tmp_path):
+    path = str(tmp_path / "etags.json")
+    etags = EtagStore(path)
+    assert etags.remember(live_subnet()).name == "snet-app"
+    etags.save()
+
+    read = EtagStore(path).conditional_read(READ, SUBNET_ID.upper(), Subnet)
+
+    assert read["kwargs"]["headers"] == {"If-None-Match": 'W/"3"'}
+    assert isinstance(read["not_modified"], Subnet)
+    assert read["not_modified"].address_prefix == "10.0.1.0/24"
+    assert read["not_modified"].as_dict() == live_subnet().as_dict()
+    assert "kwargs" not in READ
+
+
+def test_unknown_resource_reads_unconditionally(tmp_path):
+    etags = EtagStore(str(tmp_path / "etags.json"))
+
+    assert etags.conditional_read(READ, SUBNET_ID, Subnet) is READ
+
+
+def test_write_back_is_conditional_on_read_etag():
+    write = {**READ, "method": "subnets.begin_create_or_update", "kwargs": {"polling": True}}
+
+    conditional = if_match(write, live_subnet('W/"4"'))
+
+    assert conditional["kwargs"] == {"polling": True, "headers": {"If-Match": 'W/"4"'}}
+    assert if_match(write, Subnet(name="new")) is write
+
+
+def test_not_modified_detection():
+    assert not_modified(ResourceNotModifiedError())
+    assert not not_modified(ValueError())
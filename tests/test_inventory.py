@@ -0,0 +1,116 @@
+"""
+Tests for inventory.py: models survive the SQLite round trip and the cache never fails a run
+"""
+
+from azure.mgmt.network.models import Subnet, VirtualNetwork
+from inventory import Inventory
+
+SUBSCRIPTION_ID = "00000000-0000-0000-0000-000000000000"
+VNET_ID = (f"/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/rg-lab/providers/"
+           "Microsoft.Network/virtualNetworks/vnet-lab")
+
+
+def subnet_model(name="snet-app", prefix="10.0.1.0/24"):
+    """
+    Build a subnet as ARM returns it, with read-only fields
+    """
+    return Subnet({
+        "id": f"{VNET_ID}/subnets/{name}",
+        "name": name,
+        "etag": 'W/"1"',
+        "properties": {
+            "addressPrefix": prefix,
+            "provisioningState": "Succeeded",
+            "networkSecurityGroup": {"id": "/subscriptions/x/nsg-app"}
+        }
+    })
+
+
+def get_operation(*args, group="subnets"):
+    """
+    Build the GET operation the runner would look up
+    """
+    return {
+        "client_type": "network",
+        "subscription_id": SUBSCRIPTION_ID,
+        "method": f"{group}.get",
+        "args": list(args)
+    }
+
+
+def test_subnet_round_trip(tmp_path):
+    inventory = Inventory(str(tmp_path / "inventory.db"))
+    inventory.put(SUBSCRIPTION_ID, "subnets", subnet_model())
+
+    cached = inventory.lookup(get_operation("rg-lab", "vnet-lab", "snet-app"))
+
+    assert isinstance(cached, Subnet)
+    assert cached.id == f"{VNET_ID}/subnets/snet-app"
+    assert cached.etag == 'W/"1"'
+    assert cached.address_prefix == "10.0.1.0/24"
+    assert cached.provisioning_state == "Succeeded"
+    assert cached.network_security_group.id == "/subscriptions/x/nsg-app"
+    assert cached.as_dict() == subnet_model().as_dict()
+
+
+def test_cached_model_can_be_modified(tmp_path):
+    inventory = Inventory(str(tmp_path / "inventory.db"))
+    inventory.put(SUBSCRIPTION_ID, "subnets", subnet_model())
+
+    cached = inventory.lookup(get_operation("rg-lab", "vnet-lab", "snet-app"))
+    cached.route_table = {"id": "/subscriptions/x/rt-app"}
+
+    assert cached.as_dict()["properties"]["routeTable"] == {"id": "/subscriptions/x/rt-app"}
+
+
+def test_listing_stores_vnet_subnets(tmp_path):
+    inventory = Inventory(str(tmp_path / "inventory.db"))
+    vnet = VirtualNetwork({
+        "id": VNET_ID,
+        "name": "vnet-lab",
+        "location": "eastus",
+        "properties": {
+            "addressSpace": {"addressPrefixes": ["10.0.0.0/16"]},
+            "subnets": [subnet_model().as_dict(), subnet_model("snet-db", "10.0.2.0/24").as_dict()]
+        }
+    })
+    inventory.put_listing(SUBSCRIPTION_ID, "virtual_networks", [vnet], "rg-lab")
+
+    listed = inventory.listed(SUBSCRIPTION_ID, "virtual_networks", "rg-lab")
+    assert [model.address_space.address_prefixes for model in listed] == [["10.0.0.0/16"]]
+    subnet = inventory.lookup(get_operation("rg-lab", "vnet-lab", "snet-db"))
+    assert subnet.address_prefix == "10.0.2.0/24"
+
+
+def test_subnet_write_drops_cached_vnet(tmp_path):
+    inventory = Inventory(str(tmp_path / "inventory.db"))
+    vnet = VirtualNetwork({"id": VNET_ID, "name": "vnet-lab", "location": "eastus"})
+    inventory.put(SUBSCRIPTION_ID, "virtual_networks", vnet)
+    assert inventory.lookup(get_operation("rg-lab", "vnet-lab", group="virtual_networks"))
+
+    inventory.record(
+        {**get_operation("rg-lab", "vnet-lab", "snet-app"),
+         "method": "subnets.begin_create_or_update"},
+        subnet_model())
+
+    assert inventory.lookup(get_operation("rg-lab", "vnet-lab", group="virtual_networks")) is None
+    assert inventory.lookup(get_operation("rg-lab", "vnet-lab", "snet-app")) is not None
+
+
+def test_stale_entries_are_not_answered(tmp_path):
+    inventory = Inventory(str(tmp_path / "inventory.db"), ttl=-1)
+    inventory.put(SUBSCRIPTION_ID, "subnets", subnet_model())
+
+    assert inventory.lookup(get_operation("rg-lab", "vnet-lab", "snet-app")) is None
+
+
+def test_record_logs_cache_errors(tmp_path, capsys):
+    inventory = Inventory(str(tmp_path / "inventory.db"))
+    inventory.close()
+
+    inventory.record(
+        {**get_operation("rg-lab", "vnet-lab", "snet-app"),
+         "method": "subnets.begin_create_or_update"},
+        subnet_model())
+
+    assert "Inventory not updated" in capsys.readouterr().out
@@ -0,0 +1,89 @@
+"""
+Tests for journal.py: slot order, crash-truncated lines and split entries
+"""
+
+import json
+from journal import Journal, SplitJournal, parse_journal, read_journal
+
+
+def test_results_come_back_in_slot_order(tmp_path):
+    journal = Journal(str(tmp_path / "journal.jsonl"), script="create_vnet.py")
+    first = journal.reserve(3)
+    journal.append({"name": "c", "status": "success"}, first + 2)
+    journal.append({"name": "a", "status": "failed"}, first)
+    journal.append({"name": "b", "status": "success"}, first + 1)
+    journal.append({"name": "d", "status": "success"})
+
+    output = journal.write_output(str(tmp_path / "output.json"))
+
+    assert [result["name"] for result in output] == ["a", "b", "c", "d"]
+    with open(tmp_path / "output.json", encoding="utf-8") as f:
+        assert json.load(f) == output
+    finished = read_journal(journal.path)[-1]
+    assert finished["event"] == "run_finished"
+    assert finished["statuses"] == {"failed": 1, "success": 3}
+
+
+def test_a_slot_journaled_again_keeps_the_latest_result(tmp_path):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    slot = journal.reserve(2)
+    journal.append({"name": "peer-a", "status": "success"}, slot)
+    journal.append({"name": "peer-b", "status": "success"}, slot + 1)
+    journal.append({"name": "peer-a", "peering_state": "Connected", "status": "success"}, slot)
+
+    assert journal.results() == [
+        {"name": "peer-a", "peering_state": "Connected", "status": "success"},
+        {"name": "peer-b", "status": "success"}]
+
+
+def test_runs_sharing_a_file_stay_apart(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    earlier = Journal(path)
+    earlier.append({"name": "old", "status": "success"})
+    earlier.write_output(str(tmp_path / "output.json"))
+
+    journal = Journal(path)
+    journal.append({"name": "new", "status": "success"})
+
+    assert journal.run_id != earlier.run_id
+    assert journal.results() == [{"name": "new", "status": "success"}]
+
+
+def test_line_cut_off_by_a_crash_is_skipped(tmp_path):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    journal.append({"name": "a", "status": "success"}, journal.reserve())
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"event": "result", "run_id": "' + journal.run_id + '", "slot": 1, "res')
+
+    assert journal.results() == [{"name": "a", "status": "success"}]
+    assert [line["event"] for line in parse_journal('{"event": "a"}\n{"ev\n')] == ["a"]
+
+
+def test_result_lines_carry_timing_and_attempts(tmp_path):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    journal.append({"status": "success"}, journal.reserve(), attempts=3, resource_id="/x")
+
+    line = read_journal(journal.path)[-1]
+
+    assert (line["slot"], line["attempts"], line["resource_id"]) == (0, 3, "/x")
+    assert line["duration_seconds"] >= 0 and line["started_at"] <= line["finished_at"]
+
+
+def test_split_journal_writes_each_entry_in_its_slot(tmp_path):
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+    first = journal.reserve(3)
+
+    def split(index, result):
+        # Operation 0 carries the entries of slots 0 and 2, operation 1 the one of slot 1
+        slots = {0: [first, first + 2], 1: [first + 1]}[index]
+        return [(slot, f"/subnet/{slot}", {**result, "slot": slot}) for slot in slots]
+
+    split_journal = SplitJournal(journal, split)
+    offset = split_journal.reserve(2)
+    split_journal.append({"status": "success"}, offset + 1)
+    split_journal.append({"status": "failed"}, offset)
+
+    assert journal.results() == [
+        {"status": "failed", "slot": 0},
+        {"status": "success", "slot": 1},
+        {"status": "failed", "slot": 2}]
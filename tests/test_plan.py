@@ -0,0 +1,103 @@
+"""
+Tests for plan.py: input dicts compared with live SDK models as ARM returns them
+"""
+
+from azure.mgmt.network.models import PublicIPAddress, PublicIPAddressSku, Subnet, VirtualNetwork
+from plan import compare_live, differences, plan_entry, skip_if_unchanged
+
+LIVE_VNET = {
+    "id": "/subscriptions/x/resourceGroups/rg-lab/providers/Microsoft.Network/virtualNetworks/vnet",
+    "name": "vnet",
+    "location": "eastus",
+    "etag": 'W/"7"',
+    "properties": {
+        "provisioningState": "Succeeded",
+        "addressSpace": {"addressPrefixes": ["10.0.0.0/16", "10.1.0.0/16"]},
+        "subnets": [
+            {"name": "snet-app", "properties": {
+                "addressPrefix": "10.0.1.0/24",
+                "networkSecurityGroup": {"id": "/subscriptions/x/nsg-app"}}},
+            {"name": "snet-db", "properties": {"addressPrefix": "10.0.2.0/24"}}
+        ]
+    }
+}
+
+
+def vnet_operation(parameters):
+    """
+    Build the create operation a script would queue for the VNet
+    """
+    return {
+        "client_type": "network",
+        "subscription_id": "x",
+        "method": "virtual_networks.begin_create_or_update",
+        "args": ["rg-lab", "vnet", parameters],
+        "fields": {"vnet_name": "vnet", "resource_group": "rg-lab"},
+        "success": lambda result: {"status": "success"}
+    }
+
+
+def test_identical_vnet_is_unchanged():
+    desired = {
+        "location": "East US",
+        "address_space": {"address_prefixes": ["10.1.0.0/16", "10.0.0.0/16"]},
+        "subnets": [
+            {"name": "snet-db", "address_prefix": "10.0.2.0/24"},
+            {"name": "SNET-APP", "address_prefix": "10.0.1.0/24"}
+        ]
+    }
+
+    entry = compare_live(vnet_operation(desired), VirtualNetwork(LIVE_VNET))
+
+    assert entry["action"] == "unchanged"
+    assert entry["differences"] == []
+
+
+def test_changed_vnet_lists_differences():
+    desired = {
+        "location": "eastus",
+        "address_space": {"address_prefixes": ["10.0.0.0/16"]},
+        "subnets": [
+            {"name": "snet-app", "address_prefix": "10.0.9.0/24"},
+            {"name": "snet-db", "address_prefix": "10.0.2.0/24"}
+        ]
+    }
+
+    entry = compare_live(vnet_operation(desired), VirtualNetwork(LIVE_VNET))
+
+    assert entry["action"] == "update"
+    assert entry["differences"] == [
+        "address_space.address_prefixes", "subnets[snet-app].address_prefix"]
+
+
+def test_unchanged_operation_is_skipped():
+    operation = {**vnet_operation({"location": "eastus"}), "key": "vnet:rg-lab/vnet"}
+    entry = plan_entry(operation, compare_live(operation, VirtualNetwork(LIVE_VNET)))
+
+    assert skip_if_unchanged(operation, entry) == {"key": "vnet:rg-lab/vnet", "result": entry}
+
+
+def test_subnet_references_compare_by_id():
+    subnet = Subnet(LIVE_VNET["properties"]["subnets"][0])
+
+    assert differences({"network_security_group": {"id": "/SUBSCRIPTIONS/X/NSG-APP"}}, subnet) == []
+    assert differences({"route_table": {"id": "/subscriptions/x/rt-app"}}, subnet) == ["route_table"]
+
+
+def test_nested_models_and_enums():
+    live = PublicIPAddress({
+        "location": "eastus",
+        "sku": {"name": "Standard", "tier": "Regional"},
+        "properties": {"publicIPAllocationMethod": "Static", "idleTimeoutInMinutes": 4}
+    })
+    desired = {
+        "location": "eastus",
+        "sku": PublicIPAddressSku(name="Standard"),
+        "public_ip_allocation_method": "static",
+        "idle_timeout_in_minutes": "4"
+    }
+
+    entry = compare_live(
+        {**vnet_operation(desired), "method": "public_ip_addresses.begin_create_or_update"}, live)
+
+    assert entry["action"] == "unchanged"
@@ -0,0 +1,134 @@
+"""
+Tests for polling.py: azure-core must still poll on the adaptive schedule
+
+AdaptiveSchedule replaces LROBasePolling._extract_delay, which azure-core does not
+document, so these tests run a real LRO through the SDK against a local server that
+sends Retry-After: 30 and check that the schedule, not Retry-After, sets every delay.
+"""
+
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from azure.core.pipeline.policies import AsyncHTTPPolicy, SansIOHTTPPolicy
+from azure.core.pipeline.transport import AioHttpTransport, RequestsTransport
+from azure.core.polling.base_polling import LROBasePolling
+from azure.mgmt.network import NetworkManagementClient
+from azure.mgmt.network.aio import NetworkManagementClient as AsyncNetworkManagementClient
+from conftest import StubCredential
+from polling import AdaptiveARMPolling, AsyncAdaptiveARMPolling, polling_fields
+
+# Status requests answered InProgress before the operation succeeds
+IN_PROGRESS_POLLS = 4
+
+PROFILE = (1, 2, 5)
+
+
+class LroHandler(BaseHTTPRequestHandler):
+    """
+    Subnet PUT that finishes after IN_PROGRESS_POLLS status requests, with Retry-After: 30
+    """
+
+    polls = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        for name, value in {"Content-Type": "application/json", "Retry-After": "30",
+                            **(headers or {})}.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def subnet(self):
+        return {"id": self.path.split("?")[0], "name": "snet-app",
+                "properties": {"provisioningState": "Succeeded"}}
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        operation = f"http://{self.headers['Host']}/operations/{len(LroHandler.polls)}"
+        LroHandler.polls[operation.rsplit("/", 1)[-1]] = 0
+        self.reply(201, {**self.subnet(), "properties": {"provisioningState": "Updating"}},
+                   {"Azure-AsyncOperation": operation})
+
+    def do_GET(self):
+        if self.path.startswith("/operations/"):
+            name = self.path.rsplit("/", 1)[-1]
+            LroHandler.polls[name] += 1
+            done = LroHandler.polls[name] > IN_PROGRESS_POLLS
+            self.reply(200, {"status": "Succeeded" if done else "InProgress"})
+        else:
+            self.reply(200, self.subnet())
+
+
+@pytest.fixture
+def lro_endpoint():
+    """
+    Serve LroHandler on a free local port
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LroHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+class NoAuth(AsyncHTTPPolicy):
+    """
+    Async pipeline policy that sends requests without a token
+    """
+
+    async def send(self, request):
+        return await self.next.send(request)
+
+
+def test_extract_delay_is_still_the_polling_hook():
+    # The override only works while azure-core polls through this method
+    assert any("_extract_delay" in vars(base) for base in LROBasePolling.__mro__)
+
+
+def test_sync_lro_polls_on_the_schedule(lro_endpoint, monkeypatch):
+    delays = []
+    monkeypatch.setattr(RequestsTransport, "sleep", lambda self, delay: delays.append(delay))
+    client = NetworkManagementClient(
+        StubCredential(), "sub", base_url=lro_endpoint, authentication_policy=SansIOHTTPPolicy())
+    polling = AdaptiveARMPolling(PROFILE)
+
+    subnet = client.subnets.begin_create_or_update(
+        "rg-lab", "vnet-lab", "snet-app", {"address_prefix": "10.0.1.0/24"},
+        polling=polling).result()
+
+    # The first status request goes out straight away, each later one after a delay
+    assert subnet.provisioning_state == "Succeeded"
+    assert delays == [1, 2, 4, 5]
+    assert polling_fields([polling]) == {"polls": 5, "detection_latency_max_seconds": 5}
+
+
+def test_async_lro_polls_on_the_schedule(lro_endpoint, monkeypatch):
+    delays = []
+
+    async def sleep(self, delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(AioHttpTransport, "sleep", sleep)
+    polling = AsyncAdaptiveARMPolling(PROFILE)
+
+    async def create():
+        async with AsyncNetworkManagementClient(
+                StubCredential(), "sub", base_url=lro_endpoint,
+                authentication_policy=NoAuth()) as client:
+            poller = await client.subnets.begin_create_or_update(
+                "rg-lab", "vnet-lab", "snet-app", {"address_prefix": "10.0.1.0/24"},
+                polling=polling)
+            return await poller.result()
+
+    subnet = asyncio.run(create())
+
+    assert subnet.provisioning_state == "Succeeded"
+    assert delays == [1, 2, 4, 5]
+    assert polling.polls == 5
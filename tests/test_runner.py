@@ -0,0 +1,223 @@
+"""
+Tests for runner.py: dependencies, per-parent serialization and retries
+
+The SDK client is replaced by FakeClient, which answers each call with a result, an
+exception or a poller that is done after a given time, and records when every LRO ran.
+"""
+
+import time
+import threading
+from types import SimpleNamespace
+import pytest
+from arm_batch import BatchResponse
+from azure.core.exceptions import HttpResponseError
+from journal import Journal, read_journal
+from runner import run_operations
+from throttling import MAX_THROTTLE_RETRIES, RateGovernor
+
+# Seconds each fake LRO takes
+LRO_SECONDS = 0.1
+
+
+class Poller:
+    """
+    LRO poller that is done LRO_SECONDS after it was created
+    """
+
+    def __init__(self, value):
+        self.value = value
+        self.started = time.monotonic()
+        self.ends = self.started + LRO_SECONDS
+
+    def done(self):
+        return time.monotonic() >= self.ends
+
+    def wait(self, timeout=None):
+        time.sleep(max(0, min(timeout, self.ends - time.monotonic())))
+
+    def result(self):
+        self.wait(LRO_SECONDS)
+        return self.value
+
+    def continuation_token(self):
+        return "token"
+
+
+class FakeClient:
+    """
+    SDK client double: client.<group>.<method>(*args) calls answer(method, args, attempt)
+    """
+
+    def __init__(self, answer=None):
+        self.answer = answer or (lambda method, args, attempt: None)
+        self.lock = threading.Lock()
+        self.calls = []
+        self.pollers = []
+
+    def __getattr__(self, group):
+        return SimpleNamespace(**{
+            name: self.method(f"{group}.{name}")
+            for name in ("get", "begin_create_or_update", "begin_delete")
+        })
+
+    def method(self, method):
+        def call(*args, **kwargs):
+            with self.lock:
+                self.calls.append((method, args))
+                attempt = self.calls.count((method, args))
+            answer = self.answer(method, args, attempt)
+            if isinstance(answer, Exception):
+                raise answer
+            result = answer or SimpleNamespace(name=args[-2] if len(args) > 2 else args[-1])
+            if not method.split(".")[-1].startswith("begin_"):
+                return result
+            poller = Poller(result)
+            self.pollers.append((args, poller))
+            return poller
+        return call
+
+
+class FakeClients:
+    """
+    The part of ClientRegistry the runner uses, around one FakeClient
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.governor = RateGovernor()
+        self.inventory = None
+        self.batch = None
+
+    def get(self, client_type, subscription_id):
+        return self.client
+
+
+def write(vnet, name, **extra):
+    """
+    Build a subnet write on one VNet
+    """
+    return {
+        "client_type": "network",
+        "subscription_id": "sub",
+        "method": "subnets.begin_create_or_update",
+        "args": ["rg-lab", vnet, name, {"address_prefix": "10.0.0.0/24"}],
+        "fields": {"name": name},
+        "success": lambda result: {"name": result.name, "status": "success"},
+        **extra
+    }
+
+
+def throttled():
+    """
+    Build the exception the SDK raises for a 429 that may be retried at once
+    """
+    return HttpResponseError(response=BatchResponse({
+        "httpStatusCode": 429,
+        "headers": {"Retry-After": "0"},
+        "content": {"error": {"code": "TooManyRequests", "message": "Too many requests"}}
+    }))
+
+
+def run(operations, client, max_parallel=8, **kwargs):
+    """
+    Run the operations on the threaded engine with a FakeClient
+    """
+    return run_operations(operations, max_parallel, FakeClients(client), **kwargs)
+
+
+def test_dependencies_start_after_they_succeed():
+    client = FakeClient()
+    operations = [
+        write("vnet-a", "snet-3", key="c", depends_on=["b"]),
+        write("vnet-b", "snet-1", key="a"),
+        write("vnet-c", "snet-2", key="b", depends_on=["a"])
+    ]
+
+    results = run(operations, client)
+
+    assert [result["name"] for result in results] == ["snet-3", "snet-1", "snet-2"]
+    (_, first), (_, second), (_, third) = client.pollers
+    assert [args[2] for args, _ in client.pollers] == ["snet-1", "snet-2", "snet-3"]
+    assert second.started >= first.ends and third.started >= second.ends
+
+
+def test_failed_dependency_fails_its_dependents():
+    client = FakeClient(lambda method, args, attempt:
+                        ValueError("Quota exceeded") if args[2] == "snet-1" else None)
+    operations = [
+        write("vnet-a", "snet-1", key="a"),
+        write("vnet-a", "snet-2", key="b", depends_on=["a"]),
+        write("vnet-a", "snet-3", key="c", depends_on=["b"]),
+        write("vnet-b", "snet-4")
+    ]
+
+    results = run(operations, client)
+
+    assert (results[0]["status"], results[0]["reason"]) == ("failed", "Quota exceeded")
+    assert results[1]["reason"] == "Dependency failed: a"
+    assert results[2]["reason"] == "Dependency failed: b"
+    assert results[3]["status"] == "success"
+    assert [args[2] for _, args in client.calls] == ["snet-1", "snet-4"]
+
+
+@pytest.mark.parametrize("operations, message", [
+    ([write("vnet-a", "snet-1", depends_on=["missing"])], "Unknown dependency 'missing'"),
+    ([write("vnet-a", "snet-1", key="a", depends_on=["b"]),
+      write("vnet-a", "snet-2", key="b", depends_on=["a"])], "Circular dependency")
+])
+def test_bad_graphs_are_rejected(operations, message):
+    with pytest.raises(Exception, match=message):
+        run(operations, FakeClient())
+
+
+def test_writes_to_one_parent_run_in_turn(capsys):
+    client = FakeClient()
+    operations = [
+        write("vnet-a", name, parent="vnet-a") for name in ("snet-1", "snet-2", "snet-3")
+    ] + [write("vnet-b", name, parent="vnet-b") for name in ("snet-4", "snet-5")]
+
+    results = run(operations, client)
+
+    assert [result["status"] for result in results] == ["success"] * 5
+    by_parent = {}
+    for args, poller in client.pollers:
+        by_parent.setdefault(args[1], []).append(poller)
+    for pollers in by_parent.values():
+        for earlier, later in zip(pollers, pollers[1:]):
+            assert later.started >= earlier.ends
+
+    # Different parents still run side by side
+    assert by_parent["vnet-b"][0].started < by_parent["vnet-a"][0].ends
+    assert "Serialized 3 write(s) on 2 parent resource(s)" in capsys.readouterr().out
+
+
+def test_throttled_operation_is_retried(tmp_path):
+    client = FakeClient(lambda method, args, attempt: throttled() if attempt == 1 else None)
+    journal = Journal(str(tmp_path / "journal.jsonl"))
+
+    results = run([write("vnet-a", "snet-1")], client, journal=journal)
+
+    assert results == [{
+        "name": "snet-1", "status": "success", "polls": 0, "detection_latency_max_seconds": 0}]
+    assert len(client.calls) == 2
+    assert read_journal(journal.path)[-1]["attempts"] == 2
+
+
+def test_throttled_operation_fails_after_the_retries():
+    client = FakeClient(lambda method, args, attempt: throttled())
+
+    (result,) = run([write("vnet-a", "snet-1")], client)
+
+    assert result["status"] == "failed" and "Too many requests" in result["reason"]
+    assert len(client.calls) == MAX_THROTTLE_RETRIES + 1
+
+
+def test_max_parallel_bounds_the_operations_in_flight():
+    client = FakeClient()
+    operations = [write(f"vnet-{number}", "snet-1") for number in range(4)]
+
+    run(operations, client, max_parallel=2)
+
+    starts = sorted(poller.started for _, poller in client.pollers)
+    ends = sorted(poller.ends for _, poller in client.pollers)
+    assert starts[2] >= ends[0]